@@ -1,11 +1,27 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, url_for
 import google.generativeai as genai
 from dotenv import load_dotenv
 import os
 import requests
 from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import simpleSplit
 from reportlab.pdfgen import canvas
 from io import BytesIO
+import re
+import hashlib
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FutureTimeoutError
+from cache_utils import TTLCache, MongoCacheStore, TieredCache, ByteLRUCache
+from mongo_utils import get_db
+from fetch_utils import (HTTP_SESSION, CircuitBreaker, CircuitOpenError, DeadlineExceeded, hedged_fetch,
+                         RequestScheduler, SchedulerBusy, PRIORITY_INTERACTIVE)
+from metrics_utils import timed_stream, timed_stream_async, timed_upstream, track_upstream
+from search_utils import canonical_disease_name, disease_suggestion
+from snapshot_utils import DiseaseSnapshot, DISEASE_SNAPSHOT_FILE
+from nutrient_utils import NUTRIENT_MATCHER
+import job_utils
 
 app = Flask(__name__)
 
@@ -20,97 +36,749 @@ if GEMINI_API_KEY:
 else:
     print("❌ Error: GEMINI_API_KEY is missing. Set it in the .env file.")
 
-# Expanded food recommendations for vitamins
-VITAMIN_FOOD_MAP = {
-    "Vitamin A": ["Carrots", "Spinach", "Sweet potatoes", "Egg yolks", "Liver", "Dairy products"],
-    "Vitamin B1 (Thiamine)": ["Whole grains", "Pork", "Nuts", "Seeds", "Legumes"],
-    "Vitamin B2 (Riboflavin)": ["Milk", "Eggs", "Green leafy vegetables", "Almonds"],
-    "Vitamin B3 (Niacin)": ["Chicken", "Turkey", "Fish", "Peanuts", "Mushrooms"],
-    "Vitamin B5 (Pantothenic Acid)": ["Avocados", "Sunflower seeds", "Eggs", "Dairy products"],
-    "Vitamin B6 (Pyridoxine)": ["Bananas", "Potatoes", "Chicken", "Fish", "Nuts"],
-    "Vitamin B7 (Biotin)": ["Eggs", "Almonds", "Whole grains", "Spinach"],
-    "Vitamin B9 (Folate/Folic Acid)": ["Leafy greens", "Lentils", "Citrus fruits", "Beets"],
-    "Vitamin B12": ["Meat", "Fish", "Dairy products", "Eggs", "Fortified cereals"],
-    "Vitamin C": ["Oranges", "Strawberries", "Bell peppers", "Broccoli", "Kiwi"],
-    "Vitamin D": ["Salmon", "Egg yolks", "Mushrooms", "Fortified milk"],
-    "Vitamin E": ["Almonds", "Sunflower seeds", "Spinach", "Avocado"],
-    "Vitamin K": ["Kale", "Spinach", "Broccoli", "Brussels sprouts"],
-    "Iron": ["Red meat", "Lentils", "Spinach", "Tofu", "Pumpkin seeds"]
-}
-
 # Disease Info API (If you have a structured database/API)
 DISEASE_API_URL = "https://disease.sh/v3/covid-19/all"  # Replace with actual API URL
 
-def get_disease_info(disease_name):
+# Total time budget for a disease lookup, and how long the disease API gets
+# before the Gemini fallback is started in parallel
+DISEASE_LOOKUP_DEADLINE = float(os.getenv("DISEASE_LOOKUP_DEADLINE", "8"))
+DISEASE_API_HEDGE_DELAY = float(os.getenv("DISEASE_API_HEDGE_DELAY", "1.0"))
+
+# Skip an upstream entirely for a cooldown window after repeated failures
+DISEASE_API_BREAKER = CircuitBreaker(
+    "disease_api",
+    failure_threshold=int(os.getenv("DISEASE_API_BREAKER_FAILURES", "3")),
+    cooldown=float(os.getenv("DISEASE_API_BREAKER_COOLDOWN", "30"))
+)
+GEMINI_BREAKER = CircuitBreaker(
+    "gemini",
+    failure_threshold=int(os.getenv("GEMINI_BREAKER_FAILURES", "5")),
+    cooldown=float(os.getenv("GEMINI_BREAKER_COOLDOWN", "30"))
+)
+
+# Every Gemini call waits for a slot here: bounded concurrency, a requests/tokens
+# per-minute budget, interactive work ahead of background work, and a bounded queue
+GEMINI_SCHEDULER = RequestScheduler(
+    "gemini",
+    max_concurrency=int(os.getenv("GEMINI_MAX_CONCURRENCY", "8")),
+    requests_per_minute=int(os.getenv("GEMINI_RPM", "60")),
+    tokens_per_minute=int(os.getenv("GEMINI_TPM", "100000")),
+    max_queue=int(os.getenv("GEMINI_QUEUE_SIZE", "64")),
+    queue_timeout=float(os.getenv("GEMINI_QUEUE_TIMEOUT", "10"))
+)
+GEMINI_EST_OUTPUT_TOKENS = int(os.getenv("GEMINI_EST_OUTPUT_TOKENS", "1024"))
+
+def estimate_gemini_tokens(prompt):
+    # ~4 characters per token for the prompt plus the expected answer size
+    return len(prompt) // 4 + GEMINI_EST_OUTPUT_TOKENS
+
+def busy_message(error):
+    return f"❌ Error: Too many requests right now. Please retry in {error.retry_after} seconds."
+
+@track_upstream("disease_api")
+def fetch_disease_api(disease_name, timeout=5):
+    """
+    Queries the structured disease API. Raises on network errors and non-200 responses.
+    """
+    response = HTTP_SESSION.get(DISEASE_API_URL, params={"query": disease_name}, timeout=timeout)
+    response.raise_for_status()
+    data = response.json()
+    return {
+        "name": data.get("name", "Unknown"),
+        "symptoms": ", ".join(data.get("symptoms", [])),
+        "causes": ", ".join(data.get("causes", [])),
+        "treatment": data.get("treatment", "No data available")
+    }
+
+def get_disease_info(disease_name, deadline=None, hedge_delay=None):
     """
     Fetches disease information from an external API.
-    If the API fails or returns no data, falls back to Google Gemini API.
+    If the API is slow or fails, Google Gemini is queried in parallel and the
+    first good answer wins, all within a single per-request deadline.
+    Queries are mapped to their canonical disease name first.
     """
+    disease_name = canonical_disease_name(disease_name)
+    deadline = DISEASE_LOOKUP_DEADLINE if deadline is None else deadline
+    hedge_delay = DISEASE_API_HEDGE_DELAY if hedge_delay is None else hedge_delay
+
     try:
-        response = requests.get(DISEASE_API_URL, params={"query": disease_name}, timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            return {
-                "name": data.get("name", "Unknown"),
-                "symptoms": ", ".join(data.get("symptoms", [])),
-                "causes": ", ".join(data.get("causes", [])),
-                "treatment": data.get("treatment", "No data available")
-            }
-    except requests.exceptions.RequestException as e:
+        return hedged_fetch(
+            lambda timeout: fetch_disease_api(disease_name, timeout=timeout),
+            lambda timeout: get_medical_info(disease_name),
+            deadline=deadline,
+            hedge_delay=hedge_delay,
+            primary_breaker=DISEASE_API_BREAKER,
+            accept=lambda result: not (isinstance(result, str) and result.startswith("❌"))
+        )
+    except DeadlineExceeded:
+        return "❌ Error: Disease information lookup timed out."
+    except (CircuitOpenError, requests.exceptions.RequestException, ValueError) as e:
         print(f"⚠️ Disease API Error: {e}")
+        return f"❌ Error: Could not retrieve disease information due to an error: {str(e)}"
+
+# Bump when the Gemini prompt changes so stale summaries are not served
+PROMPT_VERSION = 1
+
+# Disease summary cache: in-process LRU/TTL in front of a MongoDB collection
+MEDICAL_INFO_CACHE = TieredCache(
+    TTLCache(
+        maxsize=int(os.getenv("MEDICAL_CACHE_SIZE", "512")),
+        ttl=int(os.getenv("MEDICAL_CACHE_TTL", "3600"))
+    ),
+    MongoCacheStore(
+        lambda: get_db()['disease_info_cache'],
+        ttl=int(os.getenv("MEDICAL_CACHE_STORE_TTL", str(7 * 24 * 3600)))
+    ) if os.getenv("MEDICAL_CACHE_PERSIST", "1") != "0" else None,
+    name="medical_info_cache"
+)
 
-    # If API fails, fall back to Google Gemini AI
-    return get_medical_info(disease_name)
+# Pre-generated summaries for common diseases (see snapshot_utils.py), so the
+# first requests after a deploy don't wait for Gemini
+DISEASE_SNAPSHOT = DiseaseSnapshot(DISEASE_SNAPSHOT_FILE, prompt_version=PROMPT_VERSION)
+# How long a stale snapshot entry is served from memory while it is refreshed
+SNAPSHOT_STALE_TTL = int(os.getenv("SNAPSHOT_STALE_TTL", "300"))
+
+def seed_from_snapshot(key, disease_name):
+    """
+    Copies the snapshot entry for `key` into the in-memory cache when nothing is
+    cached yet. A stale entry is used only when the persistent store has nothing
+    newer either; it is then kept briefly and triggers a background refresh.
+    """
+    if MEDICAL_INFO_CACHE.memory.peek(key) is not None:
+        return
+    entry = DISEASE_SNAPSHOT.get(key)
+    if entry is None:
+        return
+    if entry["fresh"]:
+        MEDICAL_INFO_CACHE.memory.set(key, entry["value"])
+        return
+    # get() also reads the store and copies a hit into memory
+    if MEDICAL_INFO_CACHE.get(key) is not None:
+        return
+    MEDICAL_INFO_CACHE.memory.set(key, entry["value"], ttl=SNAPSHOT_STALE_TTL)
+    job_utils.enqueue("refresh_medical_info", disease_name)
 
-def get_medical_info(disease_name):
+def normalize_disease_name(disease_name):
+    """
+    Lowercases and collapses whitespace so equivalent queries share a cache entry.
+    """
+    return re.sub(r"\s+", " ", (disease_name or "").strip()).lower()
+
+def medical_info_cache_key(disease_name):
+    return f"v{PROMPT_VERSION}:{normalize_disease_name(disease_name)}"
+
+def get_medical_info_cache_stats():
+    return MEDICAL_INFO_CACHE.stats()
+
+DIETARY_HEADER = "\n\n**Dietary Recommendations:**"
+
+def build_medical_prompt(disease_name):
+    return f"Provide a detailed medical summary on {disease_name}. Include causes, symptoms, treatments, and related vitamin deficiencies."
+
+def format_food_suggestions(labels):
+    """
+    Returns the dietary recommendations section for the given nutrient labels,
+    or an empty string if there are none.
+    """
+    food_suggestions = ""
+    for label, foods in NUTRIENT_MATCHER.food_suggestions(labels):
+        food_suggestions += f"\n**Recommended Foods for {label}:** " + ", ".join(foods)
+
+    if food_suggestions:
+        return DIETARY_HEADER + food_suggestions
+    return ""
+
+def get_food_suggestions(text):
+    """
+    Returns the dietary recommendations section for nutrients mentioned in `text`,
+    or an empty string if none are mentioned.
+    """
+    return format_food_suggestions(NUTRIENT_MATCHER.find(text))
+
+def get_medical_info(disease_name, priority=PRIORITY_INTERACTIVE):
     """
     Fetches medical information using Google Gemini API.
+    Successful answers are cached per canonical disease name and prompt version,
+    so "diabetis", "Type 2 Diabetes" and "diabetes " share one entry.
+    Raises SchedulerBusy when the Gemini queue is full.
     """
     if not GEMINI_API_KEY:
         return "❌ Error: Missing Google Gemini API Key."
 
-    prompt = f"Provide a detailed medical summary on {disease_name}. Include causes, symptoms, treatments, and related vitamin deficiencies."
+    disease_name = canonical_disease_name(disease_name)
+    key = medical_info_cache_key(disease_name)
+    seed_from_snapshot(key, disease_name)
 
+    return MEDICAL_INFO_CACHE.get_or_compute(
+        key,
+        lambda: _generate_medical_info(disease_name, priority),
+        should_cache=lambda result: bool(result) and not result.startswith("❌")
+    )
+
+def _generate_medical_info(disease_name, priority=PRIORITY_INTERACTIVE):
+    """
+    Runs the Gemini generation for a disease summary (uncached).
+    """
+    prompt = build_medical_prompt(disease_name)
+
+    # Queue wait and SchedulerBusy are not Gemini latency or errors: time only once a slot is held
+    with GEMINI_SCHEDULER.slot(priority, estimate_gemini_tokens(prompt)):
+        return _call_gemini(prompt)
+
+@track_upstream("gemini", is_error=lambda result: result.startswith("❌"))
+def _call_gemini(prompt):
     try:
         model = genai.GenerativeModel(model_name="gemini-2.0-flash")
-        response = model.generate_content(prompt)
+        response = GEMINI_BREAKER.call(model.generate_content, prompt)
 
         if response and hasattr(response, "text"):
             result = response.text
         else:
             return "❌ Error: Unable to fetch disease details."
 
-        # Check for vitamin mentions and suggest foods
-        food_suggestions = ""
-        for vitamin, foods in VITAMIN_FOOD_MAP.items():
-            if vitamin.lower() in result.lower():
-                food_suggestions += f"\n**Recommended Foods for {vitamin}:** " + ", ".join(foods)
-
         # Append food recommendations if found
-        if food_suggestions:
-            result += "\n\n**Dietary Recommendations:**" + food_suggestions
+        return result + get_food_suggestions(result)
+
+    except Exception as e:
+        print(f"⚠️ Gemini API Error: {e}")
+        return f"❌ Error: Could not retrieve disease information due to an error: {str(e)}"
+
+def cached_medical_info_events(cached):
+    """
+    (event, text) tuples replaying a complete summary: one "chunk", then "diet".
+    """
+    summary, _, diet = cached.partition(DIETARY_HEADER)
+    yield "chunk", summary
+    yield "diet", DIETARY_HEADER + diet if diet else ""
+
+def finished_medical_info_events(result):
+    """
+    Events for a summary another request generated: the answer, or its error.
+    """
+    if result.startswith("❌"):
+        yield "error", result
+    else:
+        yield from cached_medical_info_events(result)
+
+def stream_medical_info(disease_name):
+    """
+    Streams a disease summary as (event, text) tuples: "chunk" events while Gemini
+    generates, then one "diet" event with the dietary recommendations.
+    Errors are reported as a single "error" event. Completed answers are cached.
+    Concurrent misses for one disease share the summary cache's single flight:
+    the first request streams the generation, the others (streamed or not) wait
+    for it and get the finished answer in one chunk.
+    """
+    if not GEMINI_API_KEY:
+        yield "error", "❌ Error: Missing Google Gemini API Key."
+        return
+
+    disease_name = canonical_disease_name(disease_name)
+
+    key = medical_info_cache_key(disease_name)
+    seed_from_snapshot(key, disease_name)
+    while True:
+        cached = MEDICAL_INFO_CACHE.get(key)
+        if cached is not None:
+            yield from cached_medical_info_events(cached)
+            return
+
+        leader, call = MEDICAL_INFO_CACHE.flight.join(key)
+        if leader:
+            # Another leader may have filled the cache since our lookup
+            cached = MEDICAL_INFO_CACHE.memory.peek(key)
+            if cached is None:
+                break
+            MEDICAL_INFO_CACHE.flight.finish(key, call, cached)
+            yield from cached_medical_info_events(cached)
+            return
+        try:
+            result = MEDICAL_INFO_CACHE.flight.wait(call)
+        except SchedulerBusy as e:
+            yield "error", busy_message(e)
+            return
+        except Exception as e:
+            yield "error", f"❌ Error: Could not retrieve disease information due to an error: {str(e)}"
+            return
+        # None: the leading stream's client went away before it finished; retry
+        if result is not None:
+            yield from finished_medical_info_events(result)
+            return
+
+    result = None
+    try:
+        result = yield from _stream_generation(key, disease_name)
+    finally:
+        MEDICAL_INFO_CACHE.flight.finish(key, call, result)
+
+def _stream_generation(key, disease_name):
+    """
+    Streams one Gemini generation and caches it. Returns the complete summary
+    or the error message that was sent.
+    """
+    prompt = build_medical_prompt(disease_name)
+    try:
+        GEMINI_SCHEDULER.acquire(PRIORITY_INTERACTIVE, estimate_gemini_tokens(prompt))
+    except SchedulerBusy as e:
+        yield "error", busy_message(e)
+        return busy_message(e)
+
+    parts = []
+    nutrients = NUTRIENT_MATCHER.scanner()
+    try:
+        if not GEMINI_BREAKER.allow():
+            error = "❌ Error: Disease information service is temporarily unavailable."
+            yield "error", error
+            return error
+
+        model = genai.GenerativeModel(model_name="gemini-2.0-flash")
+        # Times the upstream only: not the client reading each chunk, nor a client that leaves
+        for chunk in timed_stream("gemini_stream", lambda: model.generate_content(prompt, stream=True)):
+            text = getattr(chunk, "text", "")
+            if text:
+                parts.append(text)
+                nutrients.feed(text)
+                yield "chunk", text
+        GEMINI_BREAKER.record_success()
+    except GeneratorExit:
+        # Client went away mid-stream; the upstream itself was healthy
+        GEMINI_BREAKER.record_success()
+        raise
+    except Exception as e:
+        GEMINI_BREAKER.record_failure()
+        print(f"⚠️ Gemini API Error: {e}")
+        error = f"❌ Error: Could not retrieve disease information due to an error: {str(e)}"
+        yield "error", error
+        return error
+    finally:
+        GEMINI_SCHEDULER.release()
+
+    result = "".join(parts)
+    if not result:
+        error = "❌ Error: Unable to fetch disease details."
+        yield "error", error
+        return error
+
+    food_suggestions = format_food_suggestions(nutrients.finish())
+    MEDICAL_INFO_CACHE.set(key, result + food_suggestions)
+    yield "diet", food_suggestions
+    return result + food_suggestions
+
+# In-flight async generations per cache key (async serving mode)
+_async_flights = {}
+
+async def get_medical_info_async(disease_name):
+    """
+    Non-blocking version of get_medical_info for the async serving mode.
+    Shares the summary cache; concurrent misses for one disease await a single generation.
+    """
+    if not GEMINI_API_KEY:
+        return "❌ Error: Missing Google Gemini API Key."
+
+    disease_name = canonical_disease_name(disease_name)
+
+    key = medical_info_cache_key(disease_name)
+    await _seed_from_snapshot_async(key, disease_name)
+    while True:
+        cached = await _cached_medical_info_async(key)
+        if cached is not None:
+            return cached
+
+        task = _async_flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(_load_medical_info_async(key, disease_name))
+            _async_flights[key] = task
+            task.add_done_callback(lambda _: _async_flights.pop(key, None))
+        result = await asyncio.shield(task)
+        # None: a streaming leader's client went away before it finished; retry
+        if result is not None:
+            return result
+
+async def _seed_from_snapshot_async(key, disease_name):
+    # Seeding from a stale snapshot entry first checks the store, a blocking MongoDB read
+    if MEDICAL_INFO_CACHE.memory.peek(key) is None:
+        await asyncio.to_thread(seed_from_snapshot, key, disease_name)
+
+async def _cached_medical_info_async(key):
+    cached = MEDICAL_INFO_CACHE.memory.peek(key)
+    if cached is None:
+        # The persistent tier is a blocking MongoDB read
+        cached = await asyncio.to_thread(MEDICAL_INFO_CACHE.get, key)
+    return cached
 
-        return result
+async def _load_medical_info_async(key, disease_name):
+    result = await _generate_medical_info_async(disease_name)
+    if result and not result.startswith("❌"):
+        await asyncio.to_thread(MEDICAL_INFO_CACHE.set, key, result)
+    return result
 
+async def _generate_medical_info_async(disease_name):
+    prompt = build_medical_prompt(disease_name)
+    await GEMINI_SCHEDULER.acquire_async(PRIORITY_INTERACTIVE, estimate_gemini_tokens(prompt))
+    try:
+        if not GEMINI_BREAKER.allow():
+            return "❌ Error: Disease information service is temporarily unavailable."
+
+        with timed_upstream("gemini"):
+            model = genai.GenerativeModel(model_name="gemini-2.0-flash")
+            response = await model.generate_content_async(prompt)
+        GEMINI_BREAKER.record_success()
     except Exception as e:
+        GEMINI_BREAKER.record_failure()
         print(f"⚠️ Gemini API Error: {e}")
         return f"❌ Error: Could not retrieve disease information due to an error: {str(e)}"
+    finally:
+        GEMINI_SCHEDULER.release()
+
+    if not (response and hasattr(response, "text")):
+        return "❌ Error: Unable to fetch disease details."
+    result = response.text
+    return result + get_food_suggestions(result)
+
+async def stream_medical_info_async(disease_name):
+    """
+    Async version of stream_medical_info, yielding the same (event, text) tuples.
+    Concurrent misses share _async_flights with get_medical_info_async.
+    """
+    if not GEMINI_API_KEY:
+        yield "error", "❌ Error: Missing Google Gemini API Key."
+        return
+
+    disease_name = canonical_disease_name(disease_name)
+
+    key = medical_info_cache_key(disease_name)
+    await _seed_from_snapshot_async(key, disease_name)
+    while True:
+        cached = await _cached_medical_info_async(key)
+        if cached is not None:
+            for event in cached_medical_info_events(cached):
+                yield event
+            return
+
+        flight = _async_flights.get(key)
+        if flight is None:
+            # A leader may have finished while we awaited the cache lookup
+            cached = MEDICAL_INFO_CACHE.memory.peek(key)
+            if cached is None:
+                break
+            for event in cached_medical_info_events(cached):
+                yield event
+            return
+        try:
+            result = await asyncio.shield(flight)
+        except SchedulerBusy as e:
+            yield "error", busy_message(e)
+            return
+        except Exception as e:
+            yield "error", f"❌ Error: Could not retrieve disease information due to an error: {str(e)}"
+            return
+        if result is not None:
+            for event in finished_medical_info_events(result):
+                yield event
+            return
+
+    # Lead the flight: others await this future instead of calling Gemini
+    flight = asyncio.get_running_loop().create_future()
+    _async_flights[key] = flight
+    outcome = {}
+    try:
+        async for event in _stream_generation_async(key, disease_name, outcome):
+            yield event
+    finally:
+        if _async_flights.get(key) is flight:
+            del _async_flights[key]
+        flight.set_result(outcome.get("result"))
+
+async def _stream_generation_async(key, disease_name, outcome):
+    """
+    Async version of _stream_generation; the summary or error message it ends
+    with is stored in outcome["result"].
+    """
+    prompt = build_medical_prompt(disease_name)
+    try:
+        await GEMINI_SCHEDULER.acquire_async(PRIORITY_INTERACTIVE, estimate_gemini_tokens(prompt))
+    except SchedulerBusy as e:
+        outcome["result"] = busy_message(e)
+        yield "error", outcome["result"]
+        return
+
+    parts = []
+    nutrients = NUTRIENT_MATCHER.scanner()
+    try:
+        if not GEMINI_BREAKER.allow():
+            outcome["result"] = "❌ Error: Disease information service is temporarily unavailable."
+            yield "error", outcome["result"]
+            return
+
+        model = genai.GenerativeModel(model_name="gemini-2.0-flash")
+        async for chunk in timed_stream_async("gemini_stream", lambda: model.generate_content_async(prompt, stream=True)):
+            text = getattr(chunk, "text", "")
+            if text:
+                parts.append(text)
+                nutrients.feed(text)
+                yield "chunk", text
+        GEMINI_BREAKER.record_success()
+    except GeneratorExit:
+        GEMINI_BREAKER.record_success()
+        raise
+    except Exception as e:
+        GEMINI_BREAKER.record_failure()
+        print(f"⚠️ Gemini API Error: {e}")
+        outcome["result"] = f"❌ Error: Could not retrieve disease information due to an error: {str(e)}"
+        yield "error", outcome["result"]
+        return
+    finally:
+        GEMINI_SCHEDULER.release()
+
+    result = "".join(parts)
+    if not result:
+        outcome["result"] = "❌ Error: Unable to fetch disease details."
+        yield "error", outcome["result"]
+        return
+
+    food_suggestions = format_food_suggestions(nutrients.finish())
+    await asyncio.to_thread(MEDICAL_INFO_CACHE.set, key, result + food_suggestions)
+    outcome["result"] = result + food_suggestions
+    yield "diet", food_suggestions
+
+# Batch lookups: at most BATCH_MAX_DISEASES distinct diseases per request, each
+# request resolving BATCH_CONCURRENCY of them at a time on a shared pool
+BATCH_MAX_DISEASES = int(os.getenv("BATCH_MAX_DISEASES", "10"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+_batch_executor = ThreadPoolExecutor(max_workers=int(os.getenv("BATCH_WORKERS", "16")), thread_name_prefix="batch")
+
+def split_disease_list(values):
+    """
+    Flattens strings (comma-separated, like the profile's `diseases` field) and
+    lists of strings into one list of stripped, non-empty names.
+    """
+    names = []
+    for value in values:
+        if isinstance(value, (list, tuple)):
+            names.extend(split_disease_list(value))
+        elif isinstance(value, str):
+            names.extend(name.strip() for name in value.split(",") if name.strip())
+    return names
+
+def normalize_disease_batch(queries):
+    """
+    Groups queries by canonical disease name, so "diabetis" and "Diabetes" are
+    looked up once. Returns [(canonical, [queries])] in first-seen order.
+    """
+    groups = {}
+    for query in queries:
+        groups.setdefault(canonical_disease_name(query), []).append(query)
+    return list(groups.items())
+
+def prepare_disease_batch(values):
+    """
+    split_disease_list + normalize_disease_batch, with the request limits.
+    Raises ValueError with a user-facing message.
+    """
+    groups = normalize_disease_batch(split_disease_list(values))
+    if not groups:
+        raise ValueError("No disease names provided")
+    if len(groups) > BATCH_MAX_DISEASES:
+        raise ValueError(f"At most {BATCH_MAX_DISEASES} diseases per request")
+    return groups
+
+def batch_summary(entries):
+    succeeded = sum(1 for entry in entries if entry["success"])
+    return {"requested": len(entries), "succeeded": succeeded, "failed": len(entries) - succeeded}
+
+def batch_entry(disease, queries, result=None, error=None, retry_after=None):
+    """
+    One disease's outcome in a batch: {"disease", "queries", "success"} plus
+    "result" or "error" (and "retry_after" when Gemini was too busy, and
+    "did_you_mean" when the name was not recognised but resembles a known one).
+    """
+    if error is None and (not result or result.startswith("❌")):
+        error = result or "❌ Error: Unable to fetch disease details."
+    entry = {"disease": disease, "queries": queries, "success": error is None}
+    if error is None:
+        entry["result"] = result
+    else:
+        entry["error"] = error
+    if retry_after is not None:
+        entry["retry_after"] = retry_after
+    suggestion = disease_suggestion(disease)
+    if suggestion:
+        entry["did_you_mean"] = suggestion
+    return entry
+
+def _lookup_batch_item(disease, queries):
+    try:
+        return batch_entry(disease, queries, get_medical_info(disease))
+    except SchedulerBusy as e:
+        return batch_entry(disease, queries, error=busy_message(e), retry_after=e.retry_after)
+    except Exception as e:
+        print(f"⚠️ Batch lookup for {disease} failed: {e}")
+        return batch_entry(disease, queries, error=f"❌ Error: Could not retrieve disease information due to an error: {str(e)}")
+
+def iter_medical_info_batch(groups, concurrency=None):
+    """
+    Resolves [(disease, queries)] with at most `concurrency` lookups in flight,
+    yielding each batch_entry as soon as it completes. A failed lookup yields
+    an error entry; it never fails the batch.
+    """
+    concurrency = max(1, concurrency or BATCH_CONCURRENCY)
+    items = iter(groups)
+    pending = set()
+
+    def submit_next():
+        item = next(items, None)
+        if item is not None:
+            pending.add(_batch_executor.submit(contextvars.copy_context().run, _lookup_batch_item, *item))
+
+    for _ in range(concurrency):
+        submit_next()
+    try:
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                submit_next()
+                yield future.result()
+    finally:
+        # Client went away: don't start lookups nobody will read
+        for future in pending:
+            future.cancel()
+
+async def iter_medical_info_batch_async(groups, concurrency=None):
+    """
+    Async version of iter_medical_info_batch for the async serving mode.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency or BATCH_CONCURRENCY))
+
+    async def lookup(disease, queries):
+        async with semaphore:
+            try:
+                return batch_entry(disease, queries, await get_medical_info_async(disease))
+            except SchedulerBusy as e:
+                return batch_entry(disease, queries, error=busy_message(e), retry_after=e.retry_after)
+            except Exception as e:
+                print(f"⚠️ Batch lookup for {disease} failed: {e}")
+                return batch_entry(disease, queries, error=f"❌ Error: Could not retrieve disease information due to an error: {str(e)}")
+
+    tasks = [asyncio.ensure_future(lookup(disease, queries)) for disease, queries in groups]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+# Rendered PDFs keyed by content hash, and a small pool so rendering
+# never runs on (or piles up) request threads
+PDF_CACHE = ByteLRUCache(max_bytes=int(os.getenv("PDF_CACHE_BYTES", str(32 * 1024 * 1024))))
+# How long a request waits for a render, and the Retry-After it gets when that runs out
+# A request waits this long for a render before it is answered 503 + Retry-After
+# while the render carries on, so slow renders never tie up a request thread
+PDF_RENDER_WAIT = float(os.getenv("PDF_RENDER_WAIT", "0.5"))
+PDF_RETRY_AFTER = int(os.getenv("PDF_RETRY_AFTER", "2"))
+_pdf_executor = ThreadPoolExecutor(max_workers=int(os.getenv("PDF_WORKERS", "2")), thread_name_prefix="pdf")
+# In-progress renders by content hash, shared by concurrent requests and retries
+_pdf_renders = {}
+_pdf_lock = threading.Lock()
 
-def generate_pdf(content, filename="disease_info.pdf"):
+class PdfRenderTimeout(Exception):
     """
-    Generates a PDF with the provided content.
+    Raised when a PDF is not ready within PDF_RENDER_WAIT. The render keeps
+    going and lands in PDF_CACHE, so retrying after `retry_after` seconds
+    usually gets it straight from the cache.
+    """
+
+    def __init__(self, retry_after):
+        super().__init__(f"PDF not rendered within {PDF_RENDER_WAIT:g}s")
+        self.retry_after = retry_after
+
+def pdf_render_timeout(error):
+    # The PDF is still rendering: ask the client to come back rather than failing
+    response = jsonify({"error": "The PDF is still being generated. Please try again shortly.", "retry_after": error.retry_after})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
+
+app.register_error_handler(PdfRenderTimeout, pdf_render_timeout)
+
+PDF_FONT = "Helvetica"
+PDF_TITLE_FONT = "Helvetica-Bold"
+PDF_FONT_SIZE = 11
+PDF_LINE_HEIGHT = 14
+PDF_MARGIN = 72
+
+def format_pdf_content(content):
+    """
+    Turns a disease info dict or a plain summary string into text for the PDF.
+    """
+    if isinstance(content, dict):
+        return "\n\n".join(f"{key.capitalize()}: {value}" for key, value in content.items())
+    # Drop markdown emphasis from Gemini answers
+    return str(content).replace("**", "")
+
+def render_pdf(content, title="Disease Information"):
+    """
+    Renders content into PDF bytes, wrapping long lines and adding pages as needed.
     """
     buffer = BytesIO()
     c = canvas.Canvas(buffer, pagesize=letter)
     width, height = letter
-    c.drawString(72, height - 72, "Disease Information")
-    c.drawString(72, height - 108, content)
+    text_width = width - 2 * PDF_MARGIN
+
+    c.setFont(PDF_TITLE_FONT, 16)
+    c.drawString(PDF_MARGIN, height - PDF_MARGIN, title)
+    y = height - PDF_MARGIN - 36
+    c.setFont(PDF_FONT, PDF_FONT_SIZE)
+
+    for paragraph in format_pdf_content(content).split("\n"):
+        lines = simpleSplit(paragraph, PDF_FONT, PDF_FONT_SIZE, text_width) or [""]
+        for line in lines:
+            if y < PDF_MARGIN:
+                c.showPage()
+                c.setFont(PDF_FONT, PDF_FONT_SIZE)
+                y = height - PDF_MARGIN
+            c.drawString(PDF_MARGIN, y, line)
+            y -= PDF_LINE_HEIGHT
+
     c.save()
-    buffer.seek(0)
-    with open(filename, "wb") as f:
-        f.write(buffer.read())
-    print(f"PDF generated and saved as {filename}")
-    return filename
+    return buffer.getvalue()
+
+def generate_pdf(content, title="Disease Information", wait=PDF_RENDER_WAIT):
+    """
+    Returns the PDF for the provided content as bytes. Identical content is
+    rendered once and then served from a size-bounded cache.
+    Raises PdfRenderTimeout if the render is not done within `wait` seconds
+    (None waits for it).
+    """
+    key = hashlib.sha256(f"{title}\0{format_pdf_content(content)}".encode("utf-8")).hexdigest()
+    pdf = PDF_CACHE.get(key)
+    if pdf is not None:
+        return pdf
+
+    with _pdf_lock:
+        future = _pdf_renders.get(key)
+        started = future is None
+        if started:
+            future = _pdf_renders[key] = _pdf_executor.submit(render_pdf, content, title)
+    if started:
+        # Outside the lock: the callback runs right away if the render already finished
+        future.add_done_callback(lambda done: _pdf_rendered(key, done))
+
+    try:
+        return future.result(timeout=wait)
+    except FutureTimeoutError:
+        raise PdfRenderTimeout(PDF_RETRY_AFTER)
+
+def _pdf_rendered(key, future):
+    # Cache before forgetting the render, so a request in between finds one or the other
+    if future.exception() is None:
+        PDF_CACHE.set(key, future.result())
+    with _pdf_lock:
+        _pdf_renders.pop(key, None)
+
+def pdf_filename(disease_name):
+    safe = re.sub(r"[^A-Za-z0-9_-]+", "_", disease_name or "disease").strip("_") or "disease"
+    return f"{safe}_info.pdf"
 
 @app.route('/disease_info')
 def disease_info():
@@ -118,18 +786,22 @@ def disease_info():
     disease_info = get_disease_info(disease_query)
     if isinstance(disease_info, str):
         return jsonify({"error": disease_info})
-    pdf_filename = generate_pdf(disease_info, filename=f"{disease_query}_info.pdf")
     return jsonify({
         "name": disease_info["name"],
         "symptoms": disease_info["symptoms"],
         "causes": disease_info["causes"],
         "treatment": disease_info["treatment"],
-        "pdf_filename": pdf_filename
+        "pdf_url": url_for('disease_info_pdf', query=disease_query)
     })
 
-@app.route('/download/<filename>')
-def download(filename):
-    return send_file(filename, as_attachment=True)
+@app.route('/disease_info/pdf')
+def disease_info_pdf():
+    disease_query = request.args.get('query')
+    disease_info = get_disease_info(disease_query)
+    if isinstance(disease_info, str):
+        return jsonify({"error": disease_info}), 502
+    pdf = generate_pdf(disease_info, title=f"Disease Information: {disease_query}")
+    return send_file(BytesIO(pdf), mimetype="application/pdf", as_attachment=True, download_name=pdf_filename(disease_query))
 
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
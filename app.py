@@ -1,14 +1,61 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash
-from mongo_utils import register_user, authenticate_user, get_user_profile, store_appointment, get_user_appointments, delete_appointment, update_user_diseases, update_user_profile, cleanup_duplicates
-from api_utils import get_medical_info, get_disease_info
+# Load .env before the project modules below read their settings at import time
+from dotenv import load_dotenv
+load_dotenv()
+
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash, Response, stream_with_context, send_file, get_template_attribute
+from mongo_utils import (repository, init_db, APPOINTMENT_DUPLICATE, APPOINTMENT_SLOT_FULL, MAX_FREE_SLOTS_DAYS,
+                         USER_VERSION_PROFILE, USER_VERSION_APPOINTMENTS, USER_VERSION_PARTS, decode_appointments_cursor)
+from api_utils import get_medical_info, get_disease_info, stream_medical_info, generate_pdf, pdf_filename, get_medical_info_cache_stats, PDF_CACHE, GEMINI_SCHEDULER, DISEASE_SNAPSHOT
+from api_utils import PdfRenderTimeout, pdf_render_timeout
+from api_utils import prepare_disease_batch, iter_medical_info_batch, batch_summary
+from fetch_utils import SchedulerBusy
+from search_utils import DISEASE_INDEX, suggest_diseases, disease_suggestion
+import metrics_utils
+import asset_utils
+from page_cache_utils import conditional_user_page, cached_fragment, get_fragment_cache_stats
+from job_utils import JOB_QUEUE, enqueue_booking_jobs, enqueue_profile_warmup
 from datetime import datetime, timedelta
 from flask_cors import CORS
 import os
+import io
+import csv
+import json
 
 app = Flask(__name__)
 CORS(app)
 app.secret_key = os.getenv("SECRET_KEY")
 
+# Create MongoDB indexes once at startup
+init_db()
+
+# Request timing, slow-request log and cache stats for /metrics
+metrics_utils.init_app(app)
+metrics_utils.register_stats("medical_info_cache", get_medical_info_cache_stats)
+metrics_utils.register_stats("profile_cache", repository.get_profile_cache_stats)
+metrics_utils.register_stats("pdf_cache", PDF_CACHE.stats)
+metrics_utils.register_stats("gemini_scheduler", GEMINI_SCHEDULER.stats)
+metrics_utils.register_stats("jobs", JOB_QUEUE.stats)
+metrics_utils.register_stats("disease_snapshot", DISEASE_SNAPSHOT.stats)
+
+# Hashed, precompressed static assets (built with `python asset_utils.py`) and template helpers
+asset_utils.init_app(app)
+metrics_utils.register_stats("assets", asset_utils.ASSET_MANIFEST.stats)
+metrics_utils.register_stats("fragment_cache", get_fragment_cache_stats)
+
+@app.errorhandler(SchedulerBusy)
+def scheduler_busy(error):
+    # Gemini queue is full: ask the client to back off instead of queueing forever
+    response = jsonify({"error": "Too many requests right now. Please try again shortly.", "retry_after": error.retry_after})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
+
+app.register_error_handler(PdfRenderTimeout, pdf_render_timeout)
+
+@app.route('/metrics')
+def metrics():
+    return Response(metrics_utils.render_metrics(), mimetype="text/plain; version=0.0.4")
+
 @app.route('/')
 @app.route('/index')
 def index():
@@ -21,8 +68,9 @@ def login():
         username = request.form.get('username')
         password = request.form.get('password')
 
-        if authenticate_user(username, password):
+        if repository.authenticate_user(username, password):
             session['username'] = username
+            enqueue_profile_warmup(username)
             return redirect(url_for('index'))
 
         # Pass an error message to the template
@@ -43,7 +91,7 @@ def signup():
         if not all([name, username, email, phone, password]):
             return jsonify({"status": "error", "message": "All fields are required"}), 400
 
-        if register_user(name, username, email, phone, password, diseases):  # Pass diseases to register_user
+        if repository.register_user(name, username, email, phone, password, diseases):  # Pass diseases to register_user
             session['username'] = username
             return redirect(url_for('index'))
 
@@ -51,15 +99,41 @@ def signup():
 
     return render_template('signup.html')
 
+APPOINTMENT_TABLES_TEMPLATE = 'appointments_tables.html'
+PROFILE_TEMPLATES = ('profile.html', APPOINTMENT_TABLES_TEMPLATE)
+
+def render_appointment_tables(page):
+    """
+    Renders the profile page's appointment tables (full list and modal) for one page.
+    """
+    return {
+        "list": get_template_attribute(APPOINTMENT_TABLES_TEMPLATE, 'list_table')(page['appointments'], page['next_cursor']),
+        "modal": get_template_attribute(APPOINTMENT_TABLES_TEMPLATE, 'modal_table')(page['appointments']),
+    }
+
 @app.route('/profile')
 def profile():
     if 'username' not in session:
         return redirect(url_for('login'))
 
-    user = get_user_profile(session['username'])
-    appointments = get_user_appointments(session['username'])
-    print(appointments)  # Debug statement to check the appointments data
-    return render_template('profile.html', user=user, appointments=appointments)
+    username = session['username']
+    version = repository.get_user_version(username)
+
+    def render():
+        user = None
+
+        def render_tables():
+            nonlocal user
+            user, page = repository.get_profile_and_appointments(username, version=version)
+            return render_appointment_tables(page)
+
+        # The tables only change when the appointments version does
+        tables = cached_fragment("appointment_tables", (username, version[USER_VERSION_APPOINTMENTS]), render_tables)
+        if user is None:
+            user = repository.get_user_profile(username, version)
+        return render_template('profile.html', user=user, appointment_tables=tables)
+
+    return conditional_user_page(username, version, USER_VERSION_PARTS, render, templates=PROFILE_TEMPLATES)
 
 @app.route('/logout')
 def logout():
@@ -68,30 +142,81 @@ def logout():
 
 @app.route('/profile_data')
 def profile_data():
-    user = get_user_profile(session['username'])
-    return render_template('profile_data.html', user=user)
+    username = session['username']
+    version = repository.get_user_version(username)
+    return conditional_user_page(
+        username, version, (USER_VERSION_PROFILE,),
+        lambda: render_template('profile_data.html', user=repository.get_user_profile(username, version))
+    )
 
 @app.route('/update_data', methods=['GET', 'POST'])
 def update_data():
     if request.method == 'POST':
         new_diseases = request.form.get('diseases', '')
-        if update_user_diseases(session['username'], new_diseases):
+        if repository.update_user_diseases(session['username'], new_diseases):
             flash("Profile updated successfully!", "success")
             return redirect(url_for('profile_data'))
-    user = get_user_profile(session['username'])
+    user = repository.get_user_profile(session['username'])
     return render_template('update_data.html', user=user)
 
 @app.route('/appointments_data')
 def appointments_data():
-    appointments = get_user_appointments(session['username'])
-    return render_template('appointments_data.html', appointments=appointments)
+    username = session['username']
+    version = repository.get_user_version(username)
+    cursor = request.args.get('cursor')
+    try:
+        # Reject a malformed cursor before it could be answered with a 304
+        if cursor:
+            decode_appointments_cursor(cursor)
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid cursor"}), 400
+
+    def render():
+        page = repository.get_user_appointments_page(username, cursor=cursor)
+        return render_template('appointments_data.html', appointments=page['appointments'], next_cursor=page['next_cursor'])
+
+    return conditional_user_page(username, version, (USER_VERSION_APPOINTMENTS,), render)
+
+@app.route('/appointments_page')
+def appointments_page():
+    """
+    JSON page of the user's appointments for "Load more" on the profile page.
+    """
+    if 'username' not in session:
+        return jsonify({"success": False, "message": "Unauthorized"}), 401
+
+    limit = request.args.get('limit', type=int)
+    if limit is not None and limit < 1:
+        return jsonify({"success": False, "message": "Invalid limit"}), 400
+
+    try:
+        page = repository.get_user_appointments_page(
+            session['username'],
+            cursor=request.args.get('cursor'),
+            page_size=limit
+        )
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid cursor"}), 400
+
+    appointments = [{
+        "id": str(appt['_id']),
+        "sno": appt['sno'],
+        "name": appt.get('name', ''),
+        "email": appt.get('email', ''),
+        "disease": appt.get('disease', ''),
+        "clinic": appt.get('clinic', ''),
+        "date": str(appt.get('date', '')),
+        "time": appt.get('time', ''),
+        "status": appt.get('status', '')
+    } for appt in page['appointments']]
+    return jsonify({"success": True, "appointments": appointments, "next_cursor": page['next_cursor']})
 
 @app.route('/delete_appointment/<string:appointment_id>', methods=['DELETE'])
 def delete_appointment_route(appointment_id):
     if 'username' not in session:
         return jsonify({"success": False, "message": "Unauthorized"}), 401
 
-    if delete_appointment(session['username'], appointment_id):
+    if repository.delete_appointment(session['username'], appointment_id):
         return jsonify({"success": True, "message": "Appointment deleted successfully!"})
     else:
         return jsonify({"success": False, "message": "Failed to delete appointment."})
@@ -103,7 +228,7 @@ def edit_diseases():
 
     new_diseases = request.form.get('diseases', '')
 
-    if update_user_diseases(session['username'], new_diseases):
+    if repository.update_user_diseases(session['username'], new_diseases):
         flash("Diseases updated successfully!", "success")
         return redirect(url_for('profile'))
 
@@ -115,11 +240,11 @@ def delete_disease():
         return jsonify({"success": False, "message": "Unauthorized"}), 401
 
     disease_to_delete = request.form.get('disease', '').strip()
-    user = get_user_profile(session['username'])
+    user = repository.get_user_profile(session['username'])
     if user:
         current_diseases = user['diseases'].split(',')
         new_diseases = ','.join([d for d in current_diseases if d.strip() != disease_to_delete.strip()])
-        if update_user_diseases(session['username'], new_diseases):
+        if repository.update_user_diseases(session['username'], new_diseases):
             flash("Disease deleted successfully!", "success")
             return redirect(url_for('profile'))
 
@@ -143,8 +268,79 @@ def get_disease_info_api():
     if not disease_name:
         return jsonify({"error": "No disease name provided"}), 400
     
+    if wants_stream():
+        return stream_disease_info(disease_name)
+
+    body = {"result": get_medical_info(disease_name)}
+    suggestion = disease_suggestion(disease_name)
+    if suggestion:
+        body["did_you_mean"] = suggestion
+    return jsonify(body)
+
+@app.route('/get_disease_info_batch', methods=['GET', 'POST'])
+def get_disease_info_batch():
+    """
+    Looks up several diseases at once. Accepts `diseases` as a JSON list (or
+    {"diseases": [...]}), repeated or comma-separated parameters, and/or
+    `profile=1` for the diseases on the logged-in user's profile.
+    Streams one "result" event per disease as it completes when asked for SSE,
+    otherwise returns all results in request order.
+    """
+    payload = request.get_json(silent=True)
+    if isinstance(payload, dict):
+        values = [payload.get('diseases') or []]
+    elif payload is not None:
+        values = [payload]
+    else:
+        values = request.values.getlist('diseases')
+
+    if request.values.get('profile') in ('1', 'true'):
+        if 'username' not in session:
+            return jsonify({"error": "Unauthorized"}), 401
+        profile = repository.get_user_profile(session['username']) or {}
+        values.append(profile.get('diseases', ''))
+
+    try:
+        groups = prepare_disease_batch(values)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if wants_stream():
+        return stream_disease_batch(groups)
+
+    order = {disease: index for index, (disease, _) in enumerate(groups)}
+    entries = sorted(iter_medical_info_batch(groups), key=lambda entry: order[entry['disease']])
+    return jsonify({"results": entries, "summary": batch_summary(entries)})
+
+@app.route('/autocomplete_disease')
+def autocomplete_disease():
+    prefix = request.args.get("q", "").strip()
+    try:
+        limit = min(max(int(request.args.get("limit", 8)), 1), 20)
+    except ValueError:
+        limit = 8
+
+    response = jsonify({
+        "suggestions": suggest_diseases(prefix, limit),
+        "canonical": DISEASE_INDEX.canonical(prefix),
+        "did_you_mean": DISEASE_INDEX.did_you_mean(prefix)
+    })
+    # Suggestions only change with the vocabulary file, so let browsers reuse them
+    response.headers["Cache-Control"] = "public, max-age=300"
+    return response
+
+@app.route('/get_disease_pdf')
+def get_disease_pdf():
+    disease_name = request.args.get("disease", "").strip()
+    if not disease_name:
+        return jsonify({"error": "No disease name provided"}), 400
+
     disease_info = get_medical_info(disease_name)
-    return jsonify({"result": disease_info})
+    if disease_info.startswith("❌"):
+        return jsonify({"error": disease_info}), 502
+
+    pdf = generate_pdf(disease_info, title=f"Disease Information: {disease_name}")
+    return send_file(io.BytesIO(pdf), mimetype="application/pdf", as_attachment=True, download_name=pdf_filename(disease_name))
 
 @app.route('/book_appointment', methods=['POST'])
 def book_appointment():
@@ -165,12 +361,182 @@ def book_appointment():
     except ValueError:
         return jsonify({"success": False, "message": "Invalid date format. Use YYYY-MM-DD."}), 400
 
-    store_appointment(session['username'], name, email, disease, clinic, date_obj, time)
-    
-    # Clean up duplicates after booking
-    cleanup_duplicates()
+    # Duplicate bookings are rejected by the unique appointment index,
+    # overbooking by the clinic's slot counter
+    status, appointment_id = repository.store_appointment(session['username'], name, email, disease, clinic, date_obj, time)
+    if status == APPOINTMENT_DUPLICATE:
+        return jsonify({"success": False, "message": "Appointment already booked for this date and time."}), 409
+    if status == APPOINTMENT_SLOT_FULL:
+        return jsonify({"success": False, "message": "This time slot is fully booked. Please choose another time."}), 409
 
+    # The booking is stored; confirmation and PDF pre-rendering run in the background
+    enqueue_booking_jobs(appointment_id, session['username'], name, email, disease, clinic, date_obj, time)
     return jsonify({"success": True, "message": "Appointment booked successfully!"})
+
+@app.route('/free_slots')
+def free_slots():
+    clinic = request.args.get('clinic', '').strip()
+    start_str = request.args.get('start', '').strip()
+    end_str = request.args.get('end', '').strip() or start_str
+    if not clinic or not start_str:
+        return jsonify({"success": False, "message": "clinic and start are required"}), 400
+
+    try:
+        start = datetime.strptime(start_str, "%Y-%m-%d")
+        end = datetime.strptime(end_str, "%Y-%m-%d")
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid date format. Use YYYY-MM-DD."}), 400
+    if end < start or (end - start).days >= MAX_FREE_SLOTS_DAYS:
+        return jsonify({"success": False, "message": f"Date range must cover 1 to {MAX_FREE_SLOTS_DAYS} days."}), 400
+
+    return jsonify({"success": True, "clinic": clinic, "slots": repository.get_free_slots(clinic, start, end)})
+
+APPOINTMENT_EXPORT_FIELDS = ['id', 'name', 'email', 'disease', 'clinic', 'date', 'time', 'status', 'created_at']
+BULK_IMPORT_MAX_ROWS = int(os.getenv("BULK_IMPORT_MAX_ROWS", "10000"))
+
+def read_import_rows(request):
+    """
+    Reads appointment rows from a JSON, NDJSON or CSV request body (or an uploaded file).
+    """
+    upload = request.files.get('file')
+    if upload:
+        body = upload.read().decode('utf-8-sig')
+        filename = (upload.filename or '').lower()
+        kind = 'csv' if filename.endswith('.csv') else 'ndjson' if filename.endswith(('.ndjson', '.jsonl')) else 'json'
+    else:
+        body = request.get_data(as_text=True)
+        mimetype = request.mimetype
+        kind = 'csv' if mimetype == 'text/csv' else 'ndjson' if mimetype in ('application/x-ndjson', 'application/jsonl') else 'json'
+
+    if kind == 'csv':
+        return list(csv.DictReader(io.StringIO(body)))
+    if kind == 'ndjson':
+        return [json.loads(line) for line in body.splitlines() if line.strip()]
+    data = json.loads(body or '[]')
+    return data.get('appointments', []) if isinstance(data, dict) else data
+
+def validate_import_rows(rows):
+    """
+    Splits rows into valid appointments and per-row errors. Each distinct date
+    string is parsed once.
+    """
+    parsed_dates = {}
+    valid, positions, errors = [], [], {}
+    required = ['name', 'email', 'disease', 'clinic', 'date', 'time']
+
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors[index] = "Row must be an object"
+            continue
+        values = {field: str(row.get(field) or '').strip() for field in required}
+        missing = [field for field in required if not values[field]]
+        if missing:
+            errors[index] = f"Missing fields: {', '.join(missing)}"
+            continue
+
+        date_str = values['date']
+        if date_str not in parsed_dates:
+            try:
+                parsed_dates[date_str] = datetime.strptime(date_str, "%Y-%m-%d")
+            except ValueError:
+                parsed_dates[date_str] = None
+        if parsed_dates[date_str] is None:
+            errors[index] = "Invalid date format. Use YYYY-MM-DD."
+            continue
+
+        values['date'] = parsed_dates[date_str]
+        valid.append(values)
+        positions.append(index)
+
+    return valid, positions, errors
+
+@app.route('/appointments/import', methods=['POST'])
+def import_appointments():
+    if 'username' not in session:
+        return jsonify({"success": False, "message": "Unauthorized"}), 401
+
+    try:
+        rows = read_import_rows(request)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return jsonify({"success": False, "message": f"Could not parse import: {e}"}), 400
+    if not isinstance(rows, list):
+        return jsonify({"success": False, "message": "Expected a list of appointments"}), 400
+    if len(rows) > BULK_IMPORT_MAX_ROWS:
+        return jsonify({"success": False, "message": f"At most {BULK_IMPORT_MAX_ROWS} rows per import"}), 413
+
+    ordered = request.args.get('ordered', 'false').lower() in ('1', 'true')
+    valid, positions, errors = validate_import_rows(rows)
+    results = [None] * len(rows)
+    for index, message in errors.items():
+        results[index] = {"row": index, "status": "invalid", "message": message}
+
+    if ordered and errors:
+        # Ordered imports stop at the first bad row
+        first_error = min(errors)
+        cut = next((i for i, position in enumerate(positions) if position > first_error), len(positions))
+        for position in positions[cut:]:
+            results[position] = {"row": position, "status": "skipped"}
+        valid, positions = valid[:cut], positions[:cut]
+
+    stored = repository.bulk_store_appointments(session['username'], valid, ordered=ordered)
+    for position, result in zip(positions, stored):
+        results[position] = dict(result, row=position)
+
+    summary = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    return jsonify({"success": not errors and summary.get('error', 0) == 0, "summary": summary, "results": results})
+
+@app.route('/appointments/export')
+def export_appointments():
+    if 'username' not in session:
+        return jsonify({"success": False, "message": "Unauthorized"}), 401
+
+    export_format = request.args.get('format', 'ndjson').lower()
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({"success": False, "message": "Format must be ndjson or csv"}), 400
+
+    cursor = repository.iter_appointments(session['username'], clinic=request.args.get('clinic'))
+
+    def rows():
+        for appt in cursor:
+            yield {
+                'id': str(appt['_id']),
+                'name': appt.get('name', ''),
+                'email': appt.get('email', ''),
+                'disease': appt.get('disease', ''),
+                'clinic': appt.get('clinic', ''),
+                'date': appt['date'].strftime("%Y-%m-%d") if isinstance(appt.get('date'), datetime) else str(appt.get('date', '')),
+                'time': appt.get('time', ''),
+                'status': appt.get('status', ''),
+                'created_at': appt['created_at'].isoformat() if appt.get('created_at') else ''
+            }
+
+    def generate_ndjson():
+        for row in rows():
+            yield json.dumps(row) + "\n"
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=APPOINTMENT_EXPORT_FIELDS)
+        writer.writeheader()
+        for row in rows():
+            writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+        yield buffer.getvalue()
+
+    if export_format == 'csv':
+        generator, mimetype = generate_csv(), 'text/csv'
+    else:
+        generator, mimetype = generate_ndjson(), 'application/x-ndjson'
+    return Response(
+        stream_with_context(generator),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=appointments.{export_format}"}
+    )
+
 @app.route('/edit_profile', methods=['POST'])
 def edit_profile():
     if 'username' not in session:
@@ -192,7 +558,7 @@ def edit_profile():
         update_data['password'] = password  # Make sure to hash the password before storing it
 
     if update_data:
-        if update_user_profile(session['username'], update_data):
+        if repository.update_user_profile(session['username'], update_data):
             flash("Profile updated successfully!", "success")
             return redirect(url_for('profile'))
         else:
@@ -217,19 +583,78 @@ def handle_appointment_booking(request):
     except ValueError:
         return jsonify({"message": "Invalid date format. Use YYYY-MM-DD."}), 400
 
-    store_appointment(session['username'], name, email, disease, clinic, date, time)
+    status, appointment_id = repository.store_appointment(session['username'], name, email, disease, clinic, date, time)
+    if status == APPOINTMENT_DUPLICATE:
+        return jsonify({"message": f"Appointment already booked for {name} on {date_str} at {time}."}), 409
+    if status == APPOINTMENT_SLOT_FULL:
+        return jsonify({"message": f"{clinic} is fully booked on {date_str} at {time}. Please pick another slot."}), 409
 
+    enqueue_booking_jobs(appointment_id, session['username'], name, email, disease, clinic, date, time)
     return jsonify({"message": f"Appointment booked for {name} on {date_str} at {time}."})
 
+def wants_stream():
+    """
+    True when the client asked for Server-Sent Events (?stream=1 or an SSE Accept header).
+    """
+    if request.values.get('stream') in ('1', 'true'):
+        return True
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_disease_info(disease_name):
+    """
+    Forwards the Gemini answer as Server-Sent Events. An unrecognised name is
+    preceded by a "suggestion" event with the closest known disease; the dietary
+    recommendations arrive as a final "diet" event, followed by "done".
+    """
+    def generate():
+        suggestion = disease_suggestion(disease_name)
+        if suggestion:
+            yield sse_event("suggestion", {"disease": suggestion})
+        for event, text in stream_medical_info(disease_name):
+            yield sse_event(event, {"text": text})
+        yield sse_event("done", {})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def stream_disease_batch(groups):
+    """
+    Sends each batch entry as a "result" event as soon as its lookup finishes,
+    then "done" with the summary.
+    """
+    def generate():
+        entries = []
+        for entry in iter_medical_info_batch(groups):
+            entries.append(entry)
+            yield sse_event("result", entry)
+        yield sse_event("done", {"summary": batch_summary(entries)})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 def handle_disease_info(request):
     disease_query = request.form.get('disease_query')
 
     if not disease_query:
         return jsonify({"error": "Please enter a disease name"}), 400
 
+    if wants_stream():
+        return stream_disease_info(disease_query)
+
     try:
         response = get_medical_info(disease_query)
         return jsonify({"response": response})
+    except SchedulerBusy:
+        raise
     except Exception as e:
         return jsonify({"error": f"Failed to fetch disease info: {str(e)}"}), 500
 
@@ -0,0 +1,402 @@
+"""
+Static asset pipeline.
+
+`python asset_utils.py` builds static/dist from static/css, static/js and
+static/images:
+  - every file gets a content-hashed name (styles.3f9a1c2b7d.css)
+  - images are resized to a few widths and encoded as WebP and AVIF, with a
+    re-encoded JPEG/PNG at the largest width as the fallback
+  - text assets get precompressed .gz (and .br when `brotli` is installed) copies
+  - manifest.json maps each source path to its built files
+
+Templates call asset_url() / responsive_image() / image_set(); they fall back
+to the plain /static URL for anything the manifest does not know, so the app
+still works before the first build. Built files are served from /assets with
+`Cache-Control: immutable` for a year: a changed file gets a new name.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import threading
+
+if __name__ == "__main__":
+    # Run as a script: load .env before the settings below are read
+    from dotenv import load_dotenv
+    load_dotenv()
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+ASSET_SOURCE_DIRS = ("css", "js", "images")
+ASSET_DIST_DIR = os.getenv("ASSET_DIST_DIR", os.path.join(STATIC_DIR, "dist"))
+ASSET_MANIFEST_FILE = os.path.join(ASSET_DIST_DIR, "manifest.json")
+ASSET_URL_PATH = "/assets"
+
+ASSET_IMAGE_WIDTHS = tuple(int(w) for w in os.getenv("ASSET_IMAGE_WIDTHS", "480,960,1600").split(","))
+# Hashed files never change, so clients may keep them for a year
+ASSET_MAX_AGE = 365 * 24 * 3600
+# Un-hashed /static files (no build yet) are revalidated with their ETag after this
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", "3600"))
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".svg", ".json", ".txt"}
+# Preferred first: browsers pick the first <source> / image-set() entry they support
+IMAGE_VARIANT_FORMATS = (
+    ("image/avif", "avif", {"quality": 50, "speed": 6}),
+    ("image/webp", "webp", {"quality": 80, "method": 6}),
+)
+JPEG_OPTIONS = {"quality": 82, "optimize": True, "progressive": True}
+
+
+def file_hash(data):
+    return hashlib.sha256(data).hexdigest()[:10]
+
+
+def hashed_name(path, digest, suffix=""):
+    """
+    css/styles.css -> css/styles.<digest>.css (suffix goes before the extension).
+    """
+    root, ext = os.path.splitext(path)
+    return f"{root}.{digest}{suffix}{ext}"
+
+
+def _write(relative, data, output):
+    target = os.path.join(output, relative)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, "wb") as f:
+        f.write(data)
+
+
+def _write_compressed(relative, data, output, brotli):
+    """
+    Writes .gz/.br siblings when they are actually smaller. Returns the encodings written.
+    """
+    encodings = []
+    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(compressed) < len(data):
+        _write(relative + ".gz", compressed, output)
+        encodings.append("gzip")
+    if brotli is not None:
+        compressed = brotli.compress(data, quality=11)
+        if len(compressed) < len(data):
+            _write(relative + ".br", compressed, output)
+            encodings.append("br")
+    return encodings
+
+
+def _encode(image, fmt, options):
+    from io import BytesIO
+
+    buffer = BytesIO()
+    image.save(buffer, format=fmt, **options)
+    return buffer.getvalue()
+
+
+def build_image(path, data, digest, output, widths=ASSET_IMAGE_WIDTHS):
+    """
+    Writes resized AVIF/WebP variants and a fallback in the original format.
+    Returns the manifest entry.
+    """
+    from io import BytesIO
+    from PIL import Image, ImageOps, features
+
+    with Image.open(BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        is_png = source.format == "PNG"
+        if not is_png and image.mode != "RGB":
+            image = image.convert("RGB")
+
+    # Never upscale: widths above the original collapse to the original width
+    targets = sorted({min(width, image.width) for width in widths})
+    variants = {}
+    for mime, fmt, options in IMAGE_VARIANT_FORMATS:
+        if not features.check(fmt):
+            print(f"⚠️ Pillow has no {fmt} support, skipping {fmt} variants")
+            continue
+        variants[mime] = []
+        for width in targets:
+            resized = image if width == image.width else image.resize(
+                (width, round(image.height * width / image.width)), Image.LANCZOS)
+            name = os.path.splitext(hashed_name(path, digest, f".{width}w"))[0] + f".{fmt}"
+            _write(name, _encode(resized, fmt.upper(), options), output)
+            variants[mime].append([width, name])
+
+    largest = targets[-1]
+    fallback = image if largest == image.width else image.resize(
+        (largest, round(image.height * largest / image.width)), Image.LANCZOS)
+    encoded = _encode(fallback, "PNG", {"optimize": True}) if is_png else _encode(fallback, "JPEG", JPEG_OPTIONS)
+    if len(encoded) >= len(data) and largest == image.width:
+        # Re-encoding didn't help: keep the original bytes
+        encoded = data
+    name = hashed_name(path, digest)
+    _write(name, encoded, output)
+
+    return {
+        "file": name,
+        "width": fallback.width,
+        "height": fallback.height,
+        "variants": variants,
+    }
+
+
+def build_assets(static_dir=STATIC_DIR, output=ASSET_DIST_DIR, force=False):
+    """
+    Builds every asset under `static_dir` into `output` and writes the manifest.
+    Sources whose hash is unchanged since the last build are reused unless
+    `force` is set. Returns the manifest.
+    """
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+        print("⚠️ brotli is not installed: only gzip copies will be written")
+
+    manifest_file = os.path.join(output, "manifest.json")
+    previous = {}
+    if not force and os.path.exists(manifest_file):
+        with open(manifest_file, encoding="utf-8") as f:
+            previous = json.load(f)
+
+    manifest = {}
+    for directory in ASSET_SOURCE_DIRS:
+        for root, _, files in os.walk(os.path.join(static_dir, directory)):
+            for filename in sorted(files):
+                source = os.path.join(root, filename)
+                path = os.path.relpath(source, static_dir).replace(os.sep, "/")
+                ext = os.path.splitext(filename)[1].lower()
+                with open(source, "rb") as f:
+                    data = f.read()
+                digest = file_hash(data)
+
+                entry = previous.get(path)
+                if entry and entry.get("hash") == digest and all(
+                        os.path.exists(os.path.join(output, name)) for name in _entry_files(entry)):
+                    manifest[path] = entry
+                    continue
+
+                if ext in IMAGE_EXTENSIONS:
+                    entry = build_image(path, data, digest, output)
+                else:
+                    entry = {"file": hashed_name(path, digest)}
+                    _write(entry["file"], data, output)
+                if ext in COMPRESSIBLE_EXTENSIONS:
+                    entry["encodings"] = _write_compressed(entry["file"], data, output, brotli)
+                entry["hash"] = digest
+                entry["bytes"] = len(data)
+                manifest[path] = entry
+                print(f"✅ {path} -> {entry['file']}")
+
+    # Drop outputs of sources that changed or were removed
+    keep = {name for entry in manifest.values() for name in _entry_files(entry)}
+    for root, _, files in os.walk(output):
+        for filename in files:
+            name = os.path.relpath(os.path.join(root, filename), output).replace(os.sep, "/")
+            if name != "manifest.json" and name not in keep:
+                os.remove(os.path.join(root, filename))
+
+    os.makedirs(output, exist_ok=True)
+    tmp_path = f"{manifest_file}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_file)
+    return manifest
+
+
+def _entry_files(entry):
+    names = [entry["file"]]
+    names += [name for variants in entry.get("variants", {}).values() for _, name in variants]
+    names += [entry["file"] + (".br" if encoding == "br" else ".gz") for encoding in entry.get("encodings", [])]
+    return names
+
+
+class AssetManifest:
+    """
+    Read-only view of manifest.json, loaded on first use. A missing manifest
+    means every helper falls back to the plain /static URL.
+    """
+
+    def __init__(self, path=ASSET_MANIFEST_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = None
+        self._version = ""
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            with self._lock:
+                if self._entries is None:
+                    self._entries = self._load()
+        return self._entries
+
+    @property
+    def version(self):
+        """
+        Hash of the loaded manifest ("" without one); changes whenever an asset does.
+        """
+        self.entries  # loads the manifest on first use
+        return self._version
+
+    def _load(self):
+        self._version = ""
+        try:
+            with open(self.path, "rb") as f:
+                raw = f.read()
+            entries = json.loads(raw)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Asset manifest {self.path} not loaded: {e}")
+            return {}
+        self._version = file_hash(raw)
+        return entries
+
+    def reload(self):
+        with self._lock:
+            self._entries = self._load()
+
+    def get(self, path):
+        return self.entries.get(path.lstrip("/"))
+
+    def stats(self):
+        entries = self.entries
+        return {
+            "assets": len(entries),
+            "images": sum(1 for entry in entries.values() if "variants" in entry),
+            "source_bytes": sum(entry.get("bytes", 0) for entry in entries.values()),
+        }
+
+
+ASSET_MANIFEST = AssetManifest()
+
+
+def asset_url(path):
+    """
+    URL of the hashed build of `path` (relative to static/), or its /static URL.
+    """
+    from flask import url_for
+
+    entry = ASSET_MANIFEST.get(path)
+    if entry is None:
+        return url_for("static", filename=path)
+    return url_for("assets", filename=entry["file"])
+
+
+def asset_srcset(path, mime):
+    from flask import url_for
+
+    entry = ASSET_MANIFEST.get(path)
+    variants = (entry or {}).get("variants", {}).get(mime, [])
+    return ", ".join(f"{url_for('assets', filename=name)} {width}w" for width, name in variants)
+
+
+def responsive_image(path, alt="", sizes="100vw", **attrs):
+    """
+    <picture> with AVIF/WebP srcsets and the fallback <img>. Extra keyword
+    arguments become <img> attributes (class_ -> class).
+    """
+    from markupsafe import Markup, escape
+
+    entry = ASSET_MANIFEST.get(path) or {}
+    img_attrs = {"src": asset_url(path), "alt": alt, "loading": "lazy", "decoding": "async"}
+    if entry.get("width"):
+        img_attrs["width"] = entry["width"]
+        img_attrs["height"] = entry["height"]
+    img_attrs.update({key.rstrip("_").replace("_", "-"): value for key, value in attrs.items()})
+    img = "<img " + " ".join(f'{key}="{escape(value)}"' for key, value in img_attrs.items() if value is not None) + ">"
+
+    sources = ""
+    for mime, _, _ in IMAGE_VARIANT_FORMATS:
+        srcset = asset_srcset(path, mime)
+        if srcset:
+            sources += f'<source type="{mime}" srcset="{escape(srcset)}" sizes="{escape(sizes)}">'
+    if not sources:
+        return Markup(img)
+    return Markup(f"<picture>{sources}{img}</picture>")
+
+
+def image_set(path):
+    """
+    CSS image-set() of the largest AVIF/WebP variants plus the fallback, for
+    full-screen backgrounds. Use it after a plain url() so older browsers keep that.
+    """
+    from flask import url_for
+    from markupsafe import Markup
+
+    entry = ASSET_MANIFEST.get(path) or {}
+    options = []
+    for mime, _, _ in IMAGE_VARIANT_FORMATS:
+        variants = entry.get("variants", {}).get(mime)
+        if variants:
+            options.append(f"url('{url_for('assets', filename=variants[-1][1])}') type('{mime}')")
+    fallback_type = mimetypes.guess_type(path)[0] or "image/jpeg"
+    # Single quotes: the result usually lands inside a style="..." attribute
+    options.append(f"url('{asset_url(path)}') type('{fallback_type}')")
+    return Markup(f"image-set({', '.join(options)})")
+
+
+def send_asset(filename):
+    """
+    Serves a built asset, preferring a precompressed copy the client accepts.
+    """
+    from flask import request, send_from_directory
+    from werkzeug.security import safe_join
+
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    served, encoding = filename, None
+    for candidate, extension in (("br", ".br"), ("gzip", ".gz")):
+        path = safe_join(ASSET_DIST_DIR, filename + extension)
+        if request.accept_encodings[candidate] and path and os.path.isfile(path):
+            served, encoding = filename + extension, candidate
+            break
+
+    response = send_from_directory(ASSET_DIST_DIR, served, mimetype=mimetype, max_age=ASSET_MAX_AGE)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    """
+    Adds the /assets route, the template helpers and cache headers for /static.
+    """
+    from flask import request
+
+    app.add_url_rule(f"{ASSET_URL_PATH}/<path:filename>", endpoint="assets", view_func=send_asset)
+
+    @app.context_processor
+    def _asset_helpers():
+        return {"asset_url": asset_url, "responsive_image": responsive_image, "image_set": image_set}
+
+    @app.after_request
+    def _static_cache_headers(response):
+        if request.endpoint == "static" and response.status_code in (200, 304):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+        return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build hashed, compressed and resized static assets.")
+    parser.add_argument("--output", default=ASSET_DIST_DIR)
+    parser.add_argument("--force", action="store_true", help="rebuild assets whose source did not change")
+    parser.add_argument("--clean", action="store_true", help="delete the output directory first")
+    args = parser.parse_args()
+
+    if args.clean and os.path.isdir(args.output):
+        shutil.rmtree(args.output)
+    manifest = build_assets(output=args.output, force=args.force)
+
+    source_bytes = sum(entry["bytes"] for entry in manifest.values())
+    built_bytes = sum(os.path.getsize(os.path.join(args.output, entry["file"])) for entry in manifest.values())
+    print(f"Built {len(manifest)} assets into {args.output}: "
+          f"{source_bytes / 1024:.0f} KB of sources, {built_bytes / 1024:.0f} KB of fallbacks.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Async serving mode.
+
+/chatbot, /get_disease_info, /get_disease_info_batch and /book_appointment are served by an async Quart
+app that awaits non-blocking MongoDB (AsyncMongoClient) and Gemini
+(generate_content_async) calls, so one process can hold many in-flight LLM
+requests. Every other route is forwarded to the existing Flask app in app.py,
+which also keeps working on its own (python app.py).
+
+Run with an ASGI server, e.g.:
+    hypercorn async_app:application
+"""
+import asyncio
+from datetime import datetime
+
+from asgiref.wsgi import WsgiToAsgi
+from quart import Quart, request, session, jsonify, Response
+
+import app as sync_app
+import metrics_utils
+from fetch_utils import SchedulerBusy
+from api_utils import (get_medical_info_async, stream_medical_info_async, prepare_disease_batch,
+                       iter_medical_info_batch_async, batch_summary)
+from job_utils import enqueue_booking_jobs
+from search_utils import disease_suggestion
+from mongo_utils import repository, async_repository, APPOINTMENT_DUPLICATE, APPOINTMENT_SLOT_FULL
+
+app = Quart(__name__)
+# Share the Flask session cookie so users logged in on sync routes stay logged in
+app.secret_key = sync_app.app.secret_key
+app.config["SESSION_COOKIE_NAME"] = sync_app.app.config["SESSION_COOKIE_NAME"]
+
+app.register_error_handler(SchedulerBusy, sync_app.scheduler_busy)
+# Async routes are timed into the same /metrics as the Flask ones
+metrics_utils.init_async_app(app)
+
+ASYNC_ROUTES = {
+    ("POST", "/chatbot"),
+    ("GET", "/get_disease_info"),
+    ("GET", "/get_disease_info_batch"),
+    ("POST", "/get_disease_info_batch"),
+    ("POST", "/book_appointment"),
+}
+
+
+def wants_stream(form=None):
+    if request.args.get('stream') in ('1', 'true'):
+        return True
+    if form is not None and form.get('stream') in ('1', 'true'):
+        return True
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+
+def stream_disease_info(disease_name):
+    """
+    Forwards the Gemini answer as Server-Sent Events (same events as app.py).
+    """
+    async def generate():
+        suggestion = disease_suggestion(disease_name)
+        if suggestion:
+            yield sync_app.sse_event("suggestion", {"disease": suggestion}).encode()
+        async for event, text in stream_medical_info_async(disease_name):
+            yield sync_app.sse_event(event, {"text": text}).encode()
+        yield sync_app.sse_event("done", {}).encode()
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.route('/chatbot', methods=['POST'])
+async def chatbot():
+    form = await request.form
+    option = form.get('option')
+
+    if option == "Book Appointment":
+        return await handle_appointment_booking(form)
+
+    elif option == "Know About Diseases":
+        return await handle_disease_info(form)
+
+    return jsonify({"message": "Invalid request."})
+
+
+@app.route('/get_disease_info')
+async def get_disease_info_api():
+    disease_name = request.args.get("disease", "").strip()
+    if not disease_name:
+        return jsonify({"error": "No disease name provided"}), 400
+
+    if wants_stream():
+        return stream_disease_info(disease_name)
+
+    body = {"result": await get_medical_info_async(disease_name)}
+    suggestion = disease_suggestion(disease_name)
+    if suggestion:
+        body["did_you_mean"] = suggestion
+    return jsonify(body)
+
+
+@app.route('/get_disease_info_batch', methods=['GET', 'POST'])
+async def get_disease_info_batch():
+    """
+    Async version of the batch lookup in app.py (same inputs and events).
+    """
+    payload = await request.get_json(silent=True)
+    form = await request.form
+    if isinstance(payload, dict):
+        values = [payload.get('diseases') or []]
+    elif payload is not None:
+        values = [payload]
+    else:
+        values = request.args.getlist('diseases') + form.getlist('diseases')
+
+    if request.args.get('profile') in ('1', 'true') or form.get('profile') in ('1', 'true'):
+        if 'username' not in session:
+            return jsonify({"error": "Unauthorized"}), 401
+        profile = await asyncio.to_thread(repository.get_user_profile, session['username']) or {}
+        values.append(profile.get('diseases', ''))
+
+    try:
+        groups = prepare_disease_batch(values)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if wants_stream(form):
+        async def generate():
+            entries = []
+            async for entry in iter_medical_info_batch_async(groups):
+                entries.append(entry)
+                yield sync_app.sse_event("result", entry).encode()
+            yield sync_app.sse_event("done", {"summary": batch_summary(entries)}).encode()
+
+        return Response(
+            generate(),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    order = {disease: index for index, (disease, _) in enumerate(groups)}
+    entries = [entry async for entry in iter_medical_info_batch_async(groups)]
+    entries.sort(key=lambda entry: order[entry['disease']])
+    return jsonify({"results": entries, "summary": batch_summary(entries)})
+
+
+@app.route('/book_appointment', methods=['POST'])
+async def book_appointment():
+    form = await request.form
+    name = form.get('name')
+    email = form.get('email')
+    disease = form.get('disease')
+    clinic = form.get('clinic')
+    date = form.get('date')
+    time = form.get('time')
+
+    if not all([name, email, disease, clinic, date, time]):
+        return jsonify({"success": False, "message": "All fields are required"}), 400
+
+    try:
+        date_obj = datetime.strptime(date, "%Y-%m-%d")
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid date format. Use YYYY-MM-DD."}), 400
+
+    status, appointment_id = await async_repository.store_appointment(session['username'], name, email, disease, clinic, date_obj, time)
+    if status == APPOINTMENT_DUPLICATE:
+        return jsonify({"success": False, "message": "Appointment already booked for this date and time."}), 409
+    if status == APPOINTMENT_SLOT_FULL:
+        return jsonify({"success": False, "message": "This time slot is fully booked. Please choose another time."}), 409
+
+    enqueue_booking_jobs(appointment_id, session['username'], name, email, disease, clinic, date_obj, time)
+    return jsonify({"success": True, "message": "Appointment booked successfully!"})
+
+
+async def handle_appointment_booking(form):
+    name = form.get('name')
+    email = form.get('email')
+    disease = form.get('disease')
+    clinic = form.get('clinic')
+    date_str = form.get('date')
+    time = form.get('time')
+
+    if not all([name, email, disease, clinic, date_str, time]):
+        return jsonify({"message": "All fields are required."}), 400
+
+    try:
+        date = datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        return jsonify({"message": "Invalid date format. Use YYYY-MM-DD."}), 400
+
+    status, appointment_id = await async_repository.store_appointment(session['username'], name, email, disease, clinic, date, time)
+    if status == APPOINTMENT_DUPLICATE:
+        return jsonify({"message": f"Appointment already booked for {name} on {date_str} at {time}."}), 409
+    if status == APPOINTMENT_SLOT_FULL:
+        return jsonify({"message": f"{clinic} is fully booked on {date_str} at {time}. Please pick another slot."}), 409
+
+    enqueue_booking_jobs(appointment_id, session['username'], name, email, disease, clinic, date, time)
+    return jsonify({"message": f"Appointment booked for {name} on {date_str} at {time}."})
+
+
+async def handle_disease_info(form):
+    disease_query = form.get('disease_query')
+
+    if not disease_query:
+        return jsonify({"error": "Please enter a disease name"}), 400
+
+    if wants_stream(form):
+        return stream_disease_info(disease_query)
+
+    try:
+        response = await get_medical_info_async(disease_query)
+        return jsonify({"response": response})
+    except SchedulerBusy:
+        raise
+    except Exception as e:
+        return jsonify({"error": f"Failed to fetch disease info: {str(e)}"}), 500
+
+
+_wsgi_app = WsgiToAsgi(sync_app.app)
+
+
+async def application(scope, receive, send):
+    """
+    ASGI entry point: async routes go to the Quart app, everything else to Flask.
+    """
+    if scope["type"] == "lifespan":
+        return await app(scope, receive, send)
+    if scope["type"] == "http" and (scope["method"], scope["path"]) in ASYNC_ROUTES:
+        return await app(scope, receive, send)
+    return await _wsgi_app(scope, receive, send)
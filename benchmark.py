@@ -0,0 +1,349 @@
+"""
+Route-level load benchmark.
+
+Starts app.py in-process against mongomock (an in-memory MongoDB stand-in) and
+a fake Gemini model with configurable latency (or against a real MongoDB with
+--mongo-uri), drives a weighted mix of /login, /profile, /book_appointment,
+/get_disease_info and /chatbot traffic at one or more concurrency levels, and
+writes p50/p95/p99 latency, requests/sec and MongoDB operations per request as
+JSON.
+
+Usage:
+    pip install -r requirements-dev.txt
+    python benchmark.py --concurrency 1,8,32 --requests 500 --gemini-latency 0.5
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+
+import requests
+from pymongo import monitoring
+
+DEFAULT_MIX = "login=10,profile=30,book_appointment=20,get_disease_info=25,chatbot=15"
+DISEASES = ["Diabetes", "Hypertension", "Migraine", "Asthma", "Arthritis", "Thyroid",
+            "Fever", "Eye Infection", "Skin Allergy", "Dental Pain"]
+
+# MongoDB operations of the current request. A context variable holding a
+# mutable counter: the app copies its context into helper threads (e.g. the
+# /profile fan-out), so their operations land on the same request's count
+_mongo_ops = ContextVar("bench_mongo_ops", default=None)
+# Nesting depth of the mongomock wrapper, always on the calling thread
+_depth = threading.local()
+
+
+class OpCount:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def add(self):
+        with self._lock:
+            self.value += 1
+
+
+def count_mongo_op():
+    ops = _mongo_ops.get()
+    if ops is not None:
+        ops.add()
+
+
+class MongoOpCounter(monitoring.CommandListener):
+    """
+    Counts the commands a real MongoDB client sends for the current request.
+    """
+
+    def started(self, event):
+        count_mongo_op()
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """
+    Stand-in for genai.GenerativeModel that sleeps instead of calling Gemini.
+    """
+    latency = 0.5
+
+    def __init__(self, model_name=None, **kwargs):
+        self.model_name = model_name
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        text = (f"Summary for: {prompt}\nSymptoms: fatigue, thirst.\nCauses: various.\n"
+                "Treatment: rest. Deficiencies: Vitamin D, Vitamin B12 and Iron.")
+        if not stream:
+            time.sleep(self.latency)
+            return FakeResponse(text)
+        return self._stream(text)
+
+    def _stream(self, text):
+        words = text.split(" ")
+        for i in range(0, len(words), 8):
+            time.sleep(self.latency / max(1, len(words) // 8))
+            yield FakeResponse(" ".join(words[i:i + 8]) + " ")
+
+
+def install_mongo_op_counter(collection_cls):
+    """
+    MongoOpCounter for mongomock, which sends no commands and so emits no
+    monitoring events: counts each outermost collection call instead.
+    """
+    methods = ["find", "find_one", "insert_one", "insert_many", "update_one", "update_many",
+               "delete_one", "delete_many", "aggregate", "count_documents", "bulk_write",
+               "find_one_and_update", "replace_one"]
+    for name in methods:
+        original = getattr(collection_cls, name, None)
+        if original is None:
+            continue
+
+        def wrapper(self, *args, __original=original, **kwargs):
+            # mongomock implements some methods on top of others (find_one -> find);
+            # only the outermost call is a client operation
+            depth = getattr(_depth, "value", 0)
+            if depth == 0:
+                count_mongo_op()
+            _depth.value = depth + 1
+            try:
+                return __original(self, *args, **kwargs)
+            finally:
+                _depth.value = depth
+
+        setattr(collection_cls, name, wrapper)
+
+
+def start_app(gemini_latency, mongo_uri=None):
+    """
+    Imports app.py with Gemini (and, without `mongo_uri`, MongoDB) replaced by
+    local stand-ins and serves it on a free localhost port. Returns (base URL, server).
+    """
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+
+    if mongo_uri:
+        os.environ["MONGO_URI"] = mongo_uri
+        # Registered before app.py creates its client, which picks it up
+        monitoring.register(MongoOpCounter())
+    else:
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit("benchmark.py needs mongomock: pip install -r requirements-dev.txt")
+
+        install_mongo_op_counter(mongomock.collection.Collection)
+        shared_client = mongomock.MongoClient()
+
+        import mongo_utils
+        mongo_utils.MongoClient = lambda *args, **kwargs: shared_client
+
+    import google.generativeai as genai
+    FakeGenerativeModel.latency = gemini_latency
+    genai.GenerativeModel = FakeGenerativeModel
+
+    import app as app_module
+    from werkzeug.serving import make_server
+
+    flask_app = app_module.app
+    flask_app.secret_key = os.environ["SECRET_KEY"]
+
+    @flask_app.before_request
+    def _reset_mongo_ops():
+        _mongo_ops.set(OpCount())
+
+    @flask_app.after_request
+    def _report_mongo_ops(response):
+        ops = _mongo_ops.get()
+        response.headers["X-Bench-Mongo-Ops"] = str(ops.value if ops is not None else 0)
+        return response
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+
+class Client:
+    """
+    One simulated user with its own session cookie.
+    """
+
+    def __init__(self, base_url, index):
+        self.base_url = base_url
+        self.session = requests.Session()
+        self.username = f"bench_user_{index}"
+        self.password = "secret"
+        self.bookings = 0
+        self.session.post(f"{base_url}/signup", data={
+            "name": f"Bench User {index}", "username": self.username,
+            "email": f"{self.username}@example.com", "phone": "0000000000",
+            "password": self.password, "diseases": "Diabetes,Asthma"
+        }, allow_redirects=False)
+
+    def login(self):
+        return self.session.post(f"{self.base_url}/login", data={
+            "username": self.username, "password": self.password
+        }, allow_redirects=False)
+
+    def profile(self):
+        return self.session.get(f"{self.base_url}/profile")
+
+    def book_appointment(self):
+        # Each client books its own clinic on a new day, so bookings never
+        # compete for a slot (default capacity is 1) and measure the write path, not 409s
+        self.bookings += 1
+        date = (datetime(2030, 1, 1) + timedelta(days=self.bookings)).strftime("%Y-%m-%d")
+        return self.session.post(f"{self.base_url}/book_appointment", data={
+            "name": self.username, "email": f"{self.username}@example.com",
+            "disease": "Fever", "clinic": f"Bench Clinic {self.username}", "date": date, "time": "09:00 AM"
+        })
+
+    def get_disease_info(self):
+        return self.session.get(f"{self.base_url}/get_disease_info",
+                                params={"disease": random.choice(DISEASES)})
+
+    def chatbot(self):
+        return self.session.post(f"{self.base_url}/chatbot", data={
+            "option": "Know About Diseases", "disease_query": random.choice(DISEASES)
+        })
+
+
+def parse_mix(mix):
+    routes = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        routes[name.strip()] = float(weight or 1)
+    return routes
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    # Nearest-rank percentile
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def summarize(samples, elapsed):
+    latencies = [s["latency"] for s in samples]
+    errors = sum(1 for s in samples if s["status"] >= 400)
+    mongo_ops = [s["mongo_ops"] for s in samples if s["mongo_ops"] is not None]
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "rps": round(len(samples) / elapsed, 2) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+        "mongo_ops_per_request": round(sum(mongo_ops) / len(mongo_ops), 2) if mongo_ops else None,
+    }
+
+
+def run_level(base_url, concurrency, total_requests, mix, seed):
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    plan = [rng.choices(names, weights)[0] for _ in range(total_requests)]
+
+    clients = [Client(base_url, f"{concurrency}_{i}") for i in range(concurrency)]
+    for client in clients:
+        client.login()
+
+    samples = []
+    lock = threading.Lock()
+
+    def worker(index):
+        client = clients[index]
+        for route in plan[index::concurrency]:
+            start = time.perf_counter()
+            try:
+                response = getattr(client, route)()
+                status = response.status_code
+                ops = response.headers.get("X-Bench-Mongo-Ops")
+            except requests.RequestException:
+                status, ops = 599, None
+            latency = time.perf_counter() - start
+            with lock:
+                samples.append({"route": route, "latency": latency, "status": status,
+                                "mongo_ops": int(ops) if ops is not None else None})
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    result = {"concurrency": concurrency, "elapsed_s": round(elapsed, 3), "overall": summarize(samples, elapsed), "routes": {}}
+    for route in names:
+        route_samples = [s for s in samples if s["route"] == route]
+        if route_samples:
+            result["routes"][route] = summarize(route_samples, elapsed)
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test app.py routes against local stand-ins.")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=500, help="requests per concurrency level")
+    parser.add_argument("--gemini-latency", type=float, default=0.5, help="fake Gemini latency in seconds")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="route weights, e.g. login=1,profile=3")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--mongo-uri", help="benchmark against this MongoDB instead of mongomock "
+                                            "(writes to its doctor_appointment_db; use a scratch server)")
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    unknown = [name for name in mix if not hasattr(Client, name)]
+    if unknown:
+        parser.error(f"unknown routes in --mix: {', '.join(unknown)}")
+
+    base_url, server = start_app(args.gemini_latency, args.mongo_uri)
+    results = {
+        "revision": git_revision(),
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "config": {"requests": args.requests, "gemini_latency": args.gemini_latency, "mix": mix, "seed": args.seed,
+                   "mongo": "server" if args.mongo_uri else "mongomock"},
+        "levels": [],
+    }
+    try:
+        for concurrency in [int(c) for c in args.concurrency.split(",") if c.strip()]:
+            level = run_level(base_url, concurrency, args.requests, mix, args.seed)
+            results["levels"].append(level)
+            overall = level["overall"]
+            print(f"c={concurrency:<4} rps={overall['rps']:<8} p50={overall['p50_ms']}ms "
+                  f"p95={overall['p95_ms']}ms p99={overall['p99_ms']}ms errors={overall['errors']} "
+                  f"mongo_ops/req={overall['mongo_ops_per_request']}")
+    finally:
+        server.shutdown()
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING
+
+
+class TTLCache:
+    """
+    Thread-safe in-process LRU cache whose entries also expire after `ttl` seconds.
+    """
+
+    def __init__(self, maxsize=256, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None, valid=None):
+        """
+        Returns the live entry for `key`. An entry failing `valid(value)` (e.g.
+        stamped with an outdated version) is dropped and counted as a miss.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            if valid is not None and not valid(value):
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key):
+        """
+        Like get() but without touching the LRU order or the counters.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] <= time.monotonic():
+                return None
+            return item[0]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key into one: the first caller runs
+    the function, the others wait and share its result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def join(self, key):
+        """
+        Lower-level form of do() for work that cannot be wrapped in one
+        function (e.g. a streamed answer). Returns (leader, call): the leader
+        must pass the outcome to finish(); anyone else can wait() on the call.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                return False, call
+            call = self._calls[key] = {"event": threading.Event(), "result": None, "error": None}
+            return True, call
+
+    def finish(self, key, call, result=None, error=None):
+        call["result"] = result
+        call["error"] = error
+        with self._lock:
+            self._calls.pop(key, None)
+        call["event"].set()
+
+    @staticmethod
+    def wait(call):
+        call["event"].wait()
+        if call["error"] is not None:
+            raise call["error"]
+        return call["result"]
+
+    def do(self, key, fn):
+        leader, call = self.join(key)
+        if not leader:
+            return self.wait(call)
+
+        result = error = None
+        try:
+            result = fn()
+            return result
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.finish(key, call, result, error)
+
+
+class MongoCacheStore:
+    """
+    Persistent cache tier stored in a MongoDB collection. Expired documents are
+    removed by a TTL index on `expires_at`.
+    """
+
+    def __init__(self, collection_getter, ttl=7 * 24 * 3600):
+        self._collection_getter = collection_getter
+        self.ttl = ttl
+        self._indexed = False
+
+    @property
+    def collection(self):
+        collection = self._collection_getter()
+        if not self._indexed:
+            collection.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl")
+            self._indexed = True
+        return collection
+
+    def get(self, key):
+        doc = self.collection.find_one({"_id": key, "expires_at": {"$gt": datetime.utcnow()}}, {"value": 1})
+        return doc["value"] if doc else None
+
+    def set(self, key, value):
+        now = datetime.utcnow()
+        self.collection.update_one(
+            {"_id": key},
+            {"$set": {"value": value, "updated_at": now, "expires_at": now + timedelta(seconds=self.ttl)}},
+            upsert=True
+        )
+
+    def delete(self, key):
+        self.collection.delete_one({"_id": key})
+
+
+class TieredCache:
+    """
+    In-process TTLCache in front of an optional persistent store, with
+    single-flight protection so concurrent misses compute a value only once.
+    """
+
+    def __init__(self, memory, store=None, name="cache"):
+        self.memory = memory
+        self.store = store
+        self.name = name
+        # Public so callers that compute values themselves can share in-flight work
+        self.flight = SingleFlight()
+        self.store_hits = 0
+        self.store_misses = 0
+        self.store_errors = 0
+        self.computes = 0
+
+    def _store_get(self, key):
+        if self.store is None:
+            return None
+        try:
+            value = self.store.get(key)
+        except Exception as e:
+            self.store_errors += 1
+            print(f"⚠️ {self.name} store read failed: {e}")
+            return None
+        if value is None:
+            self.store_misses += 1
+        else:
+            self.store_hits += 1
+        return value
+
+    def _store_set(self, key, value):
+        if self.store is None:
+            return
+        try:
+            self.store.set(key, value)
+        except Exception as e:
+            self.store_errors += 1
+            print(f"⚠️ {self.name} store write failed: {e}")
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None:
+            value = self._store_get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        self._store_set(key, value)
+
+    def delete(self, key):
+        self.memory.delete(key)
+        if self.store is not None:
+            try:
+                self.store.delete(key)
+            except Exception as e:
+                self.store_errors += 1
+                print(f"⚠️ {self.name} store delete failed: {e}")
+
+    def get_or_compute(self, key, compute, should_cache=lambda value: value is not None):
+        """
+        Returns the cached value for `key`, calling `compute()` on a miss.
+        Values rejected by `should_cache` (e.g. error messages) are returned but not stored.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        def load():
+            # Another caller may have filled the cache while we waited for the lock
+            cached = self.memory.peek(key)
+            if cached is not None:
+                return cached
+            self.computes += 1
+            result = compute()
+            if should_cache(result):
+                self.set(key, result)
+            return result
+
+        return self.flight.do(key, load)
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats.update({
+            "store_hits": self.store_hits,
+            "store_misses": self.store_misses,
+            "store_errors": self.store_errors,
+            "computes": self.computes,
+        })
+        return stats
+
+
+class ByteLRUCache:
+    """
+    Thread-safe LRU cache for bytes values, bounded by their total size.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.current_bytes -= len(old)
+            self._data[key] = value
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.current_bytes -= len(evicted)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
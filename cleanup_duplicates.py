@@ -1,36 +1,18 @@
-from your_flask_app import db
-from your_flask_app.models import Appointment
+from dotenv import load_dotenv
 
-def cleanup_duplicates():
-    # Query to find duplicates based on name, email, date, and time
-    duplicates = db.session.query(
-        Appointment.name,
-        Appointment.email,
-        Appointment.date,
-        Appointment.time,
-        db.func.count(Appointment.id).label('count')
-    ).group_by(
-        Appointment.name,
-        Appointment.email,
-        Appointment.date,
-        Appointment.time
-    ).having(db.func.count(Appointment.id) > 1).all()
+# mongo_utils reads its settings at import time
+load_dotenv()
 
-    for duplicate in duplicates:
-        # Find all entries with the same name, email, date, and time
-        entries = db.session.query(Appointment).filter_by(
-            name=duplicate.name,
-            email=duplicate.email,
-            date=duplicate.date,
-            time=duplicate.time
-        ).all()
+from mongo_utils import repository
 
-        # Keep the first entry and delete the rest
-        for entry in entries[1:]:
-            db.session.delete(entry)
-
-    db.session.commit()
+# One-off migration: remove duplicate appointments in bulk, then build the
+# unique index that keeps new duplicates out and rebuild the clinic slot
+# counters from the remaining upcoming appointments.
 
 if __name__ == "__main__":
-    cleanup_duplicates()
-    print("Duplicate entries cleaned up.")
+    deleted = repository.cleanup_duplicates()
+    print(f"Duplicate entries cleaned up: {deleted} removed.")
+    repository.ensure_indexes()
+    print("Appointment indexes created.")
+    slots = repository.rebuild_slot_counters()
+    print(f"Slot counters rebuilt: {slots} slots.")
@@ -0,0 +1,396 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is skipped because its circuit breaker is open."""
+
+
+class DeadlineExceeded(Exception):
+    """Raised when no upstream answered before the request deadline."""
+
+
+class CircuitBreaker:
+    """
+    Per-upstream circuit breaker. After `failure_threshold` consecutive failures
+    the circuit opens and calls are skipped for `cooldown` seconds; then a single
+    trial call is let through (half-open) to decide whether to close it again.
+    """
+
+    def __init__(self, name, failure_threshold=3, cooldown=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    print(f"⚠️ Circuit '{self.name}' opened after {self._failures} failures")
+                self._opened_at = time.monotonic()
+
+    def call(self, fn, *args, **kwargs):
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+
+class SchedulerBusy(Exception):
+    """Raised when the scheduler queue is full or a request waited too long."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Refills `per_minute` units per minute up to `capacity` (default: one minute's worth).
+    """
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """
+        Seconds until `amount` units are available (0 if they are available now).
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class RequestScheduler:
+    """
+    Admission control for an upstream API: bounded concurrency, requests- and
+    tokens-per-minute budgets, priority ordering (lower value first) and a bounded
+    wait queue that rejects new work with a retry-after instead of piling up.
+
+    Callers acquire a slot, make their call and release it; `slot()` and
+    `run_async()` wrap that for sync and asyncio code.
+    """
+
+    def __init__(self, name, max_concurrency=8, requests_per_minute=60,
+                 tokens_per_minute=None, max_queue=64, queue_timeout=10.0):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.requests_per_minute = requests_per_minute
+        self._request_bucket = TokenBucket(requests_per_minute)
+        self._token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._lock = threading.Lock()
+        self._queue = []
+        self._sequence = itertools.count()
+        self._running = 0
+        self._timer = None
+        self.granted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_wait = 0.0
+
+    def _budget_wait(self, tokens):
+        wait = self._request_bucket.wait_time(1)
+        if self._token_bucket is not None:
+            wait = max(wait, self._token_bucket.wait_time(tokens))
+        return wait
+
+    def _retry_after(self):
+        # Rough time for the current queue to drain at the request budget
+        per_request = 60.0 / self.requests_per_minute
+        return max(1, int(len(self._queue) * per_request + self._budget_wait(1)) + 1)
+
+    def _dispatch(self):
+        """
+        Grants queued tickets while concurrency and budget allow. Caller holds the lock.
+        """
+        while self._queue and self._running < self.max_concurrency:
+            _, _, ticket = self._queue[0]
+            wait = self._budget_wait(ticket["tokens"])
+            if wait > 0:
+                # Re-check once the budget has refilled
+                if self._timer is None:
+                    self._timer = threading.Timer(wait, self._on_timer)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            heapq.heappop(self._queue)
+            self._request_bucket.take(1)
+            if self._token_bucket is not None:
+                self._token_bucket.take(ticket["tokens"])
+            self._running += 1
+            self.granted += 1
+            ticket["granted"] = True
+            self.total_wait += time.monotonic() - ticket["queued_at"]
+            ticket["notify"]()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            self._dispatch()
+
+    def _enqueue(self, priority, tokens, notify):
+        with self._lock:
+            if len(self._queue) >= self.max_queue:
+                self.rejected += 1
+                raise SchedulerBusy(f"{self.name} queue is full", self._retry_after())
+            ticket = {"tokens": tokens, "notify": notify, "granted": False, "queued_at": time.monotonic()}
+            heapq.heappush(self._queue, (priority, next(self._sequence), ticket))
+            self._dispatch()
+            return ticket
+
+    def _cancel(self, ticket):
+        """
+        Drops a ticket whose caller stopped waiting. Returns True if it had
+        already been granted, in which case the caller owns the slot.
+        """
+        with self._lock:
+            if ticket["granted"]:
+                return True
+            self._queue = [item for item in self._queue if item[2] is not ticket]
+            heapq.heapify(self._queue)
+            return False
+
+    def _timed_out(self, ticket):
+        if self._cancel(ticket):
+            return
+        with self._lock:
+            self.timed_out += 1
+            retry_after = self._retry_after()
+        raise SchedulerBusy(f"{self.name} is overloaded", retry_after)
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE, tokens=1, timeout=None):
+        event = threading.Event()
+        ticket = self._enqueue(priority, tokens, event.set)
+        if not event.wait(self.queue_timeout if timeout is None else timeout):
+            self._timed_out(ticket)
+
+    async def acquire_async(self, priority=PRIORITY_INTERACTIVE, tokens=1, timeout=None):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def notify():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        ticket = self._enqueue(priority, tokens, notify)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            self._timed_out(ticket)
+        except asyncio.CancelledError:
+            # Don't leak a slot granted to a caller that went away
+            if self._cancel(ticket):
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            self._running -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, priority=PRIORITY_INTERACTIVE, tokens=1, timeout=None):
+        self.acquire(priority, tokens, timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def run_async(self, coro_fn, priority=PRIORITY_INTERACTIVE, tokens=1, timeout=None):
+        await self.acquire_async(priority, tokens, timeout)
+        try:
+            return await coro_fn()
+        finally:
+            self.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queued": len(self._queue),
+                "running": self._running,
+                "max_concurrency": self.max_concurrency,
+                "granted": self.granted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "avg_wait_seconds": round(self.total_wait / self.granted, 4) if self.granted else 0.0,
+            }
+
+
+def create_http_session(pool_size=20):
+    """
+    Returns a requests.Session with a keep-alive connection pool.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+HTTP_SESSION = create_http_session(int(os.getenv("HTTP_POOL_SIZE", "20")))
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("HEDGE_WORKERS", "32")),
+    thread_name_prefix="hedge"
+)
+
+
+def _cancel(futures):
+    # Drops attempts still queued behind a busy pool; running ones finish in the
+    # background (their result is ignored, their breaker still records it)
+    for future in futures:
+        future.cancel()
+
+
+def hedged_fetch(primary, fallback, deadline, hedge_delay,
+                 primary_breaker=None, fallback_breaker=None,
+                 accept=lambda result: True):
+    """
+    Calls `primary(timeout)` and, if it has not succeeded within `hedge_delay`
+    seconds (or fails sooner), starts `fallback(timeout)` in parallel. The first
+    result accepted by `accept` wins. Each callable receives the time left until
+    `deadline` seconds from now. Once a result wins, the other attempt is
+    cancelled if it has not started and ignored otherwise.
+
+    If every attempt fails, the last rejected result is returned when there is
+    one, otherwise the last error is raised (DeadlineExceeded on timeout).
+    """
+    start = time.monotonic()
+    end = start + deadline
+    hedge_at = start + hedge_delay
+
+    def remaining():
+        return max(0.0, end - time.monotonic())
+
+    def launch(fn, breaker):
+        # Skip an upstream whose circuit is open; otherwise record the outcome
+        if breaker is not None and not breaker.allow():
+            return None
+
+        def run():
+            try:
+                result = fn(remaining())
+            except Exception:
+                if breaker is not None:
+                    breaker.record_failure()
+                raise
+            if breaker is not None:
+                breaker.record_success()
+            return result
+
+        # Attempts belong to the calling request: carry its context along
+        return _executor.submit(contextvars.copy_context().run, run)
+
+    pending = set()
+    fallback_started = False
+    rejected = None
+    last_error = None
+
+    future = launch(primary, primary_breaker)
+    if future is not None:
+        pending.add(future)
+
+    while True:
+        if not fallback_started and (not pending or time.monotonic() >= hedge_at):
+            fallback_started = True
+            future = launch(fallback, fallback_breaker)
+            if future is not None:
+                pending.add(future)
+
+        if not pending:
+            break
+
+        timeout = remaining()
+        if not fallback_started:
+            timeout = min(timeout, max(0.0, hedge_at - time.monotonic()))
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                last_error = e
+                continue
+            if accept(result):
+                _cancel(pending)
+                return result
+            rejected = result
+
+        if remaining() <= 0:
+            _cancel(pending)
+            last_error = DeadlineExceeded(f"no upstream answered within {deadline:.1f}s")
+            break
+
+    if rejected is not None:
+        return rejected
+    if last_error is not None:
+        raise last_error
+    raise CircuitOpenError("all upstreams are unavailable")
@@ -0,0 +1,380 @@
+import heapq
+import itertools
+import os
+import random
+import smtplib
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+
+class PermanentJobError(Exception):
+    """
+    Raised by a job handler for a failure retrying cannot fix (bad input,
+    missing configuration). The job skips its remaining attempts.
+    """
+
+
+class JobQueue:
+    """
+    In-process background job queue with a worker pool. Failed jobs are retried
+    with exponential backoff; after `max_attempts` (or at once for a
+    PermanentJobError) they move to a bounded dead-letter list. Jobs live in
+    memory, so anything that must survive a restart has to be written to
+    MongoDB before it is enqueued.
+    """
+
+    def __init__(self, name="jobs", workers=4, max_attempts=3, backoff=2.0, max_backoff=300.0, dead_letter_size=100):
+        self.name = name
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._handlers = {}
+        self._queue = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._pid = None
+        self.dead_letters = deque(maxlen=dead_letter_size)
+        self.running = 0
+        self.enqueued = 0
+        self.completed = 0
+        self.started = 0
+        self.runs = 0
+        self.retried = 0
+        self.dead = 0
+        self.total_wait = 0.0
+        self.total_runtime = 0.0
+
+    def task(self, name):
+        """
+        Decorator registering a job handler under `name`.
+        """
+        def decorator(fn):
+            self._handlers[name] = fn
+            return fn
+        return decorator
+
+    def _ensure_workers(self):
+        # Threads don't survive fork: start a fresh pool in each worker process
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._threads = []
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def enqueue(self, name, *args, delay=0, **kwargs):
+        """
+        Schedules `name(*args, **kwargs)` to run on the worker pool. Returns the job id.
+        """
+        if name not in self._handlers:
+            raise KeyError(f"Unknown job: {name}")
+        now = time.monotonic()
+        job = {
+            "id": uuid.uuid4().hex,
+            "name": name,
+            "args": args,
+            "kwargs": kwargs,
+            "attempts": 0,
+            "enqueued_at": now,
+            "run_at": now + delay,
+            "last_error": None,
+        }
+        with self._cond:
+            self._ensure_workers()
+            heapq.heappush(self._queue, (job["run_at"], next(self._sequence), job))
+            self.enqueued += 1
+            self._cond.notify()
+        return job["id"]
+
+    def _next_job(self):
+        with self._cond:
+            while True:
+                if self._queue:
+                    wait = self._queue[0][0] - time.monotonic()
+                    if wait <= 0:
+                        _, _, job = heapq.heappop(self._queue)
+                        job["attempts"] += 1
+                        if job["attempts"] == 1:
+                            self.started += 1
+                            self.total_wait += time.monotonic() - job["enqueued_at"]
+                        self.running += 1
+                        return job
+                    self._cond.wait(wait)
+                else:
+                    self._cond.wait()
+
+    def _retry_delay(self, job, error):
+        # Honour an upstream's retry-after hint (e.g. SchedulerBusy), otherwise back off exponentially
+        delay = getattr(error, "retry_after", None)
+        if delay is None:
+            delay = min(self.backoff * 2 ** (job["attempts"] - 1), self.max_backoff)
+        return delay * random.uniform(0.8, 1.2)
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            started = time.monotonic()
+            error = None
+            try:
+                self._handlers[job["name"]](*job["args"], **job["kwargs"])
+            except Exception as e:
+                error = e
+            with self._cond:
+                self.running -= 1
+                self.runs += 1
+                self.total_runtime += time.monotonic() - started
+                if error is None:
+                    self.completed += 1
+            if error is not None:
+                self._failed(job, error)
+
+    def _failed(self, job, error):
+        job["last_error"] = f"{type(error).__name__}: {error}"
+        if job["attempts"] < self.max_attempts and not isinstance(error, PermanentJobError):
+            delay = self._retry_delay(job, error)
+            print(f"⚠️ Job {job['name']} failed (attempt {job['attempts']}/{self.max_attempts}), retrying in {delay:.1f}s: {error}")
+            with self._cond:
+                job["run_at"] = time.monotonic() + delay
+                heapq.heappush(self._queue, (job["run_at"], next(self._sequence), job))
+                self.retried += 1
+                self._cond.notify()
+            return
+
+        print(f"⚠️ Job {job['name']} moved to dead letters after {job['attempts']} attempts: {error}")
+        traceback.print_exception(type(error), error, error.__traceback__)
+        with self._cond:
+            self.dead += 1
+            self.dead_letters.append({
+                "id": job["id"],
+                "name": job["name"],
+                "args": job["args"],
+                "kwargs": job["kwargs"],
+                "attempts": job["attempts"],
+                "error": job["last_error"],
+                "failed_at": datetime.utcnow().isoformat() + "Z",
+            })
+
+    def requeue_dead_letters(self):
+        """
+        Moves every dead-lettered job back onto the queue. Returns how many were requeued.
+        """
+        with self._cond:
+            jobs = list(self.dead_letters)
+            self.dead_letters.clear()
+        for job in jobs:
+            self.enqueue(job["name"], *job["args"], **job["kwargs"])
+        return len(jobs)
+
+    def join(self, timeout=None):
+        """
+        Waits until nothing is queued or running (mainly for scripts and benchmarks).
+        """
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._cond:
+                if not self._queue and not self.running:
+                    return True
+            if end is not None and time.monotonic() >= end:
+                return False
+            time.sleep(0.05)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queued": len(self._queue),
+                "running": self.running,
+                "workers": self.workers,
+                "enqueued": self.enqueued,
+                "completed": self.completed,
+                "retried": self.retried,
+                "dead": self.dead,
+                "dead_letters": len(self.dead_letters),
+                "avg_wait_seconds": round(self.total_wait / self.started, 4) if self.started else 0.0,
+                "avg_runtime_seconds": round(self.total_runtime / self.runs, 4) if self.runs else 0.0,
+            }
+
+
+JOB_QUEUE = JobQueue(
+    workers=int(os.getenv("JOB_WORKERS", "4")),
+    max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "4")),
+    backoff=float(os.getenv("JOB_BACKOFF", "2")),
+    dead_letter_size=int(os.getenv("JOB_DEAD_LETTER_SIZE", "100"))
+)
+
+# Warming more than a handful of profile diseases per login is wasted quota
+MAX_WARM_DISEASES = int(os.getenv("MAX_WARM_DISEASES", "5"))
+
+# A confirmation claimed by a worker that died mid-send can be retried after this long
+CONFIRMATION_CLAIM_TIMEOUT = int(os.getenv("CONFIRMATION_CLAIM_TIMEOUT", "300"))
+
+# Summary failures that come back the same on every attempt
+PERMANENT_MEDICAL_INFO_ERRORS = (
+    "❌ Error: Missing Google Gemini API Key.",
+    "❌ Error: Unable to fetch disease details.",
+)
+
+
+def enqueue(name, *args, **kwargs):
+    """
+    Enqueues on the shared queue. Never raises: side work must not fail a request.
+    """
+    try:
+        return JOB_QUEUE.enqueue(name, *args, **kwargs)
+    except Exception as e:
+        print(f"⚠️ Could not enqueue job {name}: {e}")
+        return None
+
+
+def enqueue_booking_jobs(appointment_id, username, name, email, disease, clinic, date, time):
+    """
+    Side work after a booking has been stored: confirmation message and, for a
+    known disease, the PDF the patient is likely to download next. Free-text
+    diseases are rarely downloaded twice, so they are rendered on demand.
+    """
+    from search_utils import DISEASE_INDEX
+
+    enqueue("send_confirmation", appointment_id, username, name, email, disease, clinic, date, time)
+    if DISEASE_INDEX.canonical(disease) is not None:
+        enqueue("render_disease_pdf", disease)
+
+
+def check_medical_info(result):
+    """
+    Raises for an "❌" summary: PermanentJobError when retrying cannot help,
+    RuntimeError (retried) otherwise.
+    """
+    if result in PERMANENT_MEDICAL_INFO_ERRORS:
+        raise PermanentJobError(result)
+    if result.startswith("❌"):
+        raise RuntimeError(result)
+
+
+def enqueue_profile_warmup(username):
+    """
+    Warms the disease summary cache for the diseases on a user's profile.
+    """
+    enqueue("warm_profile", username)
+
+
+@JOB_QUEUE.task("send_confirmation")
+def send_confirmation(appointment_id, username, name, email, disease, clinic, date, time):
+    """
+    Records the confirmation in the `notifications` collection and, when SMTP is
+    configured, emails it. The notification is keyed on the appointment id (a
+    cancelled and rebooked slot gets a new one) and claimed before sending, so
+    retries and concurrent workers send it once.
+    """
+    from pymongo.errors import DuplicateKeyError
+    from mongo_utils import get_db
+
+    notifications = get_db()['notifications']
+    day = date.strftime("%Y-%m-%d") if hasattr(date, "strftime") else str(date)
+    subject = f"Appointment confirmed: {clinic} on {day} at {time}"
+    body = (f"Hello {name},\n\nYour appointment for {disease} at {clinic} on {day} at {time} is confirmed.\n\n"
+            "Medi-Bot")
+
+    notification_id = f"confirmation:{appointment_id}"
+    now = datetime.utcnow()
+    # Claimable when new, after a failed attempt, or when a previous claim went stale
+    claimable = {'_id': notification_id, '$or': [
+        {'status': 'failed'},
+        {'status': 'sending', 'claimed_at': {'$lt': now - timedelta(seconds=CONFIRMATION_CLAIM_TIMEOUT)}},
+    ]}
+    try:
+        notifications.update_one(
+            claimable,
+            {"$set": {'appointment_id': appointment_id, 'username': username, 'email': email, 'subject': subject,
+                      'body': body, 'status': 'sending', 'claimed_at': now, 'updated_at': now}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Already sent, or being sent by another worker
+        return
+
+    status = "logged"
+    try:
+        smtp_host = os.getenv("SMTP_HOST")
+        if smtp_host:
+            message = EmailMessage()
+            message["Subject"] = subject
+            message["From"] = os.getenv("SMTP_FROM", "no-reply@medibot.local")
+            message["To"] = email
+            message.set_content(body)
+            with smtplib.SMTP(smtp_host, int(os.getenv("SMTP_PORT", "587")), timeout=10) as smtp:
+                if os.getenv("SMTP_USER"):
+                    smtp.starttls()
+                    smtp.login(os.getenv("SMTP_USER"), os.getenv("SMTP_PASSWORD", ""))
+                smtp.send_message(message)
+            status = "sent"
+    except Exception:
+        # Give the claim back so the retry can take it
+        notifications.update_one({'_id': notification_id, 'status': 'sending'},
+                                 {"$set": {'status': 'failed', 'updated_at': datetime.utcnow()}})
+        raise
+
+    notifications.update_one(
+        {'_id': notification_id},
+        {"$set": {'status': status, 'updated_at': datetime.utcnow()}}
+    )
+
+
+@JOB_QUEUE.task("warm_medical_info")
+def warm_medical_info(disease):
+    from api_utils import get_medical_info
+    from fetch_utils import PRIORITY_BACKGROUND
+
+    check_medical_info(get_medical_info(disease, priority=PRIORITY_BACKGROUND))
+
+
+@JOB_QUEUE.task("warm_profile")
+def warm_profile(username):
+    from mongo_utils import repository
+
+    profile = repository.get_user_profile(username) or {}
+    names = [d.strip() for d in (profile.get("diseases") or "").split(",") if d.strip()]
+    for disease in names[:MAX_WARM_DISEASES]:
+        enqueue("warm_medical_info", disease)
+
+
+@JOB_QUEUE.task("refresh_medical_info")
+def refresh_medical_info(disease):
+    """
+    Replaces a stale snapshot summary: reuses a value another process already
+    stored, otherwise regenerates it at background priority.
+    """
+    from api_utils import MEDICAL_INFO_CACHE, medical_info_cache_key, _generate_medical_info
+    from fetch_utils import PRIORITY_BACKGROUND
+
+    key = medical_info_cache_key(disease)
+    if MEDICAL_INFO_CACHE.store is not None:
+        stored = MEDICAL_INFO_CACHE.store.get(key)
+        if stored is not None:
+            MEDICAL_INFO_CACHE.memory.set(key, stored)
+            return
+    result = _generate_medical_info(disease, PRIORITY_BACKGROUND)
+    check_medical_info(result)
+    MEDICAL_INFO_CACHE.set(key, result)
+
+
+@JOB_QUEUE.task("render_disease_pdf")
+def render_disease_pdf(disease):
+    """
+    Pre-renders the PDF /get_disease_pdf would serve for `disease` into PDF_CACHE.
+    """
+    from api_utils import get_medical_info, generate_pdf
+    from fetch_utils import PRIORITY_BACKGROUND
+
+    disease_info = get_medical_info(disease, priority=PRIORITY_BACKGROUND)
+    check_medical_info(disease_info)
+    # Background work: wait for the render instead of answering "retry later"
+    generate_pdf(disease_info, title=f"Disease Information: {disease}", wait=None)
+
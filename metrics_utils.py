@@ -0,0 +1,297 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from pymongo import monitoring
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Requests slower than this are logged with a per-phase breakdown (0 disables)
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+
+# Per-request phase breakdown. A context variable rather than a thread-local:
+# async requests share the event loop thread but each runs in its own context
+_breakdown = ContextVar("metrics_breakdown", default=None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, series in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, series["counts"]):
+                    labels = _format_labels(self.labels + ("le",), label_values + (bound,))
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labels + ("le",), label_values + ("+Inf",))
+                lines.append(f"{self.name}_bucket{labels} {series['count']}")
+                base = _format_labels(self.labels, label_values)
+                lines.append(f"{self.name}_sum{base} {series['sum']:.6f}")
+                lines.append(f"{self.name}_count{base} {series['count']}")
+        return lines
+
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route", "status"))
+MONGO_COMMAND_LATENCY = Histogram("mongo_command_duration_seconds", "MongoDB command latency", ("command",))
+MONGO_COMMAND_FAILURES = Counter("mongo_command_failures_total", "Failed MongoDB commands", ("command",))
+UPSTREAM_LATENCY = Histogram("upstream_call_duration_seconds", "Gemini / disease API call latency", ("upstream",))
+UPSTREAM_ERRORS = Counter("upstream_call_errors_total", "Failed Gemini / disease API calls", ("upstream",))
+
+METRICS = [REQUEST_LATENCY, MONGO_COMMAND_LATENCY, MONGO_COMMAND_FAILURES, UPSTREAM_LATENCY, UPSTREAM_ERRORS]
+
+# name -> callable returning a flat dict of numbers, rendered as gauges
+_stats_sources = {}
+
+
+def register_stats(name, source):
+    """
+    Exposes a stats() dict (e.g. cache counters) on /metrics as `<name>_<key>` gauges.
+    """
+    _stats_sources[name] = source
+
+
+def record_phase(phase, seconds):
+    """
+    Adds time spent in `phase` to the current request's breakdown (if one is active).
+    """
+    breakdown = _breakdown.get()
+    if breakdown is not None:
+        breakdown[phase] = breakdown.get(phase, 0.0) + seconds
+
+
+@contextmanager
+def timed_upstream(upstream):
+    """
+    Times an upstream call; exceptions are counted as errors and re-raised.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        UPSTREAM_ERRORS.inc(upstream)
+        raise
+    finally:
+        _observe_upstream(upstream, time.perf_counter() - start)
+
+
+def _observe_upstream(upstream, elapsed):
+    UPSTREAM_LATENCY.observe(elapsed, upstream)
+    record_phase(upstream, elapsed)
+
+
+def timed_stream(upstream, open_stream):
+    """
+    Yields the chunks of `open_stream()`, timing only the upstream: opening the
+    stream and waiting for each chunk, not the consumer's work in between. One
+    sample is recorded when the stream ends or fails (counted as an error); a
+    consumer that stops early (GeneratorExit) records nothing.
+    """
+    elapsed = 0.0
+    start = time.perf_counter()
+    try:
+        for chunk in open_stream():
+            elapsed += time.perf_counter() - start
+            yield chunk
+            start = time.perf_counter()
+    except Exception:
+        UPSTREAM_ERRORS.inc(upstream)
+        _observe_upstream(upstream, elapsed + time.perf_counter() - start)
+        raise
+    _observe_upstream(upstream, elapsed + time.perf_counter() - start)
+
+
+async def timed_stream_async(upstream, open_stream):
+    """
+    Async version of timed_stream; `open_stream()` is awaited for an async iterable.
+    """
+    elapsed = 0.0
+    start = time.perf_counter()
+    try:
+        async for chunk in await open_stream():
+            elapsed += time.perf_counter() - start
+            yield chunk
+            start = time.perf_counter()
+    except Exception:
+        UPSTREAM_ERRORS.inc(upstream)
+        _observe_upstream(upstream, elapsed + time.perf_counter() - start)
+        raise
+    _observe_upstream(upstream, elapsed + time.perf_counter() - start)
+
+
+def track_upstream(upstream, is_error=None):
+    """
+    Decorator form of timed_upstream. `is_error(result)` lets functions that
+    return error values instead of raising still count as failures.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed_upstream(upstream):
+                result = fn(*args, **kwargs)
+            if is_error is not None and is_error(result):
+                UPSTREAM_ERRORS.inc(upstream)
+            return result
+        return wrapper
+    return decorator
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """
+    pymongo command listener feeding per-command latency and failure metrics.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        seconds = event.duration_micros / 1e6
+        MONGO_COMMAND_LATENCY.observe(seconds, event.command_name)
+        record_phase("mongo", seconds)
+
+    def failed(self, event):
+        seconds = event.duration_micros / 1e6
+        MONGO_COMMAND_LATENCY.observe(seconds, event.command_name)
+        MONGO_COMMAND_FAILURES.inc(event.command_name)
+        record_phase("mongo", seconds)
+
+
+MONGO_LISTENER = MongoCommandTimer()
+
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for name, source in sorted(_stats_sources.items()):
+        try:
+            stats = source()
+        except Exception as e:
+            print(f"⚠️ Metrics source {name} failed: {e}")
+            continue
+        for key, value in sorted(stats.items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f"# TYPE {name}_{key} gauge")
+                lines.append(f"{name}_{key} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def _start_request():
+    _breakdown.set({})
+    return time.perf_counter()
+
+
+def _finish_request(start, method, route, status):
+    """
+    Records a finished request and logs it with its phase breakdown when slow.
+    """
+    elapsed = time.perf_counter() - start
+    REQUEST_LATENCY.observe(elapsed, method, route, status)
+
+    breakdown = _breakdown.get() or {}
+    _breakdown.set(None)
+    if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+        accounted = sum(breakdown.values())
+        phases = ", ".join(f"{phase}={seconds * 1000:.1f}ms" for phase, seconds in sorted(breakdown.items()))
+        print(f"🐢 Slow request {method} {route} {status} "
+              f"{elapsed * 1000:.1f}ms [{phases or 'no phases'}, other={(elapsed - accounted) * 1000:.1f}ms]")
+
+
+def init_app(app):
+    """
+    Installs request timing hooks, template render timing and the slow-request log.
+    """
+    from flask import g, request, before_render_template, template_rendered
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = _start_request()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            _finish_request(start, request.method, route, response.status_code)
+        return response
+
+    def _template_started(sender, template, context, **extra):
+        g.metrics_template_start = time.perf_counter()
+
+    def _template_finished(sender, template, context, **extra):
+        start = g.pop("metrics_template_start", None)
+        if start is not None:
+            record_phase("template", time.perf_counter() - start)
+
+    before_render_template.connect(_template_started, app, weak=False)
+    template_rendered.connect(_template_finished, app, weak=False)
+
+
+def init_async_app(app):
+    """
+    init_app for the Quart app in async_app.py: request timing and the
+    slow-request log, recorded in the same metrics as the Flask routes.
+    """
+    from quart import g, request
+
+    @app.before_request
+    async def _start_timer():
+        g.metrics_start = _start_request()
+
+    @app.after_request
+    async def _record_request(response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            _finish_request(start, request.method, route, response.status_code)
+        return response
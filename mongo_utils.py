@@ -1,142 +1,978 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING, UpdateOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure, BulkWriteError
+from pymongo.read_preferences import ReadPreference
 import os
+import threading
+import uuid
+import base64
+import contextvars
+import json
+from concurrent.futures import ThreadPoolExecutor
 from bson import ObjectId
-from datetime import datetime
+from bson.errors import InvalidId
+from datetime import datetime, timedelta
+from cache_utils import TTLCache
+from metrics_utils import MONGO_LISTENER
 
-def get_mongo_client():
-    client = MongoClient(os.getenv("MONGO_URI"))
-    return client
-
-def register_user(name, username, email, phone, password, diseases):
-    client = get_mongo_client()
-    db = client['doctor_appointment_db']  # Updated database name
-    users_collection = db['users']  # Collection for user profiles
-    
-    if users_collection.find_one({'username': username}):
-        return False
-    
-    users_collection.insert_one({
-        'name': name,
-        'username': username,
-        'email': email,
-        'phone': phone,
-        'password': password,
-        "diseases": diseases if diseases else ""  # Ensure diseases is always set
-    })
-    return True
-
-def authenticate_user(username, password):
-    client = get_mongo_client()
-    db = client['doctor_appointment_db']  # Updated database name
-    users_collection = db['users']  # Collection for user profiles
-    
-    user = users_collection.find_one({'username': username, 'password': password})
-    return user is not None
-
-def update_user_diseases(username, diseases):
-    client = get_mongo_client()
-    db = client['doctor_appointment_db']  # Updated database name
-    user_collection = db['users']
-    result = user_collection.update_one(
-        {"username": username},
-        {"$set": {"diseases": diseases}}
-    )
-    return result.modified_count > 0
-
-def get_user_profile(username):
-    client = get_mongo_client()
-    db = client['doctor_appointment_db']  # Updated database name
-    user_collection = db['users']
-    user = user_collection.find_one({"username": username})
-    if user:
-        return {
-            "name": user.get("name", ""),  # Use .get() to provide a default value if key is missing
-            "username": user.get("username", ""),
-            "email": user.get("email", ""),
-            "phone": user.get("phone", ""),
-            "diseases": user.get("diseases", "")  # Default to empty string if 'diseases' key is missing
-        }
-    return None
-
-def store_appointment(username, name, email, disease, clinic, date, time):
-    client = get_mongo_client()
-    db = client['doctor_appointment_db']
-    appointments_collection = db['appointments']
-    
-    appointment_id = ObjectId()  # Generate a unique ObjectId
-    appointments_collection.insert_one({
-        '_id': appointment_id,
+DB_NAME = 'doctor_appointment_db'
+
+# Fields that identify a single booking; enforced by a unique index.
+APPOINTMENT_KEY_FIELDS = ("name", "email", "date", "time")
+
+APPOINTMENT_FIELDS = {'_id': 1, 'name': 1, 'email': 1, 'disease': 1, 'clinic': 1, 'date': 1, 'time': 1, 'status': 1, 'created_at': 1}
+APPOINTMENT_SORT = [('created_at', DESCENDING), ('_id', DESCENDING)]
+MAX_APPOINTMENTS_PAGE_SIZE = 100
+
+PROFILE_FIELDS = ("name", "username", "email", "phone", "diseases")
+
+# store_appointment / bulk_store_appointments outcomes
+APPOINTMENT_CREATED = "created"
+APPOINTMENT_DUPLICATE = "duplicate"
+APPOINTMENT_SLOT_FULL = "full"
+
+# Default clinic schedule; a document in the `clinics` collection
+# ({"name", "slot_times", "slot_capacity"}) overrides it per clinic.
+DEFAULT_SLOT_TIMES = [t.strip() for t in os.getenv(
+    "CLINIC_SLOT_TIMES", "09:00 AM,10:00 AM,11:00 AM,02:00 PM,03:00 PM,04:00 PM,06:00 PM,07:00 PM"
+).split(",") if t.strip()]
+MAX_FREE_SLOTS_DAYS = 31
+
+SLOT_TAKE = {"$inc": {"booked": 1, "remaining": -1}}
+SLOT_RELEASE = {"$inc": {"booked": -1, "remaining": 1}}
+SLOT_FIELDS = ('clinic', 'date', 'time')
+
+# Per-user change counters (one `user_versions` document per user), bumped on
+# every write so pages can answer conditional GETs without re-querying
+USER_VERSION_PROFILE = "profile"
+USER_VERSION_APPOINTMENTS = "appointments"
+USER_VERSION_PARTS = (USER_VERSION_PROFILE, USER_VERSION_APPOINTMENTS)
+
+# Shared client state. MongoClient is thread-safe and keeps its own connection
+# pool, so one instance per process is all we need. It is NOT fork-safe, so we
+# remember which pid created it and rebuild it in forked workers.
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primarypreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondarypreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"⚠️ Ignoring invalid value for {name}: {value!r}")
+        return default
+
+
+def get_appointments_page_size():
+    return min(_env_int("APPOINTMENTS_PAGE_SIZE", 20), MAX_APPOINTMENTS_PAGE_SIZE)
+
+
+def encode_appointments_cursor(appointment, offset):
+    """
+    Encodes the keyset position after `appointment` plus the running row offset.
+    """
+    payload = {
+        "c": appointment['created_at'].isoformat(),
+        "i": str(appointment['_id']),
+        "o": offset,
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_appointments_cursor(cursor):
+    """
+    Returns (created_at, _id, offset) for a cursor, raising ValueError if it is malformed.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(payload["c"]), ObjectId(payload["i"]), int(payload["o"])
+    except (KeyError, TypeError, ValueError, InvalidId) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def get_default_slot_capacity():
+    return _env_int("SLOT_CAPACITY", 1)
+
+
+def normalize_slot_time(time):
+    """
+    Canonical "HH:MM AM" form so "14:00" and "02:00 PM" are the same slot.
+    Unparseable values are returned stripped.
+    """
+    value = (time or "").strip()
+    for fmt in ("%I:%M %p", "%H:%M", "%I %p", "%I:%M%p"):
+        try:
+            return datetime.strptime(value.upper(), fmt).strftime("%I:%M %p")
+        except ValueError:
+            continue
+    return value
+
+
+def slot_key(clinic, date, time):
+    """
+    Filter for one slot counter document: clinic, calendar day and normalized time.
+    """
+    return {'clinic': clinic, 'date': datetime(date.year, date.month, date.day), 'time': normalize_slot_time(time)}
+
+
+def build_clinic_schedule(clinic_doc):
+    clinic_doc = clinic_doc or {}
+    return {
+        "times": [normalize_slot_time(t) for t in clinic_doc.get("slot_times") or DEFAULT_SLOT_TIMES],
+        "capacity": int(clinic_doc.get("slot_capacity") or get_default_slot_capacity()),
+    }
+
+
+# clinic name -> schedule, shared by the sync and async repositories
+CLINIC_SCHEDULE_CACHE = TTLCache(maxsize=256, ttl=_env_int("CLINIC_SCHEDULE_TTL", 300))
+
+
+BOOKING_FIELDS = ('name', 'email', 'date', 'time')
+
+
+def booking_key(appointment):
+    """
+    The fields that identify a booking (see appointment_upsert), as a tuple.
+    """
+    name, email, date, time = (appointment[field] for field in BOOKING_FIELDS)
+    return name, email, date, normalize_slot_time(time)
+
+
+def appointment_upsert(username, name, email, disease, clinic, date, time, created_at=None):
+    """
+    Returns the (filter, update) pair for an idempotent appointment upsert.
+    The time is stored normalized, so "14:00" and "02:00 PM" are one booking.
+    """
+    key = {'name': name, 'email': email, 'date': date, 'time': normalize_slot_time(time)}
+    update = {"$setOnInsert": {
         'username': username,
-        'name': name,
-        'email': email,
         'disease': disease,
         'clinic': clinic,  # Include the clinic name
-        'date': date,
-        'time': time,
         'status': 'Upcoming',
-        'created_at': datetime.utcnow()  # Add a timestamp for sorting
-    })
-
-def update_user_profile(username, update_data):
-    client = get_mongo_client()
-    db = client['doctor_appointment_db']
-    user_collection = db['users']
-    result = user_collection.update_one(
-        {"username": username},
-        {"$set": update_data}
-    )
-    return result.modified_count > 0
-
-def get_user_appointments(username):
-    client = get_mongo_client()
-    db = client['doctor_appointment_db']
-    appointments_collection = db['appointments']
-    
-    appointments = list(appointments_collection.find({'username': username}, {'_id': 1, 'name': 1, 'email': 1, 'disease': 1, 'clinic': 1, 'date': 1, 'time': 1, 'status': 1, 'created_at': 1}).sort('created_at', -1))
-    
-    # Recalculate serial numbers
-    for index, appt in enumerate(appointments, start=1):
-        appt['sno'] = index
-    
-    return appointments
-
-def delete_appointment(username, appointment_id):
-    client = get_mongo_client()
-    db = client['doctor_appointment_db']
-    appointments_collection = db['appointments']
-    
-    result = appointments_collection.delete_one({'username': username, '_id': ObjectId(appointment_id)})
-    return result.deleted_count > 0
-
-def cleanup_duplicates():
-    client = get_mongo_client()
-    db = client['doctor_appointment_db']
-    appointments_collection = db['appointments']
-
-    pipeline = [
-        {
-            "$group": {
-                "_id": {
-                    "name": "$name",
-                    "email": "$email",
-                    "date": "$date",
-                    "time": "$time"
-                },
-                "ids": {"$push": "$_id"},
-                "count": {"$sum": 1}
+        'created_at': created_at or datetime.utcnow()  # Add a timestamp for sorting
+    }}
+    return key, update
+
+
+def user_version_from_doc(doc):
+    """
+    {"profile": n, "appointments": n, "updated_at": datetime or None} from a
+    `user_versions` document (or None for a user that never changed).
+    """
+    doc = doc or {}
+    version = {part: doc.get(part, 0) for part in USER_VERSION_PARTS}
+    version["updated_at"] = doc.get("updated_at")
+    return version
+
+
+def user_version_update(parts):
+    return {"$inc": {part: 1 for part in parts}, "$set": {"updated_at": datetime.utcnow()}}
+
+
+# Shared by the sync and async repositories so a bump in either is seen by both.
+# Writes replace the entry right away; other processes see a bump once their
+# entry expires. Every profile read looks the version up, so a TTL shorter than
+# the profile cache's would cap the profile cache at it: the default matches.
+USER_VERSION_CACHE = TTLCache(
+    maxsize=_env_int("USER_VERSION_CACHE_SIZE", 4096),
+    ttl=_env_int("USER_VERSION_CACHE_TTL", _env_int("PROFILE_CACHE_TTL", 60))
+)
+
+
+def get_client_options():
+    """
+    Builds MongoClient keyword arguments from the environment.
+    """
+    read_preference = os.getenv("MONGO_READ_PREFERENCE", "primary").replace("_", "").lower()
+    return {
+        "maxPoolSize": _env_int("MONGO_MAX_POOL_SIZE", 50),
+        "minPoolSize": _env_int("MONGO_MIN_POOL_SIZE", 0),
+        "maxIdleTimeMS": _env_int("MONGO_MAX_IDLE_TIME_MS", 300000),
+        "connectTimeoutMS": _env_int("MONGO_CONNECT_TIMEOUT_MS", 5000),
+        "serverSelectionTimeoutMS": _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+        "socketTimeoutMS": _env_int("MONGO_SOCKET_TIMEOUT_MS", 10000),
+        "waitQueueTimeoutMS": _env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000),
+        "read_preference": READ_PREFERENCES.get(read_preference, ReadPreference.PRIMARY),
+        "event_listeners": [MONGO_LISTENER],
+    }
+
+
+def get_mongo_client():
+    """
+    Returns the process-wide MongoClient, creating it on first use or after a fork.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            # A client inherited from the parent process must not be used (or
+            # closed) here; just drop the reference and open a fresh pool.
+            _client = MongoClient(os.getenv("MONGO_URI"), **get_client_options())
+            _client_pid = pid
+    return _client
+
+
+def close_mongo_client():
+    """
+    Closes the shared client (used on shutdown and in tests).
+    """
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+
+
+def get_db():
+    return get_mongo_client()[DB_NAME]
+
+
+_async_client = None
+_async_client_pid = None
+
+
+def get_async_mongo_client():
+    """
+    Returns the process-wide AsyncMongoClient used by the async serving mode.
+    Must be called from the event loop that will use it.
+    """
+    global _async_client, _async_client_pid
+    if _async_client is None or _async_client_pid != os.getpid():
+        from pymongo import AsyncMongoClient
+        _async_client = AsyncMongoClient(os.getenv("MONGO_URI"), **get_client_options())
+        _async_client_pid = os.getpid()
+    return _async_client
+
+
+class MongoRepository:
+    """
+    Data-access layer for users and appointments backed by the shared client.
+    """
+
+    def __init__(self, db_name=DB_NAME):
+        self.db_name = db_name
+        # Per-process profile cache. Entries are stamped with the profile version
+        # they were read under, so a write in any process makes them unusable
+        self.profile_cache = TTLCache(
+            maxsize=_env_int("PROFILE_CACHE_SIZE", 1024),
+            ttl=_env_int("PROFILE_CACHE_TTL", 60)
+        )
+        self._executor = ThreadPoolExecutor(max_workers=_env_int("MONGO_FANOUT_WORKERS", 8), thread_name_prefix="mongo")
+
+    @property
+    def db(self):
+        return get_mongo_client()[self.db_name]
+
+    @property
+    def users(self):
+        return self.db['users']
+
+    @property
+    def appointments(self):
+        return self.db['appointments']
+
+    @property
+    def slots(self):
+        return self.db['slots']
+
+    @property
+    def clinics(self):
+        return self.db['clinics']
+
+    @property
+    def user_versions(self):
+        return self.db['user_versions']
+
+    def ensure_indexes(self):
+        """
+        Creates the indexes the queries below rely on. Safe to call repeatedly.
+        """
+        self.users.create_index([("username", ASCENDING)], unique=True, name="username_unique")
+        self.appointments.create_index(
+            [("username", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            name="username_created_at_id"
+        )
+        # One counter document per clinic slot; also serves free-slot range scans
+        self.slots.create_index(
+            [("clinic", ASCENDING), ("date", ASCENDING), ("time", ASCENDING)],
+            unique=True, name="slot_unique"
+        )
+        try:
+            self.appointments.create_index(
+                [(field, ASCENDING) for field in APPOINTMENT_KEY_FIELDS],
+                unique=True, name="appointment_unique"
+            )
+        except (DuplicateKeyError, OperationFailure) as e:
+            print(f"⚠️ Could not create unique appointment index, run cleanup_duplicates.py first: {e}")
+            raise
+
+    def register_user(self, name, username, email, phone, password, diseases):
+        if self.users.find_one({'username': username}, {'_id': 1}):
+            return False
+
+        self.users.insert_one({
+            'name': name,
+            'username': username,
+            'email': email,
+            'phone': phone,
+            'password': password,
+            "diseases": diseases if diseases else ""  # Ensure diseases is always set
+        })
+        return True
+
+    def authenticate_user(self, username, password):
+        user = self.users.find_one({'username': username, 'password': password}, {'_id': 1})
+        return user is not None
+
+    def update_user_diseases(self, username, diseases):
+        result = self.users.update_one(
+            {"username": username},
+            {"$set": {"diseases": diseases}}
+        )
+        self.profile_cache.delete(username)
+        if result.modified_count:
+            self.bump_user_version(username, USER_VERSION_PROFILE)
+        return result.modified_count > 0
+
+    def _cached_profile(self, username, version):
+        # An entry read under an older profile version is a miss, not a hit
+        cached = self.profile_cache.get(username, valid=lambda entry: entry[0] == version[USER_VERSION_PROFILE])
+        return dict(cached[1]) if cached is not None else None
+
+    def get_user_profile(self, username, version=None):
+        """
+        Returns the user's profile fields, or None. `version` is the user's
+        current version (see get_user_version), fetched when not given.
+        """
+        # Read the version before the document: a write in between leaves the
+        # entry stamped older than its contents, which only costs a reload
+        version = version or self.get_user_version(username)
+        profile = self._cached_profile(username, version)
+        if profile is not None:
+            return profile
+
+        user = self.users.find_one({"username": username}, {field: 1 for field in PROFILE_FIELDS})
+        if user:
+            profile = {
+                "name": user.get("name", ""),  # Use .get() to provide a default value if key is missing
+                "username": user.get("username", ""),
+                "email": user.get("email", ""),
+                "phone": user.get("phone", ""),
+                "diseases": user.get("diseases", "")  # Default to empty string if 'diseases' key is missing
             }
-        },
-        {
-            "$match": {
-                "count": {"$gt": 1}
+            self.profile_cache.set(username, (version[USER_VERSION_PROFILE], profile))
+            return dict(profile)
+        return None
+
+    def get_profile_cache_stats(self):
+        return self.profile_cache.stats()
+
+    def get_user_version(self, username):
+        """
+        Returns the user's change counters (see user_version_from_doc).
+        """
+        version = USER_VERSION_CACHE.get(username)
+        if version is None:
+            version = user_version_from_doc(self.user_versions.find_one({'_id': username}))
+            USER_VERSION_CACHE.set(username, version)
+        return dict(version)
+
+    def bump_user_version(self, username, *parts):
+        """
+        Marks `parts` of a user's data as changed. Never raises: a failed bump
+        only costs a stale page until the version cache entry expires.
+        """
+        try:
+            doc = self.user_versions.find_one_and_update(
+                {'_id': username}, user_version_update(parts),
+                upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except Exception as e:
+            print(f"⚠️ Could not bump version for {username}: {e}")
+            USER_VERSION_CACHE.delete(username)
+            return None
+        version = user_version_from_doc(doc)
+        USER_VERSION_CACHE.set(username, version)
+        return version
+
+    def get_profile_and_appointments(self, username, cursor=None, version=None):
+        """
+        Returns (profile, appointments page). On a profile cache miss both
+        queries run concurrently.
+        """
+        version = version or self.get_user_version(username)
+        profile = self._cached_profile(username, version)
+        if profile is not None:
+            return profile, self.get_user_appointments_page(username, cursor=cursor)
+
+        # Run in a copy of this request's context so its metrics (and any other
+        # request-scoped state) see the profile query too
+        profile_future = self._executor.submit(contextvars.copy_context().run, self.get_user_profile, username, version)
+        page = self.get_user_appointments_page(username, cursor=cursor)
+        return profile_future.result(), page
+
+    def get_clinic_schedule(self, clinic):
+        """
+        Returns {"times": [...], "capacity": n} for a clinic.
+        """
+        schedule = CLINIC_SCHEDULE_CACHE.get(clinic)
+        if schedule is None:
+            schedule = build_clinic_schedule(self.clinics.find_one({'name': clinic}, {'slot_times': 1, 'slot_capacity': 1}))
+            CLINIC_SCHEDULE_CACHE.set(clinic, schedule)
+        return schedule
+
+    def reserve_slot(self, clinic, date, time):
+        """
+        Atomically takes one place in a clinic slot with a conditional update on
+        its counter document. Returns False when the slot is full.
+        """
+        key = slot_key(clinic, date, time)
+        if self.slots.update_one(dict(key, remaining={'$gt': 0}), SLOT_TAKE).matched_count:
+            return True
+
+        # No counter yet (first booking for this slot) or the slot is full
+        capacity = self.get_clinic_schedule(clinic)["capacity"]
+        if capacity <= 0:
+            return False
+        try:
+            self.slots.insert_one(dict(key, capacity=capacity, booked=1, remaining=capacity - 1))
+            return True
+        except DuplicateKeyError:
+            # The counter exists or was just created by a concurrent booking
+            return self.slots.update_one(dict(key, remaining={'$gt': 0}), SLOT_TAKE).matched_count > 0
+
+    def release_slot(self, clinic, date, time):
+        self.slots.update_one(dict(slot_key(clinic, date, time), booked={'$gt': 0}), SLOT_RELEASE)
+
+    def _slot_remaining(self, keys):
+        counters = self.slots.find({'$or': keys}, {'_id': 0, 'clinic': 1, 'date': 1, 'time': 1, 'remaining': 1})
+        return {tuple(doc[field] for field in SLOT_FIELDS): doc['remaining'] for doc in counters}
+
+    def reserve_slots(self, wanted):
+        """
+        Batched reserve_slot: takes up to `wanted[slot]` places in each slot
+        (a (clinic, day, time) tuple as built by slot_key) in a fixed number of
+        round trips. Returns {slot: places taken}.
+        """
+        keys = {slot: dict(zip(SLOT_FIELDS, slot)) for slot in wanted}
+        if not keys:
+            return {}
+        remaining = self._slot_remaining(list(keys.values()))
+
+        # First bookings for a slot: create the missing counters in one insert
+        missing = []
+        for slot in wanted:
+            if slot not in remaining:
+                capacity = self.get_clinic_schedule(slot[0])["capacity"]
+                remaining[slot] = max(capacity, 0)
+                if capacity > 0:
+                    missing.append(dict(keys[slot], capacity=capacity, booked=0, remaining=capacity))
+        if missing:
+            try:
+                self.slots.insert_many(missing, ordered=False)
+            except BulkWriteError:
+                # Some counters were created concurrently; read their current state
+                remaining.update(self._slot_remaining([{field: doc[field] for field in SLOT_FIELDS} for doc in missing]))
+
+        # Each take is conditional on the places still being there and leaves
+        # a hold under this batch's token, so a take that lost a race can be told apart
+        token = uuid.uuid4().hex
+        takes = {slot: min(count, remaining[slot]) for slot, count in wanted.items() if min(count, remaining[slot]) > 0}
+        if not takes:
+            return {}
+        result = self.slots.bulk_write([
+            UpdateOne(dict(keys[slot], remaining={'$gte': take}),
+                      {"$inc": {"booked": take, "remaining": -take}, "$set": {f"holds.{token}": take}})
+            for slot, take in takes.items()
+        ], ordered=False)
+        hold = {f"holds.{token}": {'$exists': True}}
+        if result.matched_count == len(takes):
+            self.slots.update_many(hold, {"$unset": {f"holds.{token}": ""}})
+            return takes
+
+        taken = self.slots.find(hold, {'_id': 0, 'clinic': 1, 'date': 1, 'time': 1})
+        granted = {tuple(doc[field] for field in SLOT_FIELDS) for doc in taken}
+        self.slots.update_many(hold, {"$unset": {f"holds.{token}": ""}})
+        # Rare: concurrent bookings got there first; take what is left place by place
+        for slot, take in list(takes.items()):
+            if slot in granted:
+                continue
+            takes[slot] = 0
+            while takes[slot] < take and self.reserve_slot(*slot):
+                takes[slot] += 1
+        return takes
+
+    def release_slots(self, counts):
+        """
+        Batched release_slot: gives back `counts[slot]` places per slot.
+        """
+        operations = [
+            UpdateOne(dict(zip(SLOT_FIELDS, slot), booked={'$gte': count}),
+                      {"$inc": {"booked": -count, "remaining": count}})
+            for slot, count in counts.items() if count > 0
+        ]
+        if operations:
+            self.slots.bulk_write(operations, ordered=False)
+
+    def store_appointment(self, username, name, email, disease, clinic, date, time):
+        """
+        Books an appointment idempotently after reserving its clinic slot.
+        Returns (status, appointment id): APPOINTMENT_CREATED with the new id,
+        or APPOINTMENT_DUPLICATE if the same booking (name, email, date, time)
+        already exists / APPOINTMENT_SLOT_FULL, both with None.
+        """
+        key, update = appointment_upsert(username, name, email, disease, clinic, date, time)
+        if not self.reserve_slot(clinic, date, time):
+            if self.appointments.find_one(key, {'_id': 1}):
+                return APPOINTMENT_DUPLICATE, None
+            return APPOINTMENT_SLOT_FULL, None
+
+        try:
+            result = self.appointments.update_one(key, update, upsert=True)
+        except DuplicateKeyError:
+            # A concurrent request inserted the same booking first
+            self.release_slot(clinic, date, time)
+            return APPOINTMENT_DUPLICATE, None
+        except Exception:
+            self.release_slot(clinic, date, time)
+            raise
+        if result.upserted_id is None:
+            self.release_slot(clinic, date, time)
+            return APPOINTMENT_DUPLICATE, None
+        self.bump_user_version(username, USER_VERSION_APPOINTMENTS)
+        return APPOINTMENT_CREATED, str(result.upserted_id)
+
+    def get_free_slots(self, clinic, start, end):
+        """
+        Lists open slots for a clinic between two dates (inclusive) as
+        {"date", "time", "remaining"} dicts. Reads only the slot counters in the
+        range; slots without a counter have never been booked. Past slots are skipped.
+        """
+        schedule = self.get_clinic_schedule(clinic)
+        start = datetime(start.year, start.month, start.day)
+        end = datetime(end.year, end.month, end.day)
+        counters = self.slots.find(
+            {'clinic': clinic, 'date': {'$gte': start, '$lte': end}},
+            {'_id': 0, 'date': 1, 'time': 1, 'remaining': 1}
+        )
+        remaining = {(doc['date'], doc['time']): doc['remaining'] for doc in counters}
+
+        now = datetime.now()
+        free = []
+        day = start
+        while day <= end:
+            for time in schedule["times"]:
+                left = remaining.get((day, time), schedule["capacity"])
+                if left <= 0:
+                    continue
+                try:
+                    starts_at = datetime.combine(day.date(), datetime.strptime(time, "%I:%M %p").time())
+                except ValueError:
+                    starts_at = day
+                if starts_at > now:
+                    free.append({"date": day.strftime("%Y-%m-%d"), "time": time, "remaining": left})
+            day += timedelta(days=1)
+        return free
+
+    def rebuild_slot_counters(self):
+        """
+        Migration: recomputes every slot counter from the upcoming appointments.
+        Run while bookings are paused. Returns the number of slot documents written.
+        """
+        pipeline = [
+            {"$match": {"status": "Upcoming", "clinic": {"$ne": None}}},
+            {"$group": {"_id": {"clinic": "$clinic", "date": "$date", "time": "$time"}, "count": {"$sum": 1}}}
+        ]
+        booked = {}
+        for group in self.appointments.aggregate(pipeline, allowDiskUse=True):
+            slot = group["_id"]
+            if not isinstance(slot.get("date"), datetime):
+                continue
+            key = slot_key(slot["clinic"], slot["date"], slot["time"])
+            booked_key = (key['clinic'], key['date'], key['time'])
+            booked[booked_key] = booked.get(booked_key, 0) + group["count"]
+
+        # Slots without a counter count as never booked
+        self.slots.delete_many({})
+        operations = []
+        for (clinic, date, time), count in booked.items():
+            capacity = self.get_clinic_schedule(clinic)["capacity"]
+            operations.append(UpdateOne(
+                {'clinic': clinic, 'date': date, 'time': time},
+                {"$set": {'capacity': capacity, 'booked': count, 'remaining': max(capacity - count, 0)}},
+                upsert=True
+            ))
+        for start in range(0, len(operations), 1000):
+            self.slots.bulk_write(operations[start:start + 1000], ordered=False)
+        return len(operations)
+
+    def bulk_store_appointments(self, username, appointments, ordered=False, chunk_size=500):
+        """
+        Books many appointments with batched idempotent upserts. `appointments` is a
+        list of dicts with name, email, disease, clinic, date and time. Returns one
+        status per input row: "created", "duplicate", "full" (no place left in the
+        clinic slot) or "error" (with a message).
+        With ordered=True, rows after the first write failure are reported as "skipped".
+        """
+        results = [None] * len(appointments)
+        now = datetime.utcnow()
+        stop = False
+
+        for start in range(0, len(appointments), chunk_size):
+            chunk = appointments[start:start + chunk_size]
+            if stop:
+                for offset in range(len(chunk)):
+                    results[start + offset] = {"status": "skipped"}
+                continue
+
+            # Existing bookings (e.g. a re-import) are duplicates, not competition
+            # for places: find them with one query before reserving anything
+            bookings = [booking_key(appt) for appt in chunk]
+            existing = {
+                booking_key(doc) for doc in self.appointments.find(
+                    {'$or': [dict(zip(BOOKING_FIELDS, booking)) for booking in set(bookings)]},
+                    {'_id': 0, **{field: 1 for field in BOOKING_FIELDS}}
+                )
             }
-        }
-    ]
+            pending = {}
+            for offset, booking in enumerate(bookings):
+                if booking in existing:
+                    results[start + offset] = {"status": APPOINTMENT_DUPLICATE}
+                    continue
+                existing.add(booking)
+                appt = chunk[offset]
+                pending.setdefault(tuple(slot_key(appt['clinic'], appt['date'], appt['time']).values()), []).append(offset)
+
+            # Places are reserved per slot in one batch; only rows that got one go into the write
+            granted = self.reserve_slots({slot: len(offsets) for slot, offsets in pending.items()})
+            reserved = []
+            for slot, offsets in pending.items():
+                for position, offset in enumerate(offsets):
+                    if position < granted.get(slot, 0):
+                        reserved.append(offset)
+                    else:
+                        results[start + offset] = {"status": APPOINTMENT_SLOT_FULL}
+            if not reserved:
+                continue
+            reserved.sort()
+
+            operations = [
+                UpdateOne(
+                    *appointment_upsert(username, chunk[offset]['name'], chunk[offset]['email'], chunk[offset]['disease'],
+                                        chunk[offset]['clinic'], chunk[offset]['date'], chunk[offset]['time'], created_at=now),
+                    upsert=True
+                )
+                for offset in reserved
+            ]
+
+            errors = {}
+            released = {}
+            try:
+                result = self.appointments.bulk_write(operations, ordered=ordered)
+                upserted = result.upserted_ids
+                processed = len(operations)
+            except BulkWriteError as e:
+                upserted = {item['index']: item['_id'] for item in e.details.get('upserted', [])}
+                errors = {item['index']: item for item in e.details.get('writeErrors', [])}
+                # Ordered writes stop at the first error
+                processed = min(errors) + 1 if ordered and errors else len(operations)
+                stop = ordered and bool(errors)
+
+            for index, offset in enumerate(reserved):
+                if index in upserted:
+                    results[start + offset] = {"status": APPOINTMENT_CREATED, "id": str(upserted[index])}
+                    continue
+                if index in errors:
+                    error = errors[index]
+                    if error.get('code') == 11000:
+                        # Lost a race with a concurrent insert of the same booking
+                        results[start + offset] = {"status": APPOINTMENT_DUPLICATE}
+                    else:
+                        results[start + offset] = {"status": "error", "message": error.get('errmsg', 'Write failed')}
+                elif index < processed:
+                    results[start + offset] = {"status": APPOINTMENT_DUPLICATE}
+                else:
+                    results[start + offset] = {"status": "skipped"}
+                appt = chunk[offset]
+                slot = tuple(slot_key(appt['clinic'], appt['date'], appt['time']).values())
+                released[slot] = released.get(slot, 0) + 1
+            self.release_slots(released)
+
+        if any(result and result["status"] == APPOINTMENT_CREATED for result in results):
+            self.bump_user_version(username, USER_VERSION_APPOINTMENTS)
+        return results
+
+    def iter_appointments(self, username, clinic=None, batch_size=500):
+        """
+        Returns a cursor over a user's appointments (optionally for one clinic),
+        oldest first, without loading them into memory.
+        """
+        query = {'username': username}
+        if clinic:
+            query['clinic'] = clinic
+        return self.appointments.find(query, APPOINTMENT_FIELDS).sort(
+            [('created_at', ASCENDING), ('_id', ASCENDING)]
+        ).batch_size(batch_size)
+
+    def update_user_profile(self, username, update_data):
+        result = self.users.update_one(
+            {"username": username},
+            {"$set": update_data}
+        )
+        self.profile_cache.delete(username)
+        if result.modified_count:
+            self.bump_user_version(username, USER_VERSION_PROFILE)
+        return result.modified_count > 0
+
+    def get_user_appointments(self, username):
+        appointments = list(self.appointments.find({'username': username}, APPOINTMENT_FIELDS).sort(APPOINTMENT_SORT))
+
+        # Recalculate serial numbers
+        for index, appt in enumerate(appointments, start=1):
+            appt['sno'] = index
+
+        return appointments
+
+    def get_user_appointments_page(self, username, cursor=None, page_size=None):
+        """
+        Returns one page of a user's appointments, newest first, using keyset
+        pagination on (created_at, _id). Pass the returned `next_cursor` back in
+        to get the following page; it is None on the last page.
+        """
+        page_size = max(1, min(page_size or get_appointments_page_size(), MAX_APPOINTMENTS_PAGE_SIZE))
+        query = {'username': username}
+        offset = 0
+        if cursor:
+            created_at, last_id, offset = decode_appointments_cursor(cursor)
+            query['$or'] = [
+                {'created_at': {'$lt': created_at}},
+                {'created_at': created_at, '_id': {'$lt': last_id}}
+            ]
+
+        # Fetch one extra row to know whether another page exists
+        appointments = list(self.appointments.find(query, APPOINTMENT_FIELDS).sort(APPOINTMENT_SORT).limit(page_size + 1))
+        has_more = len(appointments) > page_size
+        appointments = appointments[:page_size]
+
+        # Serial numbers continue from the previous page
+        for index, appt in enumerate(appointments, start=offset + 1):
+            appt['sno'] = index
+
+        next_cursor = None
+        if has_more:
+            next_cursor = encode_appointments_cursor(appointments[-1], offset + len(appointments))
+        return {"appointments": appointments, "next_cursor": next_cursor}
+
+    def delete_appointment(self, username, appointment_id):
+        appointment = self.appointments.find_one_and_delete(
+            {'username': username, '_id': ObjectId(appointment_id)},
+            projection={'clinic': 1, 'date': 1, 'time': 1, 'status': 1}
+        )
+        if appointment is None:
+            return False
+        if appointment.get('status') == 'Upcoming' and appointment.get('clinic') and isinstance(appointment.get('date'), datetime):
+            self.release_slot(appointment['clinic'], appointment['date'], appointment['time'])
+        self.bump_user_version(username, USER_VERSION_APPOINTMENTS)
+        return True
+
+    def normalize_appointment_times(self):
+        """
+        Rewrites stored booking times in the normalized form appointment_upsert
+        uses. A booking that turns out to duplicate an existing one (the unique
+        index is already built) is deleted. Returns (updated, deleted).
+        """
+        updated = deleted = 0
+        changed_users = set()
+        for time in self.appointments.distinct('time'):
+            normalized = normalize_slot_time(time)
+            if normalized == time:
+                continue
+            for doc in self.appointments.find({'time': time}, {'_id': 1, 'username': 1}):
+                try:
+                    self.appointments.update_one({'_id': doc['_id']}, {'$set': {'time': normalized}})
+                    updated += 1
+                except DuplicateKeyError:
+                    self.appointments.delete_one({'_id': doc['_id']})
+                    deleted += 1
+                if doc.get('username'):
+                    changed_users.add(doc['username'])
+        for username in changed_users:
+            self.bump_user_version(username, USER_VERSION_APPOINTMENTS)
+        return updated, deleted
+
+    def cleanup_duplicates(self, batch_size=1000):
+        """
+        One-off migration: removes duplicate bookings so the unique index can be
+        built. Keeps the oldest entry of each group. Returns the number deleted.
+        Booking times are normalized first, so equivalent times group together.
+        """
+        deleted = self.normalize_appointment_times()[1]
+        pipeline = [
+            {"$sort": {"_id": 1}},
+            {
+                "$group": {
+                    "_id": {field: f"${field}" for field in APPOINTMENT_KEY_FIELDS},
+                    "ids": {"$push": "$_id"},
+                    "usernames": {"$push": "$username"},
+                    "count": {"$sum": 1}
+                }
+            },
+            {
+                "$match": {
+                    "count": {"$gt": 1}
+                }
+            }
+        ]
+
+        pending = []
+        changed_users = set()
+        for duplicate in self.appointments.aggregate(pipeline, allowDiskUse=True):
+            # Keep the first entry and delete the rest
+            pending.extend(duplicate["ids"][1:])
+            changed_users.update(username for username in duplicate["usernames"][1:] if username)
+            if len(pending) >= batch_size:
+                deleted += self.appointments.delete_many({"_id": {"$in": pending}}).deleted_count
+                pending = []
+        if pending:
+            deleted += self.appointments.delete_many({"_id": {"$in": pending}}).deleted_count
+        for username in changed_users:
+            self.bump_user_version(username, USER_VERSION_APPOINTMENTS)
+        return deleted
+
+class AsyncMongoRepository:
+    """
+    Non-blocking counterpart of MongoRepository for the async serving mode
+    (async_app.py). Only the operations used on async routes are provided.
+    """
+
+    def __init__(self, db_name=DB_NAME):
+        self.db_name = db_name
+
+    @property
+    def db(self):
+        return get_async_mongo_client()[self.db_name]
+
+    @property
+    def appointments(self):
+        return self.db['appointments']
+
+    @property
+    def slots(self):
+        return self.db['slots']
+
+    @property
+    def user_versions(self):
+        return self.db['user_versions']
+
+    async def bump_user_version(self, username, *parts):
+        """
+        Async version of MongoRepository.bump_user_version.
+        """
+        try:
+            doc = await self.user_versions.find_one_and_update(
+                {'_id': username}, user_version_update(parts),
+                upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except Exception as e:
+            print(f"⚠️ Could not bump version for {username}: {e}")
+            USER_VERSION_CACHE.delete(username)
+            return None
+        version = user_version_from_doc(doc)
+        USER_VERSION_CACHE.set(username, version)
+        return version
+
+    async def get_clinic_schedule(self, clinic):
+        schedule = CLINIC_SCHEDULE_CACHE.get(clinic)
+        if schedule is None:
+            schedule = build_clinic_schedule(await self.db['clinics'].find_one({'name': clinic}, {'slot_times': 1, 'slot_capacity': 1}))
+            CLINIC_SCHEDULE_CACHE.set(clinic, schedule)
+        return schedule
+
+    async def reserve_slot(self, clinic, date, time):
+        """
+        Async version of MongoRepository.reserve_slot.
+        """
+        key = slot_key(clinic, date, time)
+        if (await self.slots.update_one(dict(key, remaining={'$gt': 0}), SLOT_TAKE)).matched_count:
+            return True
+
+        capacity = (await self.get_clinic_schedule(clinic))["capacity"]
+        if capacity <= 0:
+            return False
+        try:
+            await self.slots.insert_one(dict(key, capacity=capacity, booked=1, remaining=capacity - 1))
+            return True
+        except DuplicateKeyError:
+            return (await self.slots.update_one(dict(key, remaining={'$gt': 0}), SLOT_TAKE)).matched_count > 0
+
+    async def release_slot(self, clinic, date, time):
+        await self.slots.update_one(dict(slot_key(clinic, date, time), booked={'$gt': 0}), SLOT_RELEASE)
+
+    async def store_appointment(self, username, name, email, disease, clinic, date, time):
+        """
+        Async version of MongoRepository.store_appointment.
+        """
+        key, update = appointment_upsert(username, name, email, disease, clinic, date, time)
+        if not await self.reserve_slot(clinic, date, time):
+            if await self.appointments.find_one(key, {'_id': 1}):
+                return APPOINTMENT_DUPLICATE, None
+            return APPOINTMENT_SLOT_FULL, None
+
+        try:
+            result = await self.appointments.update_one(key, update, upsert=True)
+        except DuplicateKeyError:
+            await self.release_slot(clinic, date, time)
+            return APPOINTMENT_DUPLICATE, None
+        except Exception:
+            await self.release_slot(clinic, date, time)
+            raise
+        if result.upserted_id is None:
+            await self.release_slot(clinic, date, time)
+            return APPOINTMENT_DUPLICATE, None
+        await self.bump_user_version(username, USER_VERSION_APPOINTMENTS)
+        return APPOINTMENT_CREATED, str(result.upserted_id)
+
+
+repository = MongoRepository()
+async_repository = AsyncMongoRepository()
+
+
+def init_db():
+    """
+    Startup hook: creates indexes once per process. Failures are logged, not raised,
+    so the app can still boot while the database is unreachable.
+    """
+    try:
+        repository.ensure_indexes()
+        return True
+    except Exception as e:
+        print(f"⚠️ MongoDB index setup failed: {e}")
+        return False
 
-    duplicates = list(appointments_collection.aggregate(pipeline))
 
-    for duplicate in duplicates:
-        ids = duplicate["ids"]
-        # Keep the first entry and delete the rest
-        for id_to_delete in ids[1:]:
-            appointments_collection.delete_one({"_id": id_to_delete})
\ No newline at end of file
+# Module-level aliases kept for existing callers.
+register_user = repository.register_user
+authenticate_user = repository.authenticate_user
+update_user_diseases = repository.update_user_diseases
+get_user_profile = repository.get_user_profile
+store_appointment = repository.store_appointment
+update_user_profile = repository.update_user_profile
+get_user_appointments = repository.get_user_appointments
+get_user_appointments_page = repository.get_user_appointments_page
+delete_appointment = repository.delete_appointment
+cleanup_duplicates = repository.cleanup_duplicates
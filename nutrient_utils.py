@@ -0,0 +1,341 @@
+"""
+Nutrient annotation for disease summaries.
+
+A response is split into words once (str.translate + str.split, both in C)
+and intersected with the set of words an alias can start with, so the cost
+of a scan barely grows with the knowledge base. Only the words that are
+present are checked, each with a small anchored pattern. Matches respect
+word boundaries ("Vitamin B1" does not match inside "Vitamin B12"), accept
+"B-12" / "B 12", skip phrases listed under "exclude" ("calcium channel
+blockers" is a drug class, not calcium) and expand lists such as
+"vitamins B6 and B12".
+
+Run `python nutrient_utils.py` for a micro-benchmark against the old
+per-vitamin substring loop, at the current and at larger vocabulary sizes.
+"""
+import re
+import string
+
+# label -> aliases (matched case-insensitively, spaces/hyphens interchangeable), foods and
+# optional "exclude" phrases that start with an alias but do not mean the nutrient
+NUTRIENT_KNOWLEDGE = {
+    "Vitamin A": {
+        "aliases": ["vitamin a", "retinol", "beta carotene"],
+        "foods": ["Carrots", "Spinach", "Sweet potatoes", "Egg yolks", "Liver", "Dairy products"],
+    },
+    "Vitamin B1 (Thiamine)": {
+        "aliases": ["vitamin b1", "thiamine", "thiamin"],
+        "foods": ["Whole grains", "Pork", "Nuts", "Seeds", "Legumes"],
+    },
+    "Vitamin B2 (Riboflavin)": {
+        "aliases": ["vitamin b2", "riboflavin"],
+        "foods": ["Milk", "Eggs", "Green leafy vegetables", "Almonds"],
+    },
+    "Vitamin B3 (Niacin)": {
+        "aliases": ["vitamin b3", "niacin", "niacinamide", "nicotinic acid"],
+        "foods": ["Chicken", "Turkey", "Fish", "Peanuts", "Mushrooms"],
+    },
+    "Vitamin B5 (Pantothenic Acid)": {
+        "aliases": ["vitamin b5", "pantothenic acid"],
+        "foods": ["Avocados", "Sunflower seeds", "Eggs", "Dairy products"],
+    },
+    "Vitamin B6 (Pyridoxine)": {
+        "aliases": ["vitamin b6", "pyridoxine"],
+        "foods": ["Bananas", "Potatoes", "Chicken", "Fish", "Nuts"],
+    },
+    "Vitamin B7 (Biotin)": {
+        "aliases": ["vitamin b7", "biotin"],
+        "foods": ["Eggs", "Almonds", "Whole grains", "Spinach"],
+    },
+    "Vitamin B9 (Folate/Folic Acid)": {
+        "aliases": ["vitamin b9", "folate", "folic acid"],
+        "foods": ["Leafy greens", "Lentils", "Citrus fruits", "Beets"],
+    },
+    "Vitamin B12": {
+        "aliases": ["vitamin b12", "b12", "cobalamin", "cyanocobalamin", "methylcobalamin"],
+        "foods": ["Meat", "Fish", "Dairy products", "Eggs", "Fortified cereals"],
+    },
+    "Vitamin C": {
+        "aliases": ["vitamin c", "ascorbic acid"],
+        "foods": ["Oranges", "Strawberries", "Bell peppers", "Broccoli", "Kiwi"],
+    },
+    "Vitamin D": {
+        "aliases": ["vitamin d", "vitamin d2", "vitamin d3", "cholecalciferol", "calciferol"],
+        "foods": ["Salmon", "Egg yolks", "Mushrooms", "Fortified milk"],
+    },
+    "Vitamin E": {
+        "aliases": ["vitamin e", "tocopherol"],
+        "foods": ["Almonds", "Sunflower seeds", "Spinach", "Avocado"],
+    },
+    "Vitamin K": {
+        "aliases": ["vitamin k", "vitamin k1", "vitamin k2", "phylloquinone"],
+        "exclude": ["vitamin k antagonist"],
+        "foods": ["Kale", "Spinach", "Broccoli", "Brussels sprouts"],
+    },
+    "Iron": {
+        "aliases": ["iron", "ferritin"],
+        "foods": ["Red meat", "Lentils", "Spinach", "Tofu", "Pumpkin seeds"],
+    },
+    "Calcium": {
+        "aliases": ["calcium"],
+        "exclude": ["calcium channel"],
+        "foods": ["Milk", "Yogurt", "Cheese", "Sardines", "Fortified plant milks"],
+    },
+    "Magnesium": {
+        "aliases": ["magnesium"],
+        "foods": ["Pumpkin seeds", "Almonds", "Spinach", "Black beans", "Dark chocolate"],
+    },
+    "Zinc": {
+        "aliases": ["zinc"],
+        "exclude": ["zinc oxide"],
+        "foods": ["Oysters", "Beef", "Pumpkin seeds", "Chickpeas", "Cashews"],
+    },
+    "Potassium": {
+        "aliases": ["potassium"],
+        "exclude": ["potassium sparing"],
+        "foods": ["Bananas", "Potatoes", "Beans", "Spinach", "Coconut water"],
+    },
+    "Iodine": {
+        "aliases": ["iodine"],
+        "foods": ["Iodized salt", "Seaweed", "Fish", "Dairy products", "Eggs"],
+    },
+    "Selenium": {
+        "aliases": ["selenium"],
+        "foods": ["Brazil nuts", "Tuna", "Eggs", "Sunflower seeds", "Brown rice"],
+    },
+    "Omega-3 Fatty Acids": {
+        "aliases": ["omega 3", "omega 3 fatty acids", "fish oil"],
+        "foods": ["Salmon", "Sardines", "Walnuts", "Flaxseeds", "Chia seeds"],
+    },
+    "Fiber": {
+        "aliases": ["fiber", "fibre", "dietary fiber", "dietary fibre"],
+        "foods": ["Oats", "Lentils", "Apples", "Whole grains", "Vegetables"],
+    },
+}
+
+# Longest match (or excluded phrase) that can still be in progress at a chunk boundary
+_MAX_CARRY = 128
+# Streamed text is buffered to at least this many characters before a scan
+_SCAN_BATCH = 512
+
+# Punctuation becomes a word break, so "b-12," splits into "b" and "12"
+_WORD_BREAKS = str.maketrans({char: " " for char in string.punctuation})
+_LIST_ITEM = r"[a-k](?:[\s-]?\d{1,2})?"
+
+
+def _alias_key(text):
+    return re.sub(r"[\s-]+", " ", text.lower()).strip()
+
+
+def _alias_pattern(alias):
+    # Words may be joined by spaces or hyphens, and a letter may be split from
+    # its number: "vitamin b12" also matches "vitamin-b 12" and "vitamin b-12"
+    words = (re.sub(r"([a-z])(\d)", r"\1[\\s-]?\2", re.escape(word)) for word in alias.split(" "))
+    return r"[\s-]+".join(words)
+
+
+def _triggers(alias):
+    """
+    Words of a text that can start `alias`: its first word, and for "b12"
+    also "b", since "b-12" is split into two words.
+    """
+    first = alias.split(" ")[0]
+    letters = re.match(r"[a-z]+(?=\d)", first)
+    return {first, letters.group(0)} if letters else {first}
+
+
+class NutrientMatcher:
+    """
+    Finds the nutrients mentioned in a text: a set intersection picks the
+    alias words present, then one precompiled pattern per word checks them.
+    """
+
+    def __init__(self, knowledge=NUTRIENT_KNOWLEDGE):
+        self.knowledge = knowledge
+        self.labels = list(knowledge)
+        self._order = {label: i for i, label in enumerate(self.labels)}
+        self._aliases = {}
+        excluded = set()
+        for label, entry in knowledge.items():
+            for alias in entry["aliases"]:
+                self._aliases[_alias_key(alias)] = label
+            excluded.update(_alias_key(phrase) for phrase in entry.get("exclude", []))
+
+        # trigger word -> phrases that start with it, longest first so the
+        # alternation prefers "vitamin b12" over "vitamin b1" and an excluded
+        # "calcium channel" over "calcium"
+        phrases = {}
+        for phrase in [*self._aliases, *excluded]:
+            for trigger in _triggers(phrase):
+                phrases.setdefault(trigger, []).append(phrase)
+        phrases.setdefault("vitamins", [])
+
+        self._groups = {}
+        self._patterns = {}
+        for trigger, group in phrases.items():
+            branches = []
+            if trigger == "vitamins":
+                branches.append(
+                    r"(?P<list>vitamins[\s-]+" + _LIST_ITEM + r"(?:\s*(?:,|&|/|\band\b|\bor\b)\s*(?:and\s+)?"
+                    + _LIST_ITEM + r"){1,8}(?!\w))"
+                )
+            for phrase in sorted(group, key=len, reverse=True):
+                name = f"p{len(self._groups)}"
+                # An excluded phrase is a prefix ("calcium channel" covers "calcium channels")
+                # and maps to no label; an alias must end at a word boundary
+                self._groups[name] = self._aliases.get(phrase)
+                tail = "" if phrase in excluded else r"(?!\w)"
+                branches.append(f"(?P<{name}>{_alias_pattern(phrase)}{tail})")
+            self._patterns[trigger] = re.compile("|".join(branches))
+        self._triggers = frozenset(self._patterns)
+        self._list_item = re.compile(r"(?<!\w)([a-k])(?:[\s-]?(\d{1,2}))?(?!\w)")
+
+    def _labels_for(self, match):
+        if match.lastgroup != "list":
+            label = self._groups[match.lastgroup]
+            return [label] if label else []
+        items = self._list_item.findall(match.group("list")[len("vitamins"):])
+        labels = (self._aliases.get(f"vitamin {letter}{number}") for letter, number in items)
+        return [label for label in labels if label]
+
+    def _collect(self, lowered, found, end=None):
+        """
+        Adds labels of matches starting before `end` (by then the text holds
+        enough of them to tell "Vitamin B1" from "Vitamin B12"). Returns where
+        the first match that runs past `end` starts, so it is rescanned whole
+        with the next chunk, or None.
+        """
+        pending = None
+        for trigger in self._triggers.intersection(lowered.translate(_WORD_BREAKS).split()):
+            pattern = self._patterns[trigger]
+            pos = lowered.find(trigger)
+            while pos != -1 and (end is None or pos < end):
+                # Only at the start of a word: "iron" never fires inside "environment"
+                if not (pos and lowered[pos - 1].isalnum()):
+                    match = pattern.match(lowered, pos)
+                    if match:
+                        found.update(self._labels_for(match))
+                        if end is not None and match.end() > end and (pending is None or pos < pending):
+                            pending = pos
+                pos = lowered.find(trigger, pos + 1)
+        return pending
+
+    def find(self, text):
+        """
+        Returns the nutrient labels mentioned in `text`, in knowledge-base order.
+        """
+        found = set()
+        self._collect((text or "").lower(), found)
+        return sorted(found, key=self._order.__getitem__)
+
+    def scanner(self):
+        return NutrientScanner(self)
+
+    def food_suggestions(self, labels):
+        return [(label, self.knowledge[label]["foods"]) for label in labels]
+
+
+class NutrientScanner:
+    """
+    Incremental matcher for streamed text: feed() each chunk as it arrives and
+    call finish() at the end. Only a short tail is rescanned across chunks.
+    """
+
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self._found = set()
+        self._tail = ""
+
+    def feed(self, chunk):
+        text = self._tail + chunk.lower()
+        if len(text) < _MAX_CARRY + _SCAN_BATCH:
+            self._tail = text
+            return
+        # Matches starting before the cut are final; rescan from the start of its word next time
+        cut = len(text) - _MAX_CARRY
+        while cut and text[cut - 1].isalnum():
+            cut -= 1
+        pending = self.matcher._collect(text, self._found, end=cut)
+        self._tail = text[min(cut, pending) if pending is not None else cut:]
+
+    def finish(self):
+        self.matcher._collect(self._tail, self._found)
+        self._tail = ""
+        return sorted(self._found, key=self.matcher._order.__getitem__)
+
+
+NUTRIENT_MATCHER = NutrientMatcher()
+
+
+def _legacy_find(text, knowledge=NUTRIENT_KNOWLEDGE):
+    # The per-vitamin substring loop this module replaced, kept for the benchmark
+    lowered = text.lower()
+    return [label for label in knowledge if label.lower() in lowered]
+
+
+def _alias_loop_find(text, knowledge=NUTRIENT_KNOWLEDGE):
+    # The same loop extended to every alias, still without word boundaries
+    lowered = text.lower()
+    return [label for label, entry in knowledge.items() if any(alias in lowered for alias in entry["aliases"])]
+
+
+def _scaled_knowledge(scale, rng):
+    # The real knowledge base plus made-up nutrients, to see how a scan grows with the vocabulary
+    knowledge = dict(NUTRIENT_KNOWLEDGE)
+    letters = "bcdfghjklmnpqrstvwxz"
+    while len(knowledge) < scale * len(NUTRIENT_KNOWLEDGE):
+        names = ["".join(rng.choice(letters) + rng.choice("aeiou") for _ in range(4)) for _ in range(2)]
+        knowledge[names[0].title()] = {"aliases": [names[0], f"{names[1]} {names[0]}"], "foods": []}
+    return knowledge
+
+
+def main():
+    import argparse
+    import random
+    import timeit
+
+    parser = argparse.ArgumentParser(description="Micro-benchmark nutrient annotation.")
+    parser.add_argument("--chars", type=int, default=4000, help="approximate response length")
+    parser.add_argument("--number", type=int, default=2000, help="iterations per measurement")
+    parser.add_argument("--chunk", type=int, default=40, help="stream chunk size in characters")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 50],
+                        help="knowledge base sizes to compare, as multiples of the real one")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    filler = ("Patients often report fatigue, thirst and blurred vision. Treatment combines lifestyle "
+              "changes with medication. ").split()
+    mentions = ["Vitamin B12", "vitamin D", "folic acid", "thiamine", "iron", "vitamins B6 and B12", "magnesium"]
+    words = []
+    while sum(len(w) + 1 for w in words) < args.chars:
+        words.append(rng.choice(mentions) if rng.random() < 0.02 else rng.choice(filler))
+    text = " ".join(words)
+    chunks = [text[i:i + args.chunk] for i in range(0, len(text), args.chunk)]
+
+    def streamed():
+        scanner = NUTRIENT_MATCHER.scanner()
+        for chunk in chunks:
+            scanner.feed(chunk)
+        return scanner.finish()
+
+    def per_response(fn):
+        return min(timeit.repeat(fn, number=args.number, repeat=3)) / args.number * 1e6
+
+    assert streamed() == NUTRIENT_MATCHER.find(text)
+    print(f"text: {len(text)} chars")
+    print(f"legacy loop matches:   {_legacy_find(text)}")
+    print(f"matcher matches:       {NUTRIENT_MATCHER.find(text)}")
+    print(f"streamed ({len(chunks)} chunks): {per_response(streamed):.1f} µs per response")
+    print(f"{'nutrients':>9} {'aliases':>8} {'legacy loop':>12} {'alias loop':>12} {'matcher':>12}   (µs per response)")
+    for scale in args.scales:
+        knowledge = _scaled_knowledge(scale, rng)
+        matcher = NutrientMatcher(knowledge)
+        assert matcher.find(text) == NUTRIENT_MATCHER.find(text)
+        times = [per_response(fn) for fn in (lambda: _legacy_find(text, knowledge),
+                                              lambda: _alias_loop_find(text, knowledge),
+                                              lambda: matcher.find(text))]
+        print(f"{len(knowledge):>9} {len(matcher._aliases):>8} " + " ".join(f"{t:>12.1f}" for t in times))
+
+
+if __name__ == "__main__":
+    main()
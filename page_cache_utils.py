@@ -0,0 +1,109 @@
+"""
+Conditional GETs and rendered-fragment caching for per-user pages.
+
+Pages are versioned by the user's change counters (mongo_utils user versions,
+bumped on every profile or appointment write). The ETag is derived from those
+counters, so an unchanged page is answered with 304 before any query or
+template render. Expensive fragments (the appointment tables) are cached per
+appointments version; a bump simply makes the old entry unreachable.
+"""
+import hashlib
+import os
+from datetime import timezone
+
+from cache_utils import TTLCache
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+FRAGMENT_CACHE = TTLCache(
+    maxsize=int(os.getenv("FRAGMENT_CACHE_SIZE", "2048")),
+    ttl=int(os.getenv("FRAGMENT_CACHE_TTL", "600"))
+)
+
+_template_versions = {}
+
+
+def template_version(*names):
+    """
+    Hash of the given templates' sources, so a deploy that changes the markup
+    also changes every ETag built from it.
+    """
+    key = tuple(names)
+    version = _template_versions.get(key)
+    if version is None:
+        digest = hashlib.sha256()
+        for name in names:
+            with open(os.path.join(TEMPLATE_DIR, name), "rb") as f:
+                digest.update(f.read())
+        version = _template_versions[key] = digest.hexdigest()[:12]
+    return version
+
+
+def user_page_etag(username, version, parts, templates=()):
+    """
+    Weak ETag for a user's page built from `parts` of their data.
+    """
+    from asset_utils import ASSET_MANIFEST
+
+    # Asset URLs are part of the markup: a rebuild with new hashes changes the page
+    raw = "|".join([username, *(f"{part}={version[part]}" for part in parts),
+                    template_version(*templates), ASSET_MANIFEST.version])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:20]
+
+
+def last_modified(version):
+    updated_at = version.get("updated_at")
+    if updated_at is None:
+        return None
+    # Stored as naive UTC; HTTP dates have second resolution
+    return updated_at.replace(tzinfo=timezone.utc, microsecond=0)
+
+
+def is_not_modified(etag, modified_at):
+    from flask import request
+
+    # If-None-Match wins over If-Modified-Since when both are sent (RFC 9110)
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if modified_at is not None and request.if_modified_since is not None:
+        return modified_at <= request.if_modified_since
+    return False
+
+
+def conditional_user_page(username, version, parts, render, templates=()):
+    """
+    Returns 304 if the client's copy is current, otherwise the response of
+    `render()`, with the validators set either way. Responses are private and
+    revalidated on every use.
+    """
+    from flask import make_response
+
+    etag = user_page_etag(username, version, parts, templates)
+    modified_at = last_modified(version)
+    if is_not_modified(etag, modified_at):
+        response = make_response("", 304)
+    else:
+        response = make_response(render())
+    response.set_etag(etag, weak=True)
+    if modified_at is not None:
+        response.last_modified = modified_at
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add("Cookie")
+    return response
+
+
+def cached_fragment(name, key, render):
+    """
+    Returns the cached fragment `name` for `key`, rendering it on a miss.
+    """
+    cache_key = (name, *key)
+    fragment = FRAGMENT_CACHE.get(cache_key)
+    if fragment is None:
+        fragment = render()
+        FRAGMENT_CACHE.set(cache_key, fragment)
+    return fragment
+
+
+def get_fragment_cache_stats():
+    return FRAGMENT_CACHE.stats()
@@ -0,0 +1,273 @@
+import heapq
+import math
+import os
+import re
+from bisect import bisect_left, bisect_right
+
+from cache_utils import TTLCache
+
+DISEASE_VOCAB_FILE = os.getenv("DISEASE_VOCAB_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "disease_vocab.txt"))
+# Minimum trigram (Dice) similarity for a fuzzy match to be suggested
+DISEASE_MATCH_THRESHOLD = float(os.getenv("DISEASE_MATCH_THRESHOLD", "0.6"))
+# A query is only rewritten to a known name when it is a near-exact typo of it:
+# at most this many edits away, and only for queries of at least this length.
+# Anything looser is offered as a "did you mean" suggestion instead.
+DISEASE_AUTOCORRECT_MAX_EDITS = int(os.getenv("DISEASE_AUTOCORRECT_MAX_EDITS", "1"))
+DISEASE_AUTOCORRECT_MIN_LENGTH = int(os.getenv("DISEASE_AUTOCORRECT_MIN_LENGTH", "5"))
+
+
+def normalize_query(text):
+    """
+    Lowercases, turns punctuation into spaces and collapses whitespace.
+    """
+    return " ".join(re.sub(r"[^\w]+", " ", (text or "").lower()).split())
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def edit_distance(a, b, limit=None):
+    """
+    Optimal string alignment distance (insertions, deletions, substitutions and
+    adjacent transpositions). Stops early and returns limit + 1 once the
+    distance is known to exceed `limit`.
+    """
+    if limit is not None and abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if limit is not None and min(current) > limit:
+            return limit + 1
+    return current[-1]
+
+
+def load_disease_vocabulary(path=DISEASE_VOCAB_FILE):
+    """
+    Reads `Canonical|alias|alias` lines (blank lines and # comments are skipped).
+    Returns a list of (canonical, aliases) pairs.
+    """
+    entries = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                names = [name.strip() for name in line.split("|") if name.strip()]
+                entries.append((names[0], names[1:]))
+    except OSError as e:
+        print(f"⚠️ Disease vocabulary not loaded from {path}: {e}")
+    return entries
+
+
+class DiseaseIndex:
+    """
+    In-memory disease vocabulary. Exact and alias lookups are dict hits, typos
+    are matched through a trigram inverted index, and autocomplete uses sorted
+    prefix arrays (whole names first, then later words of a name).
+    """
+
+    def __init__(self, entries=(), threshold=DISEASE_MATCH_THRESHOLD,
+                 max_edits=DISEASE_AUTOCORRECT_MAX_EDITS, min_length=DISEASE_AUTOCORRECT_MIN_LENGTH):
+        self.threshold = threshold
+        self.max_edits = max_edits
+        self.min_length = min_length
+        self._exact = {}
+        self._canonical_terms = {}
+        self._terms = []
+        self._term_grams = []
+        self._term_canonical = []
+        self._postings = {}
+        self._names = []
+        self._words = []
+        self._matches = TTLCache(maxsize=4096, ttl=24 * 3600)
+        for canonical, aliases in entries:
+            self._add(canonical, aliases)
+        self._finalize()
+
+    def __len__(self):
+        return len(set(self._term_canonical))
+
+    def _add(self, canonical, aliases=()):
+        for name in (canonical, *aliases):
+            key = normalize_query(name)
+            if not key or key in self._exact:
+                continue
+            self._exact[key] = canonical
+            self._canonical_terms.setdefault(canonical, []).append(key)
+
+            term_id = len(self._terms)
+            grams = trigrams(key)
+            self._terms.append(key)
+            self._term_grams.append(grams)
+            self._term_canonical.append(canonical)
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(term_id)
+
+            self._names.append((key, canonical))
+            words = key.split(" ")
+            for i in range(1, len(words)):
+                self._words.append((" ".join(words[i:]), canonical))
+
+    def _finalize(self):
+        # Posting lists ordered by term size so fuzzy() can bisect to the
+        # range of sizes that could still reach the threshold
+        sizes = [len(grams) for grams in self._term_grams]
+        for gram, term_ids in self._postings.items():
+            term_ids.sort(key=sizes.__getitem__)
+            self._postings[gram] = (term_ids, [sizes[term_id] for term_id in term_ids])
+        self._names.sort()
+        self._words.sort()
+        self._name_keys = [key for key, _ in self._names]
+        self._word_keys = [key for key, _ in self._words]
+
+    def rebuild(self, entries):
+        """
+        Replaces the vocabulary in place (e.g. after the vocabulary file changed).
+        """
+        fresh = DiseaseIndex(entries, self.threshold, self.max_edits, self.min_length)
+        self.__dict__.update(fresh.__dict__)
+
+    def fuzzy(self, query, limit=1):
+        """
+        Returns up to `limit` (canonical, score) pairs whose trigram Dice
+        similarity to `query` is at least the threshold, best first.
+        """
+        key = normalize_query(query)
+        if not key:
+            return []
+        grams = trigrams(key)
+        size = len(grams)
+        # Short tokens carry meaning trigrams barely see ("hepatitis e" vs "b",
+        # "vitamin d", "type 2"), so they must appear verbatim in a match
+        short = {word for word in key.split(" ") if len(word) <= 2}
+        empty = ((), ())
+        rare = sorted(grams, key=lambda gram: len(self._postings.get(gram, empty)[0]))
+
+        best = {}
+        seen = set()
+        for probed, gram in enumerate(rare):
+            # Once `limit` matches are known, only better ones matter: raise the bar
+            t = self.threshold
+            if len(best) >= limit:
+                t = max(t, heapq.nlargest(limit, best.values())[-1])
+            # Dice >= t needs at least min_shared common trigrams, so a candidate
+            # must contain one of the (size - min_shared + 1) rarest query
+            # trigrams, and its own size must lie in [min_size, max_size]
+            min_shared = max(1, math.ceil(t * size / (2 - t) - 1e-9))
+            if probed > size - min_shared:
+                break
+            min_size = size * t / (2 - t)
+            max_size = size * (2 - t) / t
+
+            term_ids, sizes = self._postings.get(gram, empty)
+            for term_id in term_ids[bisect_left(sizes, min_size):bisect_right(sizes, max_size)]:
+                if term_id in seen:
+                    continue
+                seen.add(term_id)
+                term_grams = self._term_grams[term_id]
+                score = 2 * len(grams & term_grams) / (size + len(term_grams))
+                if score < self.threshold:
+                    continue
+                if short and not short.issubset(self._terms[term_id].split(" ")):
+                    continue
+                canonical = self._term_canonical[term_id]
+                if score > best.get(canonical, 0):
+                    best[canonical] = score
+        ranked = sorted(best.items(), key=lambda item: (-item[1], len(item[0]), item[0]))
+        return ranked[:limit]
+
+    def canonical(self, query):
+        """
+        Maps a free-text query to its canonical disease name, or None unless it
+        is a known name or alias, or a near-exact typo of one. Similar-looking
+        names are often different diseases ("hypotension"), so anything looser
+        is left to did_you_mean().
+        """
+        key = normalize_query(query)
+        if not key:
+            return None
+        match = self._exact.get(key)
+        if match is not None:
+            return match
+        match = self._matches.get(key)
+        if match is None:
+            # "" remembers a miss so unknown queries are not rescored every time
+            match = self._autocorrect(key) or ""
+            self._matches.set(key, match)
+        return match or None
+
+    def _autocorrect(self, key):
+        if len(key) < self.min_length:
+            return None
+        for canonical, _ in self.fuzzy(key, limit=3):
+            for term in self._canonical_terms[canonical]:
+                if edit_distance(key, term, self.max_edits) <= self.max_edits:
+                    return canonical
+        return None
+
+    def did_you_mean(self, query):
+        """
+        Closest known disease for a query canonical() does not resolve, to be
+        offered to the user rather than substituted; None otherwise.
+        """
+        if not normalize_query(query) or self.canonical(query) is not None:
+            return None
+        ranked = self.fuzzy(query)
+        return ranked[0][0] if ranked else None
+
+    def _prefix(self, keys, pairs, prefix, found, limit):
+        i = bisect_left(keys, prefix)
+        while i < len(keys) and len(found) < limit and keys[i].startswith(prefix):
+            canonical = pairs[i][1]
+            if canonical not in found:
+                found.append(canonical)
+            i += 1
+
+    def suggest(self, prefix, limit=8):
+        """
+        Autocomplete: canonical names whose name or alias starts with `prefix`,
+        then names with a later word starting with it; typo-tolerant matches
+        are only used when nothing matches as a prefix.
+        """
+        key = normalize_query(prefix)
+        if not key:
+            return []
+        found = []
+        self._prefix(self._name_keys, self._names, key, found, limit)
+        self._prefix(self._word_keys, self._words, key, found, limit)
+        if not found and len(key) >= 4:
+            for canonical, _ in self.fuzzy(key, limit):
+                if canonical not in found and len(found) < limit:
+                    found.append(canonical)
+        return found
+
+
+DISEASE_INDEX = DiseaseIndex(load_disease_vocabulary())
+
+
+def canonical_disease_name(disease_name):
+    """
+    Canonical vocabulary name for a query, or the cleaned-up query itself when
+    it is not a known disease.
+    """
+    return DISEASE_INDEX.canonical(disease_name) or " ".join((disease_name or "").split())
+
+
+def disease_suggestion(disease_name):
+    """
+    "Did you mean" name for a query that was not recognised, or None.
+    """
+    return DISEASE_INDEX.did_you_mean(disease_name)
+
+
+def suggest_diseases(prefix, limit=8):
+    return DISEASE_INDEX.suggest(prefix, limit)
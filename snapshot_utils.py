@@ -0,0 +1,244 @@
+"""
+Precomputed disease summary snapshot.
+
+The snapshot is a single file: an 8-byte magic, a format/header-length prefix,
+a JSON header mapping cache keys to (offset, length, generated_at), then the
+zlib-compressed summaries back to back. The app memory-maps it on first use and
+only decompresses the entries it is asked for.
+
+Build or refresh it with:
+    python snapshot_utils.py --top 50 --output disease_snapshot.bin
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+if __name__ == "__main__":
+    # Run as a script: load .env before the settings below are read
+    from dotenv import load_dotenv
+    load_dotenv()
+
+SNAPSHOT_MAGIC = b"MEDISNAP"
+SNAPSHOT_FORMAT = 1
+_PREFIX = struct.Struct(">HI")
+
+DISEASE_SNAPSHOT_FILE = os.getenv("DISEASE_SNAPSHOT_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "disease_snapshot.bin"))
+# Entries older than this are still served, but refreshed in the background
+SNAPSHOT_MAX_AGE = int(os.getenv("SNAPSHOT_MAX_AGE", str(7 * 24 * 3600)))
+
+
+def write_snapshot(path, entries, prompt_version):
+    """
+    Writes {key: (summary, generated_at)} atomically to `path`.
+    """
+    index = {}
+    blobs = []
+    offset = 0
+    for key, (value, generated_at) in sorted(entries.items()):
+        blob = zlib.compress(value.encode("utf-8"), 9)
+        index[key] = [offset, len(blob), generated_at]
+        blobs.append(blob)
+        offset += len(blob)
+
+    header = json.dumps({
+        "prompt_version": prompt_version,
+        "created_at": time.time(),
+        "entries": index,
+    }, separators=(",", ":")).encode("utf-8")
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(_PREFIX.pack(SNAPSHOT_FORMAT, len(header)))
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp_path, path)
+
+
+class DiseaseSnapshot:
+    """
+    Read-only view of a snapshot file, loaded on first access. A missing file,
+    an unknown format or a different prompt version leaves the snapshot empty.
+    """
+
+    def __init__(self, path=DISEASE_SNAPSHOT_FILE, prompt_version=None, max_age=SNAPSHOT_MAX_AGE):
+        self.path = path
+        self.prompt_version = prompt_version
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._map = None
+        self._entries = {}
+        self._data_start = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            try:
+                with open(self.path, "rb") as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError) as e:
+                # ValueError: empty file
+                if not isinstance(e, FileNotFoundError):
+                    print(f"⚠️ Disease snapshot {self.path} not loaded: {e}")
+                return
+
+            try:
+                if mapped[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+                    raise ValueError("not a disease snapshot")
+                start = len(SNAPSHOT_MAGIC)
+                version, header_len = _PREFIX.unpack_from(mapped, start)
+                if version != SNAPSHOT_FORMAT:
+                    raise ValueError(f"unsupported format {version}")
+                start += _PREFIX.size
+                header = json.loads(mapped[start:start + header_len])
+                if self.prompt_version is not None and header.get("prompt_version") != self.prompt_version:
+                    raise ValueError(f"built for prompt version {header.get('prompt_version')}, expected {self.prompt_version}")
+            except (ValueError, struct.error) as e:
+                print(f"⚠️ Ignoring disease snapshot {self.path}: {e}")
+                mapped.close()
+                return
+
+            self._map = mapped
+            self._entries = header["entries"]
+            self._data_start = start + header_len
+
+    def get(self, key):
+        """
+        Returns {"value", "generated_at", "fresh"} for `key`, or None.
+        """
+        if not self._loaded:
+            self.load()
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        offset, length, generated_at = entry
+        start = self._data_start + offset
+        value = zlib.decompress(self._map[start:start + length]).decode("utf-8")
+        fresh = time.time() - generated_at < self.max_age
+        if fresh:
+            self.hits += 1
+        else:
+            self.stale_hits += 1
+        return {"value": value, "generated_at": generated_at, "fresh": fresh}
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+            self._map = None
+            self._entries = {}
+
+    def keys(self):
+        if not self._loaded:
+            self.load()
+        return list(self._entries)
+
+    def __len__(self):
+        if not self._loaded:
+            self.load()
+        return len(self._entries)
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+        }
+
+
+def read_disease_list(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def build_snapshot(diseases, output, workers=4, force=False):
+    """
+    Generates summaries for `diseases` and writes the snapshot. Fresh entries of
+    an existing snapshot at `output` are reused unless `force` is set.
+    Returns (generated, reused, failed) counts.
+    """
+    from api_utils import _generate_medical_info, medical_info_cache_key, PROMPT_VERSION
+    from fetch_utils import PRIORITY_BACKGROUND
+    from search_utils import canonical_disease_name
+
+    previous = DiseaseSnapshot(output, PROMPT_VERSION)
+    entries = {}
+    stale = {}
+    todo = []
+    for disease in dict.fromkeys(canonical_disease_name(d) for d in diseases):
+        key = medical_info_cache_key(disease)
+        existing = None if force else previous.get(key)
+        if existing is not None and existing["fresh"]:
+            entries[key] = (existing["value"], existing["generated_at"])
+        else:
+            todo.append((key, disease))
+            if existing is not None:
+                # Kept if regeneration fails: a stale summary beats none
+                stale[key] = (existing["value"], existing["generated_at"])
+    reused = len(entries)
+
+    def generate(item):
+        key, disease = item
+        return key, disease, _generate_medical_info(disease, PRIORITY_BACKGROUND)
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for key, disease, value in pool.map(generate, todo):
+            if not value or value.startswith("❌"):
+                failed += 1
+                print(f"⚠️ Skipping {disease}: {value}")
+                if key in stale:
+                    entries[key] = stale[key]
+                continue
+            entries[key] = (value, time.time())
+            print(f"✅ {disease}")
+
+    previous.close()
+    write_snapshot(output, entries, PROMPT_VERSION)
+    return len(todo) - failed, reused, failed
+
+
+def main():
+    from search_utils import load_disease_vocabulary
+
+    parser = argparse.ArgumentParser(description="Pre-generate disease summaries into a snapshot file.")
+    parser.add_argument("--top", type=int, default=50, help="number of diseases to include")
+    parser.add_argument("--diseases-file", help="one disease per line, most requested first "
+                                                "(default: canonical names from the disease vocabulary)")
+    parser.add_argument("--output", default=DISEASE_SNAPSHOT_FILE)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--force", action="store_true", help="regenerate entries that are still fresh")
+    args = parser.parse_args()
+
+    if args.diseases_file:
+        diseases = read_disease_list(args.diseases_file)
+    else:
+        diseases = [canonical for canonical, _ in load_disease_vocabulary()]
+    diseases = diseases[:args.top]
+    if not diseases:
+        sys.exit("No diseases to snapshot.")
+
+    generated, reused, failed = build_snapshot(diseases, args.output, workers=args.workers, force=args.force)
+    print(f"Snapshot written to {args.output}: {generated} generated, {reused} reused, {failed} failed.")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -111,7 +111,6 @@ function handleBookingResponse(userInput) {
         bookingStep = 5;
     } else if (bookingStep === 5) {
         bookingData.date = convertToDate(userInput);
-        appendMessage("Chatbot", "Select a time slot:");
         showTimeOptions();  // 🔴 Error Happens Here
         bookingStep = 6;
     }
@@ -123,9 +122,6 @@ function handleBookingResponse(userInput) {
 }
 function showTimeOptions() {
     let times = ["09:00 AM", "10:00 AM", "11:00 AM", "02:00 PM", "03:00 PM", "04:00 PM", "06:00 PM", "07:00 PM"];
-    let buttons = times.map(time => 
-        `<button class="btn btn-sm btn-success m-1" onclick="handleBookingResponse('${time}')">${time}</button>`
-    ).join("");
 
     // Check if chat container exists
     const chatContainer = document.getElementById("chat-messages");
@@ -134,7 +130,23 @@ function showTimeOptions() {
         return;
     }
 
-    appendMessage("Chatbot", `Select a time slot:<br> ${buttons}`);
+    const renderTimes = slotTimes => {
+        if (slotTimes.length === 0) {
+            appendMessage("Chatbot", "❌ No free slots left on that day. Type another time or start over.");
+            return;
+        }
+        let buttons = slotTimes.map(time =>
+            `<button class="btn btn-sm btn-success m-1" onclick="handleBookingResponse('${time}')">${time}</button>`
+        ).join("");
+        appendMessage("Chatbot", `Select a time slot:<br> ${buttons}`);
+    };
+
+    // Only offer times the clinic still has room for
+    const params = new URLSearchParams({ clinic: bookingData.clinic, start: bookingData.date });
+    fetch(`/free_slots?${params}`)
+        .then(response => response.ok ? response.json() : Promise.reject(response.status))
+        .then(data => renderTimes(data.slots.map(slot => slot.time)))
+        .catch(() => renderTimes(times));
 }
 
 
@@ -184,8 +196,13 @@ function completeBooking() {
         headers: { "Content-Type": "application/x-www-form-urlencoded" },
         body: new URLSearchParams(bookingData),
     })
-    .then(response => response.json())
-    .then(data => {
+    .then(response => response.json().then(data => ({ ok: response.ok, data })))
+    .then(({ ok, data }) => {
+        if (!ok) {
+            appendMessage("Chatbot", `⚠️ ${data.message}`);
+            showInitialOptions();
+            return;
+        }
         appendMessage("Chatbot", `✅ Appointment confirmed!`);
         showAppointmentModal();  // 🔴 Error Happens Here
         showInitialOptions();
@@ -232,23 +249,86 @@ function startDiseaseLookup() {
     bookingStep = -1;  // Set step to handle disease lookup
 }
 
+// ✅ Read a Server-Sent Events response and call onEvent(event, data) per event
+function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+
+    function dispatch(block) {
+        let event = "message";
+        let data = "";
+        block.split("\n").forEach(line => {
+            if (line.startsWith("event:")) {
+                event = line.slice(6).trim();
+            } else if (line.startsWith("data:")) {
+                data += line.slice(5).trim();
+            }
+        });
+        if (data) {
+            onEvent(event, JSON.parse(data));
+        }
+    }
+
+    function pump() {
+        return reader.read().then(({ done, value }) => {
+            if (done) {
+                if (buffer.trim()) dispatch(buffer);
+                return;
+            }
+            buffer += decoder.decode(value, { stream: true });
+            let boundary;
+            while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+                dispatch(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+            }
+            return pump();
+        });
+    }
+
+    return pump();
+}
+
+// ✅ Render streamed disease info into a chat bubble as tokens arrive
+function streamDiseaseInto(bubble, response) {
+    let text = "";
+    return readEventStream(response, (event, data) => {
+        if (event === "chunk" || event === "diet") {
+            text += data.text;
+            bubble.innerText = text;
+        } else if (event === "error") {
+            bubble.innerText = data.text;
+        }
+        const chatMessages = document.getElementById("chat-messages");
+        chatMessages.scrollTop = chatMessages.scrollHeight;
+    });
+}
+
 // ✅ Handle Disease Query and Fetch from Flask API
 function handleDiseaseResponse(userInput) {
     let diseaseData = {
         option: "Know About Diseases",
-        disease_query: userInput
+        disease_query: userInput,
+        stream: "1"
     };
 
     console.log("Sending disease query to Flask:", diseaseData);
 
+    appendMessage("Chatbot", `🩺 <b>Disease Info for ${userInput}:</b><br><span class="disease-stream"></span>`);
+    const bubbles = document.querySelectorAll("#chat-messages .disease-stream");
+    const bubble = bubbles[bubbles.length - 1];
+    bubble.style.whiteSpace = "pre-wrap";
+
     fetch("/chatbot", {
         method: "POST",
-        headers: { "Content-Type": "application/x-www-form-urlencoded" },
+        headers: {
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Accept": "text/event-stream"
+        },
         body: new URLSearchParams(diseaseData),
     })
-    .then(response => response.json())
-    .then(data => {
-        appendMessage("Chatbot", `🩺 <b>Disease Info for ${userInput}:</b><br>${data.response}`);
+    .then(response => streamDiseaseInto(bubble, response))
+    .then(() => {
         showInitialOptions();  // Return to main menu after response
     })
     .catch(error => {
@@ -287,19 +367,95 @@ function handleUserMessage() {
 }
 
 function fetchDiseaseDetails(disease) {
-    fetch(`/get_disease_info?disease=${encodeURIComponent(disease)}`)
-        .then(response => response.json())
-        .then(data => {
-            const chatContainer = document.getElementById("chat-messages");
-            let botMessage = document.createElement("div");
-            botMessage.classList.add("chat-message", "bot-message");
-            botMessage.innerHTML = `<strong>${data.name}</strong><br>
-                <b>Symptoms:</b> ${data.symptoms}<br>
-                <b>Causes:</b> ${data.causes}<br>
-                <b>Treatment:</b> ${data.treatment}`;
-            chatContainer.appendChild(botMessage);
-        })
+    const chatContainer = document.getElementById("chat-messages");
+    let botMessage = document.createElement("div");
+    botMessage.classList.add("chat-message", "bot-message");
+    botMessage.style.whiteSpace = "pre-wrap";
+    chatContainer.appendChild(botMessage);
+
+    fetch(`/get_disease_info?disease=${encodeURIComponent(disease)}&stream=1`, {
+        headers: { "Accept": "text/event-stream" }
+    })
+        .then(response => streamDiseaseInto(botMessage, response))
         .catch(error => {
             console.error("Error fetching disease info:", error);
         });
 }
+
+// ✅ Disease name autocomplete backed by /autocomplete_disease
+function attachDiseaseAutocomplete(input, isActive) {
+    if (!input) return;
+
+    const list = document.createElement("div");
+    list.className = "list-group disease-suggestions";
+    list.style.display = "none";
+    (input.closest(".input-group") || input).insertAdjacentElement("afterend", list);
+
+    const cache = new Map();
+    let timer = null;
+    let latest = "";
+
+    function hide() {
+        list.style.display = "none";
+        list.innerHTML = "";
+    }
+
+    function render(suggestions) {
+        list.innerHTML = "";
+        suggestions.forEach(name => {
+            const item = document.createElement("button");
+            item.type = "button";
+            item.className = "list-group-item list-group-item-action py-1";
+            item.textContent = name;
+            item.addEventListener("mousedown", event => {
+                event.preventDefault();  // keep focus in the input
+                input.value = name;
+                hide();
+                input.focus();
+            });
+            list.appendChild(item);
+        });
+        list.style.display = suggestions.length ? "block" : "none";
+    }
+
+    input.addEventListener("input", () => {
+        clearTimeout(timer);
+        const prefix = input.value.trim().toLowerCase();
+        if (!isActive() || prefix.length < 2) {
+            hide();
+            return;
+        }
+        latest = prefix;
+        if (cache.has(prefix)) {
+            render(cache.get(prefix));
+            return;
+        }
+        timer = setTimeout(() => {
+            fetch(`/autocomplete_disease?q=${encodeURIComponent(prefix)}`)
+                .then(response => response.json())
+                .then(data => {
+                    cache.set(prefix, data.suggestions || []);
+                    // Ignore answers for prefixes the user has already typed past
+                    if (prefix === latest) render(cache.get(prefix));
+                })
+                .catch(error => console.error("Autocomplete failed:", error));
+        }, 120);
+    });
+
+    input.addEventListener("keydown", event => {
+        if (event.key === "Escape" || event.key === "Enter") hide();
+    });
+    input.addEventListener("blur", hide);
+}
+
+function initDiseaseAutocomplete() {
+    // Chat input only suggests while the bot is asking for a disease
+    attachDiseaseAutocomplete(document.getElementById("chat-input"), () => bookingStep === -1 || bookingStep === 3);
+    attachDiseaseAutocomplete(document.getElementById("diseaseInput"), () => true);
+}
+
+if (document.readyState === "loading") {
+    document.addEventListener("DOMContentLoaded", initDiseaseAutocomplete);
+} else {
+    initDiseaseAutocomplete();
+}
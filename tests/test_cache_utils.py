@@ -0,0 +1,104 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cache_utils import SingleFlight, TieredCache, TTLCache
+
+
+class DictStore:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value):
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+def test_concurrent_misses_compute_once():
+    cache = TieredCache(TTLCache(), DictStore())
+    calls = []
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return "summary"
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        futures = [pool.submit(cache.get_or_compute, "diabetes", compute) for _ in range(16)]
+        # Let every caller reach the flight before the leader finishes
+        time.sleep(0.2)
+        release.set()
+        results = [future.result(5) for future in futures]
+
+    assert results == ["summary"] * 16
+    assert len(calls) == 1
+    assert cache.stats()["computes"] == 1
+    assert cache.store.get("diabetes") == "summary"
+
+
+def test_followers_share_the_leaders_error():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise ValueError("upstream down")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(flight.do, "key", fail)
+        started.wait(5)
+        follower = pool.submit(flight.do, "key", lambda: "never called")
+        time.sleep(0.05)
+        release.set()
+        for future in (leader, follower):
+            try:
+                future.result(5)
+            except ValueError as e:
+                assert str(e) == "upstream down"
+            else:
+                raise AssertionError("expected the leader's error")
+
+
+def test_rejected_values_are_returned_but_not_cached():
+    cache = TieredCache(TTLCache())
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return "❌ Error"
+
+    for _ in range(2):
+        assert cache.get_or_compute("flu", compute, should_cache=lambda v: not v.startswith("❌")) == "❌ Error"
+    assert len(calls) == 2
+
+
+def test_store_hit_fills_memory():
+    store = DictStore()
+    store.set("asthma", "cached summary")
+    cache = TieredCache(TTLCache(), store)
+    assert cache.get_or_compute("asthma", lambda: "fresh") == "cached summary"
+    assert cache.memory.peek("asthma") == "cached summary"
+    assert cache.stats()["store_hits"] == 1
+    assert cache.stats()["computes"] == 0
+
+
+def test_ttl_cache_counters_and_expiry():
+    cache = TTLCache(maxsize=2, ttl=0.05)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("c", 3)
+    assert cache.get("a") is None
+    assert cache.get("c") == 3
+    time.sleep(0.06)
+    assert cache.get("c") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["expirations"]) == (1, 2, 1, 1)
+
@@ -0,0 +1,258 @@
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import fetch_utils
+from fetch_utils import (HTTP_SESSION, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, CircuitBreaker, CircuitOpenError,
+                         DeadlineExceeded, RequestScheduler, SchedulerBusy, hedged_fetch)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    /ok/<name> answers {"source": name}, /slow/<seconds>/<name> answers after a
+    delay and /error answers 500.
+    """
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        if parts[0] == "slow":
+            time.sleep(float(parts[1]))
+        status = 500 if parts[0] == "error" else 200
+        body = f'{{"source": "{parts[-1]}"}}'.encode()
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up at its deadline
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def stub_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def upstream(url, started=None):
+    def fetch(timeout):
+        if started is not None:
+            started.append(time.monotonic())
+        response = HTTP_SESSION.get(url, timeout=timeout)
+        response.raise_for_status()
+        return response.json()["source"]
+    return fetch
+
+
+def test_fast_primary_never_starts_the_fallback(stub_url):
+    started = []
+    result = hedged_fetch(upstream(f"{stub_url}/ok/primary"), upstream(f"{stub_url}/ok/fallback", started),
+                          deadline=2, hedge_delay=0.3)
+    assert result == "primary"
+    time.sleep(0.35)
+    assert started == []
+
+
+def test_hedge_fires_only_after_the_delay(stub_url):
+    started = []
+    begin = time.monotonic()
+    result = hedged_fetch(upstream(f"{stub_url}/slow/1.0/primary"), upstream(f"{stub_url}/ok/fallback", started),
+                          deadline=2, hedge_delay=0.2)
+    elapsed = time.monotonic() - begin
+    assert result == "fallback"
+    assert started[0] - begin >= 0.2
+    assert elapsed < 0.8
+
+
+def test_failing_primary_starts_the_fallback_at_once(stub_url):
+    begin = time.monotonic()
+    result = hedged_fetch(upstream(f"{stub_url}/error"), upstream(f"{stub_url}/ok/fallback"),
+                          deadline=2, hedge_delay=1.0)
+    assert result == "fallback"
+    assert time.monotonic() - begin < 0.8
+
+
+def test_deadline_covers_both_upstreams(stub_url):
+    begin = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        hedged_fetch(upstream(f"{stub_url}/slow/1.0/primary"), upstream(f"{stub_url}/slow/1.0/fallback"),
+                     deadline=0.4, hedge_delay=0.1)
+    assert time.monotonic() - begin < 0.8
+
+
+def test_open_breaker_skips_the_primary(stub_url):
+    breaker = CircuitBreaker("stub", failure_threshold=1, cooldown=60)
+    breaker.record_failure()
+    started = []
+    result = hedged_fetch(upstream(f"{stub_url}/ok/primary", started), upstream(f"{stub_url}/ok/fallback"),
+                          deadline=2, hedge_delay=1.0, primary_breaker=breaker)
+    assert result == "fallback"
+    assert started == []
+
+
+def test_rejected_result_is_returned_when_nothing_better_arrives(stub_url):
+    result = hedged_fetch(upstream(f"{stub_url}/ok/primary"), upstream(f"{stub_url}/error"),
+                          deadline=2, hedge_delay=0.1, accept=lambda source: source != "primary")
+    assert result == "primary"
+
+
+class OneWorkerExecutor:
+    """
+    Runs the first submission on a thread and keeps later ones queued, like a
+    saturated pool.
+    """
+
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        if not self.futures:
+            def run():
+                future.set_running_or_notify_cancel()
+                future.set_result(fn(*args))
+            threading.Thread(target=run, daemon=True).start()
+        self.futures.append(future)
+        return future
+
+
+def test_losing_attempt_is_cancelled(monkeypatch):
+    executor = OneWorkerExecutor()
+    monkeypatch.setattr(fetch_utils, "_executor", executor)
+
+    def primary(timeout):
+        time.sleep(0.2)
+        return "primary"
+
+    result = hedged_fetch(primary, lambda timeout: "fallback", deadline=2, hedge_delay=0.05)
+    assert result == "primary"
+    assert len(executor.futures) == 2
+    assert executor.futures[1].cancelled()
+
+
+def test_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker("stub", failure_threshold=2, cooldown=0.1)
+
+    def fail():
+        raise ValueError("down")
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            breaker.call(fail)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: "skipped")
+
+    time.sleep(0.12)
+    assert breaker.state == "half-open"
+    # Only one trial call gets through while half-open
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.call(lambda: "ok") == "ok"
+
+
+def test_failed_trial_reopens_the_breaker():
+    breaker = CircuitBreaker("stub", failure_threshold=1, cooldown=0.1)
+    breaker.record_failure()
+    time.sleep(0.12)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def wait_until(condition, timeout=2.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "condition not reached"
+        time.sleep(0.005)
+
+
+def test_scheduler_serves_higher_priority_first():
+    scheduler = RequestScheduler("stub", max_concurrency=1, requests_per_minute=6000)
+    scheduler.acquire()
+    order = []
+
+    def worker(name, priority):
+        with scheduler.slot(priority):
+            order.append(name)
+
+    threads = [threading.Thread(target=worker, args=("background", PRIORITY_BACKGROUND))]
+    threads[0].start()
+    wait_until(lambda: scheduler.stats()["queued"] == 1)
+    threads.append(threading.Thread(target=worker, args=("interactive", PRIORITY_INTERACTIVE)))
+    threads[1].start()
+    wait_until(lambda: scheduler.stats()["queued"] == 2)
+
+    scheduler.release()
+    for thread in threads:
+        thread.join(2)
+    assert order == ["interactive", "background"]
+    assert scheduler.stats()["running"] == 0
+
+
+def test_scheduler_bounds_concurrency():
+    scheduler = RequestScheduler("stub", max_concurrency=2, requests_per_minute=6000)
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def worker():
+        with scheduler.slot():
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            time.sleep(0.02)
+            with lock:
+                running.pop()
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(2)
+    assert max(peak) == 2
+    assert scheduler.stats()["granted"] == 8
+
+
+def test_full_queue_fails_fast_with_retry_after():
+    scheduler = RequestScheduler("stub", max_concurrency=1, requests_per_minute=6000, max_queue=1)
+    scheduler.acquire()
+    waiter = threading.Thread(target=scheduler.acquire)
+    waiter.start()
+    wait_until(lambda: scheduler.stats()["queued"] == 1)
+
+    begin = time.monotonic()
+    with pytest.raises(SchedulerBusy) as busy:
+        scheduler.acquire()
+    assert time.monotonic() - begin < 0.1
+    assert busy.value.retry_after >= 1
+    assert scheduler.stats()["rejected"] == 1
+
+    scheduler.release()
+    waiter.join(2)
+    scheduler.release()
+
+
+def test_queue_timeout_raises_busy():
+    scheduler = RequestScheduler("stub", max_concurrency=1, requests_per_minute=6000)
+    scheduler.acquire()
+    with pytest.raises(SchedulerBusy):
+        scheduler.acquire(timeout=0.05)
+    stats = scheduler.stats()
+    assert (stats["queued"], stats["timed_out"]) == (0, 1)
+    scheduler.release()
+    assert scheduler.stats()["running"] == 0
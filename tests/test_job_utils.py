@@ -0,0 +1,93 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+
+import job_utils
+import mongo_utils
+from job_utils import send_confirmation
+
+mongomock = pytest.importorskip("mongomock")
+
+DAY = datetime(2030, 1, 15)
+
+
+class FakeSMTP:
+    sent = []
+    fail = False
+    lock = threading.Lock()
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def send_message(self, message):
+        if FakeSMTP.fail:
+            raise OSError("connection refused")
+        with FakeSMTP.lock:
+            FakeSMTP.sent.append(message["To"])
+
+
+@pytest.fixture
+def notifications(monkeypatch):
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(mongo_utils, "_client", client)
+    monkeypatch.setattr(mongo_utils, "_client_pid", os.getpid())
+    monkeypatch.setenv("SMTP_HOST", "smtp.test")
+    monkeypatch.setattr(job_utils.smtplib, "SMTP", FakeSMTP)
+    FakeSMTP.sent = []
+    FakeSMTP.fail = False
+    return client[mongo_utils.DB_NAME]["notifications"]
+
+
+def confirm(appointment_id="65a000000000000000000001"):
+    send_confirmation(appointment_id, "user1", "Patient", "p@example.com", "Flu", "City Clinic", DAY, "10:00 AM")
+
+
+def test_confirmation_is_sent_once(notifications):
+    confirm()
+    confirm()
+    assert FakeSMTP.sent == ["p@example.com"]
+    assert notifications.find_one()["status"] == "sent"
+
+
+def test_concurrent_workers_send_once(notifications):
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda _: confirm(), range(8)))
+    assert FakeSMTP.sent == ["p@example.com"]
+
+
+def test_rebooked_appointment_gets_its_own_confirmation(notifications):
+    confirm("65a000000000000000000001")
+    confirm("65a000000000000000000002")
+    assert len(FakeSMTP.sent) == 2
+
+
+def test_failed_send_is_retried(notifications):
+    FakeSMTP.fail = True
+    with pytest.raises(OSError):
+        confirm()
+    assert notifications.find_one()["status"] == "failed"
+
+    FakeSMTP.fail = False
+    confirm()
+    assert FakeSMTP.sent == ["p@example.com"]
+    assert notifications.find_one()["status"] == "sent"
+
+
+def test_stale_claim_is_taken_over(notifications, monkeypatch):
+    notifications.insert_one({"_id": "confirmation:65a000000000000000000001", "status": "sending",
+                              "claimed_at": datetime(2020, 1, 1)})
+    confirm()
+    assert FakeSMTP.sent == ["p@example.com"]
+
+    notifications.update_one({}, {"$set": {"status": "sending", "claimed_at": datetime.utcnow()}})
+    confirm()
+    assert len(FakeSMTP.sent) == 1
@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+import pytest
+
+from metrics_utils import UPSTREAM_ERRORS, UPSTREAM_LATENCY, timed_stream, timed_stream_async
+
+
+def samples(upstream):
+    series = UPSTREAM_LATENCY._values.get((upstream,))
+    return (series["count"], series["sum"]) if series else (0, 0.0)
+
+
+def errors(upstream):
+    return UPSTREAM_ERRORS._values.get((upstream,), 0)
+
+
+def slow_chunks(n, delay):
+    for i in range(n):
+        time.sleep(delay)
+        yield i
+
+
+def test_stream_times_the_upstream_not_the_consumer():
+    for _ in timed_stream("stub_stream", lambda: slow_chunks(3, 0.01)):
+        time.sleep(0.1)
+    count, total = samples("stub_stream")
+    assert count == 1
+    assert 0.03 <= total < 0.1
+
+
+def test_abandoned_stream_records_nothing():
+    stream = timed_stream("stub_abandoned", lambda: slow_chunks(3, 0.01))
+    next(stream)
+    stream.close()
+    assert samples("stub_abandoned") == (0, 0.0)
+    assert errors("stub_abandoned") == 0
+
+
+def test_failed_stream_counts_an_error():
+    def broken():
+        yield 1
+        raise ConnectionError("reset")
+
+    with pytest.raises(ConnectionError):
+        list(timed_stream("stub_broken", broken))
+    assert samples("stub_broken")[0] == 1
+    assert errors("stub_broken") == 1
+
+
+def test_async_stream_times_the_upstream_not_the_consumer():
+    async def open_stream():
+        async def chunks():
+            for i in range(3):
+                await asyncio.sleep(0.01)
+                yield i
+        return chunks()
+
+    async def consume():
+        async for _ in timed_stream_async("stub_async_stream", open_stream):
+            await asyncio.sleep(0.1)
+
+    asyncio.run(consume())
+    count, total = samples("stub_async_stream")
+    assert count == 1
+    assert 0.03 <= total < 0.1
@@ -0,0 +1,108 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+import mongo_utils
+from mongo_utils import (APPOINTMENT_CREATED, APPOINTMENT_DUPLICATE, APPOINTMENT_SLOT_FULL, CLINIC_SCHEDULE_CACHE,
+                         USER_VERSION_CACHE, MongoRepository, slot_key)
+
+mongomock = pytest.importorskip("mongomock")
+
+DAY = datetime(2030, 1, 15)
+
+
+@pytest.fixture
+def repo(monkeypatch):
+    monkeypatch.setattr(mongo_utils, "_client", mongomock.MongoClient())
+    monkeypatch.setattr(mongo_utils, "_client_pid", os.getpid())
+    CLINIC_SCHEDULE_CACHE.clear()
+    USER_VERSION_CACHE.clear()
+    repo = MongoRepository()
+    repo.ensure_indexes()
+    repo.clinics.insert_one({"name": "City Clinic", "slot_times": ["10:00 AM"], "slot_capacity": 3})
+    return repo
+
+
+def booked(repo, time="10:00 AM"):
+    return repo.slots.find_one(slot_key("City Clinic", DAY, time))["booked"]
+
+
+def test_concurrent_reservations_never_exceed_capacity(repo):
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(lambda _: repo.reserve_slot("City Clinic", DAY, "10:00 AM"), range(40)))
+    assert results.count(True) == 3
+    assert booked(repo) == 3
+    assert repo.slots.count_documents({}) == 1
+
+
+def test_concurrent_bookings_fill_the_slot_once(repo):
+    def book(i):
+        return repo.store_appointment(f"user{i}", f"Patient {i}", f"p{i}@example.com", "Flu", "City Clinic", DAY, "10:00 AM")
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = [status for status, _ in pool.map(book, range(20))]
+    assert results.count(APPOINTMENT_CREATED) == 3
+    assert results.count(APPOINTMENT_SLOT_FULL) == 17
+    assert repo.appointments.count_documents({}) == 3
+    assert booked(repo) == 3
+
+
+def test_duplicate_booking_gives_its_place_back(repo):
+    args = ("user1", "Patient", "p@example.com", "Flu", "City Clinic", DAY, "10:00 AM")
+    status, appointment_id = repo.store_appointment(*args)
+    assert status == APPOINTMENT_CREATED
+    assert repo.appointments.find_one({"_id": ObjectId(appointment_id)})["name"] == "Patient"
+    assert repo.store_appointment(*args) == (APPOINTMENT_DUPLICATE, None)
+    assert booked(repo) == 1
+
+
+def test_released_place_can_be_taken_again(repo):
+    for _ in range(3):
+        assert repo.reserve_slot("City Clinic", DAY, "10:00 AM")
+    assert not repo.reserve_slot("City Clinic", DAY, "10:00 AM")
+    repo.release_slot("City Clinic", DAY, "10:00 AM")
+    assert repo.reserve_slot("City Clinic", DAY, "10:00 AM")
+
+
+def test_equivalent_times_share_one_slot(repo):
+    assert repo.reserve_slot("City Clinic", DAY, "10:00")
+    assert repo.reserve_slot("City Clinic", DAY, "10:00 am")
+    assert booked(repo) == 2
+
+
+def test_profile_fan_out_runs_in_the_request_context(repo, monkeypatch):
+    request_id = ContextVar("request_id", default=None)
+    seen = []
+    get_user_profile = repo.get_user_profile
+
+    def traced(*args):
+        seen.append(request_id.get())
+        return get_user_profile(*args)
+
+    monkeypatch.setattr(repo, "get_user_profile", traced)
+    repo.users.insert_one({"username": "user1", "name": "Patient"})
+    request_id.set("request-1")
+    repo.get_profile_and_appointments("user1")
+    assert seen == ["request-1"]
+
+
+def test_equivalent_times_are_one_booking(repo):
+    args = ("user1", "Patient", "p@example.com", "Flu", "City Clinic", DAY)
+    assert repo.store_appointment(*args, "10:00")[0] == APPOINTMENT_CREATED
+    assert repo.store_appointment(*args, "10:00 am") == (APPOINTMENT_DUPLICATE, None)
+    assert repo.appointments.find_one({})["time"] == "10:00 AM"
+    assert booked(repo) == 1
+
+
+@pytest.mark.parametrize("unique_index", [True, False])
+def test_cleanup_merges_bookings_stored_with_raw_times(repo, unique_index):
+    if not unique_index:
+        repo.appointments.drop_indexes()
+    booking = {"username": "user1", "name": "Patient", "email": "p@example.com", "date": DAY}
+    repo.appointments.insert_many([{**booking, "time": "10:00 AM"}, {**booking, "time": "10:00"}])
+    assert repo.cleanup_duplicates() == 1
+    assert [doc["time"] for doc in repo.appointments.find({})] == ["10:00 AM"]
@@ -0,0 +1,71 @@
+import pytest
+
+from nutrient_utils import NUTRIENT_MATCHER, NutrientMatcher
+
+MENTIONS = [
+    ("Low vitamin B1 causes beriberi.", ["Vitamin B1 (Thiamine)"]),
+    ("Low vitamin B12 causes anemia.", ["Vitamin B12"]),
+    ("Take vitamin B-12 or a B 12 shot.", ["Vitamin B12"]),
+    ("Vitamin B1 and Vitamin B12 both matter.", ["Vitamin B1 (Thiamine)", "Vitamin B12"]),
+    ("Thiamine and folic acid are often low.", ["Vitamin B1 (Thiamine)", "Vitamin B9 (Folate/Folic Acid)"]),
+    ("Cholecalciferol (vitamin D3) supports bones.", ["Vitamin D"]),
+    ("Omega-3 fatty acids from fish oil.", ["Omega-3 Fatty Acids"]),
+    ("Add vitamins B6 and B12 to the diet.", ["Vitamin B6 (Pyridoxine)", "Vitamin B12"]),
+    ("Rich in vitamins A, C and E.", ["Vitamin A", "Vitamin C", "Vitamin E"]),
+    ("Calcium and iron intake should rise.", ["Iron", "Calcium"]),
+]
+
+NON_MENTIONS = [
+    "Calcium channel blockers lower blood pressure.",
+    "Avoid potassium-sparing diuretics.",
+    "Warfarin is a vitamin K antagonist.",
+    "Apply zinc oxide cream to the rash.",
+    "A calm environment helps; it is ironic.",
+    "Vitamin B12s",
+    "Take your vitamins as prescribed.",
+]
+
+
+@pytest.mark.parametrize("text, expected", MENTIONS)
+def test_mentions_are_found(text, expected):
+    assert NUTRIENT_MATCHER.find(text) == expected
+
+
+@pytest.mark.parametrize("text", NON_MENTIONS)
+def test_lookalikes_are_not_matched(text):
+    assert NUTRIENT_MATCHER.find(text) == []
+
+
+def test_excluded_phrase_only_hides_its_own_mention():
+    text = "Calcium channel blockers may be paired with calcium supplements."
+    assert NUTRIENT_MATCHER.find(text) == ["Calcium"]
+
+
+def stream(text, size):
+    scanner = NUTRIENT_MATCHER.scanner()
+    for i in range(0, len(text), size):
+        scanner.feed(text[i:i + size])
+    return scanner.finish()
+
+
+@pytest.mark.parametrize("size", [1, 7, 40, 700])
+def test_stream_matches_find(size):
+    text = " ".join(["Fatigue and thirst are common."] * 40 + [text for text, _ in MENTIONS] + NON_MENTIONS) * 3
+    assert stream(text, size) == NUTRIENT_MATCHER.find(text)
+
+
+@pytest.mark.parametrize("split", range(len("vitamin B12") + 1))
+def test_mention_split_across_chunks(split):
+    # Pad past the scan batch so the boundary falls inside a scan, not only in finish()
+    text = "Patients often report fatigue. " * 30 + "Low vitamin B12 and calcium channel blockers."
+    at = text.index("vitamin B12") + split
+    scanner = NUTRIENT_MATCHER.scanner()
+    scanner.feed(text[:at])
+    scanner.feed(text[at:] + " Rest well." * 80)
+    assert scanner.finish() == ["Vitamin B12"]
+
+
+def test_custom_knowledge():
+    matcher = NutrientMatcher({"Choline": {"aliases": ["choline"], "foods": ["Eggs"]}})
+    assert matcher.find("Choline and vitamin B12") == ["Choline"]
+    assert matcher.food_suggestions(["Choline"]) == [("Choline", ["Eggs"])]
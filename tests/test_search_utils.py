@@ -0,0 +1,77 @@
+import pytest
+
+from search_utils import DISEASE_INDEX, DiseaseIndex, canonical_disease_name, disease_suggestion, edit_distance
+
+# Related but different conditions: none may be answered as the other
+DISTINCT_PAIRS = [
+    ("hypotension", "Hypertension"),
+    ("low blood pressure", "Hypertension"),
+    ("low blood sugar", "Diabetes"),
+    ("ear infection", "Eye Infection"),
+    ("yeast infection", "Eye Infection"),
+    ("stomach cancer", "Peptic Ulcer"),
+    ("heart valve disease", "Coronary Artery Disease"),
+    ("cold sores", "Common Cold"),
+    ("hypothyroidism", "Thyroid"),
+    ("hyperthyroidism", "Thyroid"),
+    ("gerd", "Gastritis"),
+    ("dementia", "Alzheimer's Disease"),
+    ("type 1 diabetes", "Diabetes"),
+    ("osteoarthritis", "Arthritis"),
+    ("rheumatoid arthritis", "Arthritis"),
+    ("kidney failure", "Chronic Kidney Disease"),
+]
+
+TYPOS = [
+    ("diabetis", "Diabetes"),
+    ("hypertention", "Hypertension"),
+    ("pnuemonia", "Pneumonia"),
+    ("asthama", "Asthma"),
+    ("artheritis", "Arthritis"),
+    ("alzhiemers", "Alzheimer's Disease"),
+    ("tubercolosis", "Tuberculosis"),
+    ("maleria", "Malaria"),
+    ("migrane", "Migraine"),
+    ("hepatitus b", "Hepatitis B"),
+]
+
+
+@pytest.mark.parametrize("query, other", DISTINCT_PAIRS)
+def test_distinct_conditions_are_not_merged(query, other):
+    assert DISEASE_INDEX.canonical(query) != other
+    assert canonical_disease_name(query) != other
+
+
+@pytest.mark.parametrize("query, other", DISTINCT_PAIRS)
+def test_unknown_lookalikes_keep_the_query(query, other):
+    # Only `other` is known: the query is answered as typed, with `other` at most suggested
+    index = DiseaseIndex([(other, [])])
+    assert index.canonical(query) is None
+
+
+@pytest.mark.parametrize("query, expected", TYPOS)
+def test_near_exact_typos_are_corrected(query, expected):
+    assert DISEASE_INDEX.canonical(query) == expected
+    assert disease_suggestion(query) is None
+
+
+def test_lookalike_is_offered_as_suggestion():
+    index = DiseaseIndex([("Hypertension", ["high blood pressure"])])
+    assert index.canonical("hypotension") is None
+    assert index.did_you_mean("hypotension") == "Hypertension"
+
+
+def test_unrecognised_query_is_passed_through():
+    assert canonical_disease_name("  some   rare syndrome ") == "some rare syndrome"
+
+
+def test_short_queries_are_not_corrected():
+    index = DiseaseIndex([("Gout", [])])
+    assert index.canonical("gour") is None
+
+
+def test_edit_distance():
+    assert edit_distance("diabetis", "diabetes") == 1
+    assert edit_distance("pnuemonia", "pneumonia") == 1
+    assert edit_distance("hypotension", "hypertension") == 2
+    assert edit_distance("hypotension", "hypertension", limit=1) == 2